@@ -13,4 +13,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Needs the apps loaded by get_asgi_application().
+from core import sse  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """Serve the event stream directly, everything else through django"""
+    if scope['type'] == 'http' and scope['path'] == sse.PATH:
+        await sse.events_app(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -0,0 +1,64 @@
+"""
+Gunicorn configuration for production deployments.
+
+Run from the app directory with:
+
+    gunicorn -c app/gunicorn_conf.py app.wsgi
+
+The django app is imported once in the master process (preload_app) and the
+workers are forked from it, so the imported code and settings are shared
+copy-on-write instead of being loaded again by every worker. Every setting
+can be overridden with the environment variables read below.
+"""
+
+import gc
+import os
+
+
+def cpu_count():
+    """Number of CPUs this process may run on (respects container limits)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # Not available on every platform.
+        return os.cpu_count() or 1
+
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# Load the app before forking so workers share its memory.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+# The usual (2 x cores) + 1 processes, each with a few threads to cover the
+# time requests spend waiting on the database.
+workers = int(os.environ.get('GUNICORN_WORKERS', cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 2))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+# Recycle workers after a number of requests to bound memory growth. The
+# jitter stops all the workers from restarting at the same moment.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# The worker heartbeat file is touched constantly, keep it in memory.
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+accesslog = os.environ.get('GUNICORN_ACCESSLOG', '-')
+errorlog = '-'
+
+
+def pre_fork(server, worker):
+    """Runs in the master before every fork"""
+    # Don't let a connection opened while loading the app be inherited.
+    if preload_app:
+        from django.db import connections
+        connections.close_all()
+
+    # Move everything loaded so far out of the garbage collector's reach.
+    # Otherwise the first collection in a worker writes to every object
+    # header and un-shares the pages we just preloaded.
+    gc.freeze()
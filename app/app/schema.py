@@ -0,0 +1,99 @@
+"""
+Lazily loaded, cached OpenAPI schema views.
+
+drf_spectacular.views pulls in yaml and the whole schema machinery, which
+accounts for most of the time spent importing the url configuration, while
+/api/schema/ and /api/docs/ are rarely requested. The views are only
+imported on the first request to one of them. The generated schema is kept
+in memory, or loaded from SPECTACULAR_SCHEMA_FILE when it was generated at
+build time with:
+
+    python manage.py spectacular --format openapi-json --file schema.json
+"""
+
+import json
+import threading
+
+from django.conf import settings
+from django.utils import translation
+from django.views.decorators.csrf import csrf_exempt
+
+_schemas = {}
+_lock = threading.Lock()
+
+
+def _load_schema_file(path):
+    """Read a pre-generated schema, in json or yaml depending on the name"""
+    with open(path) as schema_file:
+        if path.endswith(('.yml', '.yaml')):
+            import yaml
+            return yaml.safe_load(schema_file)
+        return json.load(schema_file)
+
+
+def get_schema(generator, request, public):
+    """Return the schema, generating it at most once per language"""
+    # A non-public schema depends on the requesting user, never share it.
+    if not public:
+        return generator.get_schema(request=request, public=public)
+
+    language = translation.get_language()
+    schema = _schemas.get(language)
+    if schema is not None:
+        return schema
+
+    with _lock:
+        if language not in _schemas:
+            path = getattr(settings, 'SPECTACULAR_SCHEMA_FILE', None)
+            if path and language == settings.LANGUAGE_CODE:
+                _schemas[language] = _load_schema_file(path)
+            else:
+                _schemas[language] = generator.get_schema(
+                    request=request, public=public
+                )
+        return _schemas[language]
+
+
+def clear_schema_cache():
+    """Forget the generated schemas, they are rebuilt on the next request"""
+    _schemas.clear()
+
+
+def _schema_view():
+    from drf_spectacular.views import SpectacularAPIView
+    from rest_framework.response import Response
+
+    class CachedSpectacularAPIView(SpectacularAPIView):
+        """SpectacularAPIView that only generates the schema once"""
+
+        def _get_schema_response(self, request):
+            generator = self.generator_class(
+                urlconf=self.urlconf, api_version=self.api_version
+            )
+            return Response(get_schema(generator, request, self.serve_public))
+
+    return CachedSpectacularAPIView.as_view()
+
+
+def _swagger_view():
+    from drf_spectacular.views import SpectacularSwaggerView
+
+    return SpectacularSwaggerView.as_view(url_name='api-schema')
+
+
+def lazy_view(factory):
+    """Return a view that builds the real view with factory on first use"""
+    views = []
+
+    # The real views are DRF views which are csrf exempt as well.
+    @csrf_exempt
+    def view(request, *args, **kwargs):
+        if not views:
+            views.append(factory())
+        return views[0](request, *args, **kwargs)
+
+    return view
+
+
+schema_view = lazy_view(_schema_view)
+swagger_view = lazy_view(_swagger_view)
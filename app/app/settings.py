@@ -48,12 +48,15 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.SlowQueryLogMiddleware',
+    'core.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'app.urls'
@@ -90,6 +93,22 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/ref/settings/#caches
+# The throttle counters (core/throttling.py) live here, so every process
+# serving the API has to share it: with more than one worker set
+# CACHE_BACKEND=django.core.cache.backends.memcached.PyMemcacheCache and
+# CACHE_LOCATION=host:port. `manage.py check --deploy` fails otherwise.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -128,6 +147,22 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.2/howto/static-files/
 
 STATIC_URL = '/static/'
+MEDIA_URL = '/media/'
+
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', '/vol/web/media')
+STATIC_ROOT = os.environ.get('STATIC_ROOT', '/vol/web/static')
+
+# Always stream uploads to a temporary file on disk instead of keeping small
+# ones in memory. With the temporary directory on the same filesystem as
+# MEDIA_ROOT the file is then renamed into place instead of copied.
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+FILE_UPLOAD_TEMP_DIR = os.environ.get('FILE_UPLOAD_TEMP_DIR') or None
+
+# Recipe image variants, see recipe/images.py
+IMAGE_VARIANT_WIDTHS = (320, 640, 1280)
+IMAGE_VARIANT_QUALITY = 80
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
@@ -138,4 +173,136 @@ AUTH_USER_MODEL = 'core.user'
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
-}
\ No newline at end of file
+    # Rate limits per view throttle_scope, see core/throttling.py
+    'DEFAULT_THROTTLE_CLASSES': [
+        'core.throttling.ScopedThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'recipes': os.environ.get('THROTTLE_RECIPES', '600/min'),
+        'recipes_global': os.environ.get(
+            'THROTTLE_RECIPES_GLOBAL', '30000/min'
+        ),
+        'tags': os.environ.get('THROTTLE_TAGS', '300/min'),
+        'tags_global': os.environ.get('THROTTLE_TAGS_GLOBAL', '15000/min'),
+        'ingredients': os.environ.get('THROTTLE_INGREDIENTS', '300/min'),
+        'ingredients_global': os.environ.get(
+            'THROTTLE_INGREDIENTS_GLOBAL', '15000/min'
+        ),
+        'user': os.environ.get('THROTTLE_USER', '60/min'),
+        'user_global': os.environ.get('THROTTLE_USER_GLOBAL', '3000/min'),
+        # Per client IP, this endpoint checks passwords.
+        'token': os.environ.get('THROTTLE_TOKEN', '30/min'),
+        'token_global': os.environ.get('THROTTLE_TOKEN_GLOBAL', '3000/min'),
+        # Each sub-request of a batch is throttled by its own view as well.
+        'batch': os.environ.get('THROTTLE_BATCH', '120/min'),
+    },
+    # Reverse proxies in front of the app that append to X-Forwarded-For.
+    # With 0 the throttles key anonymous clients on REMOTE_ADDR, a client
+    # sent X-Forwarded-For is never trusted.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
+}
+
+# Background tasks, see core/tasks.py
+
+TASK_QUEUE_BACKEND = os.environ.get(
+    'TASK_QUEUE_BACKEND', 'core.tasks.DatabaseBackend'
+)
+# Seconds a worker may run a task before another worker takes it over,
+# keep it above the longest task.
+TASK_VISIBILITY_TIMEOUT = int(os.environ.get('TASK_VISIBILITY_TIMEOUT', 3600))
+
+# Rows deleted per statement when an account is deleted, see core/deletion.py
+
+ACCOUNT_DELETION_BATCH_SIZE = 1000
+
+# Seconds the readiness endpoint reuses its database probe result
+
+READINESS_CACHE_SECONDS = int(os.environ.get('READINESS_CACHE_SECONDS', 5))
+
+# OpenAPI schema generated at build time, served instead of generating it
+# on the first request. See app/schema.py
+
+SPECTACULAR_SCHEMA_FILE = os.environ.get('SPECTACULAR_SCHEMA_FILE') or None
+
+# Response compression
+# Opt-in, see core.middleware.CompressionMiddleware
+
+COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', '') == '1'
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6))
+COMPRESSION_BROTLI_QUALITY = int(
+    os.environ.get('COMPRESSION_BROTLI_QUALITY', 4)
+)
+# Responses carrying secrets are left alone to avoid BREACH style attacks.
+COMPRESSION_EXEMPT_PATHS = ['/api/user/token/']
+
+# Seconds a response is kept for replay under its Idempotency-Key,
+# see core/idempotency.py
+
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+# How long a request holds its key before a retry may run it again.
+IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get('IDEMPOTENCY_LOCK_SECONDS', 60))
+
+# Batched API requests, see core/batch.py
+
+BATCH_MAX_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS', 20))
+# Threads running the read sub-requests of one batch
+BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', 4))
+# Streamed sub-responses are read into the batch response up to this size
+BATCH_MAX_STREAMED_BYTES = int(
+    os.environ.get('BATCH_MAX_STREAMED_BYTES', 5 * 1024 * 1024)
+)
+
+# Serve recipes from their denormalized snapshot column, see
+# recipe/snapshots.py. Run `manage.py snapshots rebuild` when turning it on.
+
+RECIPE_SNAPSHOTS_ENABLED = os.environ.get('RECIPE_SNAPSHOTS_ENABLED', '') == '1'
+
+# Change notifications streamed from /api/events/, see core/events.py
+# LocalBroker only sees the writes of the process holding the stream, use
+# core.events.PostgresBroker as soon as more than one process runs (several
+# web workers, or the task worker).
+
+EVENTS_BACKEND = os.environ.get('EVENTS_BACKEND', 'core.events.LocalBroker')
+EVENTS_HEARTBEAT_SECONDS = int(os.environ.get('EVENTS_HEARTBEAT_SECONDS', 15))
+# Messages buffered per stream before the client is told to resync
+EVENTS_QUEUE_SIZE = 100
+# Seconds a ticket from /api/events/ticket/ can be used to open a stream
+EVENTS_TICKET_SECONDS = 30
+
+# Memory the recipe similarity indexes kept in each process may use, by
+# their estimated size, see recipe/similarity.py
+
+SIMILARITY_CACHE_BYTES = int(
+    os.environ.get('SIMILARITY_CACHE_BYTES', 256 * 1024 * 1024)
+)
+
+# Seconds a recipe share token can be used to copy the recipes, see
+# recipe/clone.py
+
+CLONE_SHARE_MAX_AGE = int(os.environ.get('CLONE_SHARE_MAX_AGE', 7 * 24 * 3600))
+
+# Sampled log of slow queries with their postgres query plans, see
+# core/querylog.py
+
+SLOW_QUERY_LOG_ENABLED = os.environ.get('SLOW_QUERY_LOG_ENABLED', '') == '1'
+SLOW_QUERY_LOG_SAMPLE_RATE = float(
+    os.environ.get('SLOW_QUERY_LOG_SAMPLE_RATE', 0.1)
+)
+SLOW_QUERY_LOG_THRESHOLD_MS = int(
+    os.environ.get('SLOW_QUERY_LOG_THRESHOLD_MS', 100)
+)
+SLOW_QUERY_LOG_MAX_EXPLAINS = 5
+SLOW_QUERY_LOG_SIZE = 200
+
+# Profile single requests of staff users on demand, see
+# core.middleware.ProfilingMiddleware
+
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '') == '1'
+# Functions listed in the text output
+PROFILING_LIMIT = 80
+
+# Unfiltered admin changelists of tables with at least this many rows show
+# the postgres row estimate instead of counting, see core/admin.py
+
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 10000
@@ -0,0 +1,56 @@
+"""Tests for the lazily loaded schema views"""
+
+import json
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from app import schema
+
+SCHEMA_URL = reverse('api-schema')
+
+
+class SchemaViewTests(TestCase):
+    """Test the cached schema views"""
+
+    def setUp(self):
+        schema.clear_schema_cache()
+        self.addCleanup(schema.clear_schema_cache)
+
+    def test_schema_generated_once(self):
+        """The schema is generated on the first request only"""
+        from drf_spectacular.generators import SchemaGenerator
+
+        with patch.object(
+            SchemaGenerator, 'get_schema', autospec=True,
+            side_effect=SchemaGenerator.get_schema,
+        ) as get_schema:
+            first = self.client.get(SCHEMA_URL, {'format': 'json'})
+            second = self.client.get(SCHEMA_URL, {'format': 'json'})
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(get_schema.call_count, 1)
+        self.assertIn('/api/recipe/recipes/', first.json()['paths'])
+
+    def test_schema_file(self):
+        """A schema generated at build time is served as is"""
+        with tempfile.NamedTemporaryFile(
+            'w', suffix='.json', delete=False
+        ) as schema_file:
+            json.dump({'openapi': '3.0.3', 'paths': {}}, schema_file)
+        self.addCleanup(os.remove, schema_file.name)
+
+        with override_settings(SPECTACULAR_SCHEMA_FILE=schema_file.name):
+            res = self.client.get(SCHEMA_URL, {'format': 'json'})
+
+        self.assertEqual(res.json(), {'openapi': '3.0.3', 'paths': {}})
+
+    def test_docs_page(self):
+        """The swagger page is served"""
+        res = self.client.get(reverse('api_docs'))
+
+        self.assertEqual(res.status_code, 200)
@@ -13,23 +13,40 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include  # need to add include for organ
-from drf_spectacular.views import (
-    SpectacularAPIView,
-    SpectacularSwaggerView,
-)
+
+from app import schema  # drf_spectacular is imported on first use
+from core import views as core_views
+from core.batch import BatchView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     # Creates the Schema
-    path('api/schema/', SpectacularAPIView.as_view(), name='api-schema'),
+    path('api/schema/', schema.schema_view, name='api-schema'),
     # leverages the schema
+    path('api/docs/', schema.swagger_view, name='api_docs'),
+    path('api/health/ready/', core_views.readiness, name='readiness'),
+    path('api/batch/', BatchView.as_view(), name='batch'),
+    path(
+        'api/events/ticket/',
+        core_views.EventTicketView.as_view(),
+        name='events-ticket',
+    ),
     path(
-        'api/docs/',
-         SpectacularSwaggerView.as_view(url_name = 'api-schema'),
-         name = 'api_docs',
-         ),
+        'api/debug/slow-queries/',
+        core_views.SlowQueryLogView.as_view(),
+        name='slow-queries',
+    ),
     path('api/user/', include('user.urls')),
     path('api/recipe/', include('recipe.urls'))
 ]
+
+# Serve the uploaded media in development, a proxy does it in production.
+if settings.DEBUG:
+    urlpatterns += static(
+        settings.MEDIA_URL,
+        document_root=settings.MEDIA_ROOT,
+    )
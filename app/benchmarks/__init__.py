@@ -0,0 +1,4 @@
+"""
+Standalone benchmark scripts.
+Run them from the app directory, e.g. python -m benchmarks.compression
+"""
@@ -0,0 +1,80 @@
+"""
+Benchmark the CPU cost against the bytes saved when compressing a
+recipe list response at different gzip levels and brotli qualities.
+
+Usage: python -m benchmarks.compression [--recipes 20000] [--repeat 5]
+"""
+
+import argparse
+import json
+import random
+import time
+
+from core.middleware import BrotliCompressor, GzipCompressor, brotli
+
+
+def sample_payload(count):
+    """Build a JSON body shaped like the recipe list endpoint output"""
+    words = ['chicken', 'tomato', 'basil', 'garlic', 'rice', 'lemon',
+             'pasta', 'onion', 'pepper', 'cheese', 'beans', 'curry']
+    recipes = []
+    for recipe_id in range(count, 0, -1):
+        recipes.append({
+            'id': recipe_id,
+            'title': ' '.join(random.sample(words, 3)),
+            'time_minutes': random.randint(5, 120),
+            'price': '%d.%02d' % (
+                random.randint(1, 99), random.randint(0, 99)
+            ),
+            'tags': [
+                {'id': random.randint(1, 500), 'name': random.choice(words)}
+                for _ in range(random.randint(0, 4))
+            ],
+            'ingredients': [
+                {'id': random.randint(1, 5000), 'name': random.choice(words)}
+                for _ in range(random.randint(1, 10))
+            ],
+        })
+    return json.dumps(recipes).encode()
+
+
+def measure(name, make_compressor, payload, repeat):
+    """Compress the payload `repeat` times and print the best timing"""
+    best = None
+    for _ in range(repeat):
+        compressor = make_compressor()
+        start = time.perf_counter()
+        size = len(compressor.compress(payload) + compressor.finish())
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    saved = 1 - size / len(payload)
+    throughput = len(payload) / best / 1024 / 1024
+    print('%-12s %10d bytes  %5.1f%% saved  %8.2f ms  %7.1f MB/s' % (
+        name, size, saved * 100, best * 1000, throughput))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--recipes', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(42)
+    payload = sample_payload(args.recipes)
+    print('payload: %d recipes, %d bytes' % (args.recipes, len(payload)))
+
+    for level in (1, 4, 6, 9):
+        measure('gzip-%d' % level, lambda: GzipCompressor(level),
+                payload, args.repeat)
+
+    if brotli is None:
+        print('brotli not installed, skipping')
+        return
+    for quality in (1, 4, 6, 11):
+        measure('br-%d' % quality, lambda: BrotliCompressor(quality),
+                payload, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
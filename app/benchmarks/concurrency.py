@@ -0,0 +1,120 @@
+"""
+Hold many concurrent keep-alive connections against a running server and
+report throughput and latency, to compare the WSGI deployment with the
+async endpoints under an ASGI server.
+
+Start the server under test first, e.g.
+
+    gunicorn -c app/gunicorn_conf.py app.wsgi
+    uvicorn app.asgi:application --workers 4
+
+then run, with a token for a user that has some recipes:
+
+    python -m benchmarks.concurrency --token KEY \\
+        --path /api/recipe/recipes/ --connections 1000
+    python -m benchmarks.concurrency --token KEY \\
+        --path /api/recipe/async/recipes/ --connections 1000
+
+Only the standard library is used, so it runs anywhere.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+
+async def worker(args, deadline, latencies, errors):
+    """Send requests on one connection until the deadline"""
+    try:
+        reader, writer = await asyncio.open_connection(args.host, args.port)
+    except OSError:
+        errors.append('connect')
+        return
+
+    request = (
+        'GET %s HTTP/1.1\r\n'
+        'Host: %s\r\n'
+        'Authorization: Token %s\r\n'
+        'Connection: keep-alive\r\n\r\n'
+    ) % (args.path, args.host, args.token)
+
+    try:
+        while time.monotonic() < deadline:
+            start = time.monotonic()
+            writer.write(request.encode())
+            await writer.drain()
+
+            status_line = await reader.readline()
+            if not status_line:
+                errors.append('closed')
+                return
+            length = None
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.lower() == 'content-length':
+                    length = int(value)
+            if length is None:
+                # No keep-alive without a length, read to the end.
+                await reader.read()
+                writer.close()
+                latencies.append(time.monotonic() - start)
+                reader, writer = await asyncio.open_connection(
+                    args.host, args.port
+                )
+                continue
+            await reader.readexactly(length)
+
+            if b' 200 ' not in status_line:
+                errors.append(status_line.decode().strip())
+            latencies.append(time.monotonic() - start)
+    except (OSError, asyncio.IncompleteReadError) as exc:
+        errors.append(type(exc).__name__)
+    finally:
+        writer.close()
+
+
+async def run(args):
+    deadline = time.monotonic() + args.duration
+    latencies = []
+    errors = []
+    await asyncio.gather(*(
+        worker(args, deadline, latencies, errors)
+        for _ in range(args.connections)
+    ))
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--path', default='/api/recipe/async/recipes/')
+    parser.add_argument('--token', required=True)
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=30)
+    args = parser.parse_args()
+
+    latencies, errors = asyncio.run(run(args))
+
+    print('%s with %d connections for %ss' % (
+        args.path, args.connections, args.duration))
+    print('requests: %d  errors: %d  throughput: %.1f req/s' % (
+        len(latencies), len(errors), len(latencies) / args.duration))
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=100)
+        print('latency ms  p50 %.1f  p90 %.1f  p99 %.1f  max %.1f' % (
+            cuts[49] * 1000, cuts[89] * 1000, cuts[98] * 1000,
+            max(latencies) * 1000))
+    if errors:
+        print('first errors: %s' % ', '.join(sorted(set(errors))[:5]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Compare the grouped "what can I cook" query with loading every recipe and
+its ingredients and checking them in Python:
+
+    python -m benchmarks.cookable --recipes 20000
+
+Runs against a throwaway test database made from the configured settings
+(like manage.py test), so point DJANGO_SETTINGS_MODULE at the database
+engine you want numbers for.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.db import connection  # noqa: E402
+
+from core.models import Recipe, Ingredient  # noqa: E402
+from recipe.cookable import cookable_recipes  # noqa: E402
+
+
+def populate(args):
+    rng = random.Random(args.seed)
+    user = get_user_model().objects.create_user(
+        email='bench@example.com', password='bench'
+    )
+    Ingredient.objects.bulk_create(
+        Ingredient(user=user, name=f'ingredient {i}',
+                   normalized_name=f'ingredient {i}')
+        for i in range(args.vocabulary)
+    )
+    ingredient_ids = list(
+        Ingredient.objects.filter(user=user).values_list('id', flat=True)
+    )
+    Recipe.objects.bulk_create(
+        Recipe(user=user, title=f'recipe {i}', time_minutes=10, price=1)
+        for i in range(args.recipes)
+    )
+    weights = [1 / (rank + 1) for rank in range(len(ingredient_ids))]
+    through = Recipe.ingredients.through
+    links = []
+    for recipe_id in Recipe.objects.filter(user=user) \
+            .values_list('id', flat=True):
+        for ingredient_id in set(rng.choices(
+            ingredient_ids, weights=weights, k=args.per_recipe
+        )):
+            links.append(
+                through(recipe_id=recipe_id, ingredient_id=ingredient_id)
+            )
+    through.objects.bulk_create(links, batch_size=5000)
+    return user, ingredient_ids, rng
+
+
+def naive(user, pantry, max_missing):
+    """Load everything and compare sets in Python"""
+    pantry = set(pantry)
+    results = []
+    for recipe in Recipe.objects.filter(user=user) \
+            .prefetch_related('ingredients'):
+        ingredients = {i.id for i in recipe.ingredients.all()}
+        matched = len(ingredients & pantry)
+        missing = len(ingredients) - matched
+        if matched and missing <= max_missing:
+            results.append((missing, -matched, -recipe.id))
+    results.sort()
+    return [-recipe_id for _, _, recipe_id in results]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--recipes', type=int, default=20000)
+    parser.add_argument('--vocabulary', type=int, default=1000)
+    parser.add_argument('--per-recipe', type=int, default=8)
+    parser.add_argument('--pantry', type=int, default=150)
+    parser.add_argument('--max-missing', type=int, default=2)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        user, ingredient_ids, rng = populate(args)
+        print('%s, %d recipes' % (connection.vendor, args.recipes))
+        query, python = [], []
+        for _ in range(args.runs):
+            # The popular ingredients are in most pantries.
+            pantry = ingredient_ids[:args.pantry // 2] + rng.sample(
+                ingredient_ids, args.pantry // 2
+            )
+            seconds, fast = timed(lambda: list(
+                cookable_recipes(user, pantry, args.max_missing)
+                .values_list('id', flat=True)
+            ))
+            query.append(seconds)
+            seconds, slow = timed(naive, user, pantry, args.max_missing)
+            python.append(seconds)
+            assert fast == slow
+
+        print('%d matches on the last run' % len(fast))
+        for name, times in (('grouped query', query), ('naive', python)):
+            print('%-14s median %8.1fms' % (
+                name, statistics.median(times) * 1000
+            ))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
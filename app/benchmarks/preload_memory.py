@@ -0,0 +1,88 @@
+"""
+Start gunicorn with and without preload_app and compare the memory every
+worker really costs, to show the copy-on-write savings of preloading.
+
+Usage (linux only, needs /proc and gunicorn installed):
+
+    python -m benchmarks.preload_memory [--workers 4] [--settle 5]
+
+For each worker it reports the RSS, the PSS (shared pages divided between
+the processes using them) and the USS (pages only that worker uses).
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+FIELDS = ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty')
+
+
+def read_memory(pid):
+    """Return the smaps_rollup totals of a process in kB"""
+    totals = {}
+    with open('/proc/%d/smaps_rollup' % pid) as rollup:
+        for line in rollup:
+            name, _, value = line.partition(':')
+            if name in FIELDS:
+                totals[name] = int(value.split()[0])
+    totals['Uss'] = totals['Private_Clean'] + totals['Private_Dirty']
+    return totals
+
+
+def children(pid):
+    """Pids of the direct children of a process"""
+    path = '/proc/%d/task/%d/children' % (pid, pid)
+    with open(path) as listing:
+        return [int(child) for child in listing.read().split()]
+
+
+def measure(preload, args):
+    env = dict(os.environ, GUNICORN_PRELOAD='1' if preload else '0',
+               GUNICORN_WORKERS=str(args.workers),
+               GUNICORN_BIND='127.0.0.1:%d' % args.port,
+               GUNICORN_ACCESSLOG='/dev/null')
+    start = time.monotonic()
+    master = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'app/gunicorn_conf.py',
+         'app.wsgi'],
+        env=env,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        # Wait for all workers to be forked and finish loading.
+        while len(children(master.pid)) < args.workers:
+            time.sleep(0.1)
+        booted = time.monotonic() - start
+        time.sleep(args.settle)
+
+        workers = [read_memory(pid) for pid in children(master.pid)]
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait()
+
+    print('preload_app=%s  workers forked after %.2fs' % (preload, booted))
+    for name in ('Rss', 'Pss', 'Uss'):
+        values = [worker[name] for worker in workers]
+        print('  %s per worker: avg %7.1f MB  total %7.1f MB' % (
+            name, sum(values) / len(values) / 1024, sum(values) / 1024))
+    return sum(worker['Pss'] for worker in workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--settle', type=float, default=5)
+    args = parser.parse_args()
+
+    without = measure(False, args)
+    with_preload = measure(True, args)
+    print('preloading saves %.1f MB of PSS across %d workers' % (
+        (without - with_preload) / 1024, args.workers))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Compare the bitset index behind the similar recipes action with scoring
+every recipe of the user, on synthetic data:
+
+    python -m benchmarks.similarity --recipes 100000
+
+Ingredient and tag popularity follows a Zipf like curve, like real
+recipes where salt and onions are everywhere. No database is needed.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+django.setup()
+
+from recipe.similarity import SimilarityIndex  # noqa: E402
+
+
+def synthetic_pairs(args):
+    rng = random.Random(args.seed)
+    ingredient_weights = [
+        1 / (rank + 1) for rank in range(args.ingredient_vocabulary)
+    ]
+    tag_weights = [1 / (rank + 1) for rank in range(args.tag_vocabulary)]
+    ingredient_pairs = []
+    tag_pairs = []
+    for recipe_id in range(1, args.recipes + 1):
+        for ingredient_id in set(rng.choices(
+            range(1, args.ingredient_vocabulary + 1),
+            weights=ingredient_weights,
+            k=args.ingredients_per_recipe,
+        )):
+            ingredient_pairs.append((recipe_id, ingredient_id))
+        for tag_id in set(rng.choices(
+            range(1, args.tag_vocabulary + 1),
+            weights=tag_weights,
+            k=args.tags_per_recipe,
+        )):
+            tag_pairs.append((recipe_id, tag_id))
+    return tag_pairs, ingredient_pairs
+
+
+def naive_similar(features, recipe_id, limit):
+    """Score every other recipe, what the action would do without an index"""
+    target = set(features[recipe_id])
+    scores = []
+    for other, other_features in features.items():
+        if other == recipe_id:
+            continue
+        shared = len(target.intersection(other_features))
+        if shared:
+            scores.append((
+                shared / (len(target) + len(other_features) - shared), other
+            ))
+    scores.sort(reverse=True)
+    return scores[:limit]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--recipes', type=int, default=100000)
+    parser.add_argument('--ingredient-vocabulary', type=int, default=2000)
+    parser.add_argument('--tag-vocabulary', type=int, default=200)
+    parser.add_argument('--ingredients-per-recipe', type=int, default=10)
+    parser.add_argument('--tags-per-recipe', type=int, default=3)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    tag_pairs, ingredient_pairs = synthetic_pairs(args)
+    build, index = timed(
+        SimilarityIndex.from_pairs, tag_pairs, ingredient_pairs
+    )
+    print('%d recipes, %d links, index built in %.2fs, about %.1f MB' % (
+        len(index.features), len(tag_pairs) + len(ingredient_pairs), build,
+        index.nbytes() / 1e6,
+    ))
+    print('%d features as bitsets, %d as posting lists' % (
+        len(index.bits), len(index.postings)
+    ))
+
+    rng = random.Random(args.seed)
+    targets = rng.sample(sorted(index.features), args.queries)
+    indexed, naive = [], []
+    for recipe_id in targets:
+        seconds, fast = timed(index.similar, recipe_id, 10)
+        indexed.append(seconds)
+        seconds, slow = timed(naive_similar, index.features, recipe_id, 10)
+        naive.append(seconds)
+        assert [s for s, _ in fast] == [s for s, _ in slow]
+
+    for name, times in (('bitset index', indexed), ('naive scan', naive)):
+        print('%-15s median %7.2fms  max %7.2fms' % (
+            name, statistics.median(times) * 1000, max(times) * 1000
+        ))
+
+    seconds, _ = timed(index.replace, {targets[0]: {1, 2, 3}})
+    print('incremental update of one recipe: %.3fms' % (seconds * 1000))
+
+
+if __name__ == '__main__':
+    main()
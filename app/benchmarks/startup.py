@@ -0,0 +1,72 @@
+"""
+Profile what a worker imports before it can serve its first request:
+app.wsgi (settings and app registry) plus the root url configuration.
+
+Usage: python -m benchmarks.startup [--top 20] [--runs 5]
+
+Each run is a fresh interpreter using python -X importtime. The total is
+the median over the runs and the table lists the slowest top level
+packages of the last run by cumulative import time.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+CODE = 'import app.wsgi, app.urls'
+
+
+def import_times():
+    """Return {module: (self_us, cumulative_us, depth)} for one fresh run"""
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='app.settings')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CODE],
+        env=env,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        times[name.strip()] = (int(self_us), int(cumulative), depth)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    totals = []
+    for _ in range(args.runs):
+        times = import_times()
+        # Top level entries (depth 0) add up to the whole import.
+        totals.append(sum(
+            cumulative for _, cumulative, depth in times.values()
+            if depth == 0
+        ))
+
+    print('%s: median %.1f ms over %d runs' % (
+        CODE, statistics.median(totals) / 1000, args.runs))
+
+    packages = {}
+    for name, (_, cumulative, _) in times.items():
+        root = name.split('.')[0]
+        packages[root] = max(packages.get(root, 0), cumulative)
+    print('%-30s %12s' % ('package', 'cumulative'))
+    ranked = sorted(packages.items(), key=lambda item: -item[1])
+    for name, cumulative in ranked[:args.top]:
+        print('%-30s %9.1f ms' % (name, cumulative / 1000))
+    if 'drf_spectacular' in times or 'drf_spectacular.views' in times:
+        print('warning: drf_spectacular is imported at startup')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,104 @@
 """Django admin customization"""
 
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 
+from core import exports
 from core import models
 
+
+def estimated_count(queryset):
+    """The planner's row estimate for an unfiltered queryset on postgres,
+    None when there is none to use"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql' or queryset.query.where:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [connection.ops.quote_name(queryset.model._meta.db_table)],
+        )
+        row = cursor.fetchone()
+    # -1 until the table was first analyzed.
+    return row[0] if row and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Counts the unfiltered changelist of a big table from the statistics
+    postgres keeps, a COUNT(*) reads the whole table. Small tables and
+    searches are still counted exactly."""
+
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list)
+        threshold = getattr(settings, 'ADMIN_ESTIMATED_COUNT_THRESHOLD', 10000)
+        if estimate is not None and estimate >= threshold:
+            return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist settings for tables with millions of rows.
+
+    No exact total next to the filtered count, related rows picked by id
+    instead of a select listing all of them, and searches are an id or a
+    case sensitive prefix of `prefix_search_field` so they can use its
+    varchar_pattern_ops index (the *_like one postgres gets for unique
+    and indexed char fields, or one declared on the model). The selected
+    or filtered rows can be exported as CSV, `export_fields` are the
+    columns.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    prefix_search_field = None
+    actions = ['export_csv']
+    export_fields = ['id']
+
+    @admin.action(
+        description=_('Export selected %(verbose_name_plural)s as CSV'),
+        permissions=['view'],
+    )
+    def export_csv(self, request, queryset):
+        filename = '%s-%s.csv' % (
+            self.model._meta.model_name,
+            timezone.now().strftime('%Y%m%d-%H%M%S'),
+        )
+        return exports.csv_response(
+            queryset.order_by('pk'), self.export_fields, filename
+        )
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        if search_term.isdigit():
+            return queryset.filter(pk=int(search_term)), False
+        return queryset.filter(**{
+            f'{self.prefix_search_field}__startswith':
+                self.search_prefix(search_term)
+        }), False
+
+    def search_prefix(self, search_term):
+        return search_term
+
 # This is a custom user admin class that is going to display
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(LargeTableAdmin, BaseUserAdmin):
     """Define the admine pages for users"""
 
     # Configure how the page is displayed
     ordering = ['id']
     list_display = ['email', 'name']
+    search_fields = ['email']
+    prefix_search_field = 'email'
+    # Never the password hash.
+    export_fields = ['id', 'email', 'name', 'is_active', 'is_staff',
+                     'is_superuser', 'last_login']
     fieldsets = (
         (None,{'fields': ('email', 'password')}),
         (
@@ -45,10 +131,36 @@ class UserAdmin(BaseUserAdmin):
         }),
     )
 
+
+class RecipeAdmin(LargeTableAdmin):
+    list_display = ['id', 'title', 'user', 'time_minutes', 'price']
+    list_display_links = ['id', 'title']
+    list_select_related = ['user']
+    raw_id_fields = ['user', 'tags', 'ingredients']
+    search_fields = ['title']
+    prefix_search_field = 'title'
+    export_fields = ['id', 'user_id', 'user__email', 'title', 'time_minutes',
+                     'price', 'link', 'description']
+
+
+class NameAdmin(LargeTableAdmin):
+    """Admin of the per user tags and ingredients"""
+    list_display = ['id', 'name', 'user']
+    list_display_links = ['id', 'name']
+    list_select_related = ['user']
+    raw_id_fields = ['user']
+    search_fields = ['name']
+    prefix_search_field = 'normalized_name'
+    export_fields = ['id', 'user_id', 'user__email', 'name']
+
+    def search_prefix(self, search_term):
+        return models.normalize_name(search_term)
+
+
 admin.site.register(models.User, UserAdmin)
 
-admin.site.register(models.Recipe)
+admin.site.register(models.Recipe, RecipeAdmin)
 
-admin.site.register(models.Tag)
+admin.site.register(models.Tag, NameAdmin)
 
-admin.site.register(models.Ingredient)
\ No newline at end of file
+admin.site.register(models.Ingredient, NameAdmin)
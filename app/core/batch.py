@@ -0,0 +1,293 @@
+"""
+Several API calls in one HTTP request.
+
+POST /api/batch/ with
+
+    {"requests": [{"method": "GET", "path": "/api/recipe/tags/"}, ...]}
+
+runs each sub-request against the API views in process and returns their
+responses in the same order. Sub-requests carry the batch's Authorization
+header and are authenticated, permission checked and throttled by their
+own view as a direct call would be. Clients may only set the headers in
+ALLOWED_HEADERS on them. Consecutive GET/HEAD sub-requests run in parallel
+on a few threads kept for the whole batch, each with its own database
+connection. Writes run one at a time in the order given.
+
+Streaming responses (the recipe list when RECIPE_SNAPSHOTS_ENABLED) are
+read into the result up to BATCH_MAX_STREAMED_BYTES. Async views can't be
+batched, they get a 400 entry.
+"""
+
+import asyncio
+import json
+import logging
+import queue
+import threading
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connection, connections
+from django.urls import Resolver404, resolve
+
+from rest_framework import permissions, serializers
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD')
+METHODS = SAFE_METHODS + ('POST', 'PUT', 'PATCH', 'DELETE')
+# Request META copied from the batch request to every sub-request.
+INHERITED_META = (
+    'SERVER_NAME', 'SERVER_PORT', 'REMOTE_ADDR', 'SERVER_PROTOCOL',
+    'HTTP_HOST', 'HTTP_USER_AGENT', 'HTTP_ACCEPT_LANGUAGE',
+    'HTTP_X_FORWARDED_FOR', 'HTTP_X_FORWARDED_PROTO', 'HTTP_AUTHORIZATION',
+    'wsgi.url_scheme', 'wsgi.errors', 'wsgi.version', 'wsgi.multithread',
+    'wsgi.multiprocess', 'wsgi.run_once',
+)
+# Headers a client may set on a sub-request, in lower case. Anything that
+# identifies the client (Authorization, X-Forwarded-*) comes from the batch.
+ALLOWED_HEADERS = (
+    'accept', 'accept-language', 'idempotency-key', 'if-match',
+    'if-none-match', 'if-modified-since', 'if-unmodified-since',
+)
+
+
+def _max_requests():
+    return getattr(settings, 'BATCH_MAX_REQUESTS', 20)
+
+
+def _max_streamed_bytes():
+    return getattr(settings, 'BATCH_MAX_STREAMED_BYTES', 5 * 1024 * 1024)
+
+
+class SubRequestSerializer(serializers.Serializer):
+    method = serializers.ChoiceField(choices=METHODS, default='GET')
+    path = serializers.CharField(max_length=2000)
+    headers = serializers.DictField(
+        child=serializers.CharField(), required=False, default=dict
+    )
+    body = serializers.JSONField(required=False, default=None)
+
+    def validate_headers(self, value):
+        refused = sorted(
+            name for name in value if name.lower() not in ALLOWED_HEADERS
+        )
+        if refused:
+            raise serializers.ValidationError(
+                'These headers can not be set: ' + ', '.join(refused) + '.'
+            )
+        return value
+
+    def validate_path(self, value):
+        parts = urlsplit(value)
+        if parts.scheme or parts.netloc or not parts.path.startswith('/api/'):
+            raise serializers.ValidationError(
+                'Only paths under /api/ can be batched.'
+            )
+        if parts.path.rstrip('/') == '/api/batch':
+            raise serializers.ValidationError('Batches cannot be nested.')
+        return value
+
+
+class BatchSerializer(serializers.Serializer):
+    requests = SubRequestSerializer(many=True)
+
+    def validate_requests(self, value):
+        if not value:
+            raise serializers.ValidationError('No requests given.')
+        if len(value) > _max_requests():
+            raise serializers.ValidationError(
+                f'At most {_max_requests()} requests per batch.'
+            )
+        return value
+
+
+def build_request(parent, method, path, headers=None, body=None):
+    """Make a WSGIRequest for a sub-request of `parent`"""
+    parts = urlsplit(path)
+    content = b'' if body is None else json.dumps(body).encode()
+    environ = {
+        key: parent.META[key] for key in INHERITED_META if key in parent.META
+    }
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': parts.path,
+        'SCRIPT_NAME': '',
+        'QUERY_STRING': parts.query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(content)),
+        'wsgi.input': BytesIO(content),
+    })
+    for name, value in (headers or {}).items():
+        environ['HTTP_' + name.upper().replace('-', '_')] = value
+
+    return WSGIRequest(environ)
+
+
+def _error(status, detail):
+    return {'status': status, 'headers': {}, 'body': {'detail': detail}}
+
+
+def run_one(request):
+    """Dispatch a sub-request to its view, return the result entry"""
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return _error(404, 'Not found.')
+    if asyncio.iscoroutinefunction(match.func):
+        return _error(400, 'Async endpoints can not be batched.')
+
+    try:
+        response = match.func(request, *match.args, **match.kwargs)
+        if response.streaming:
+            content = _read_stream(response)
+            if content is None:
+                return _error(
+                    400, 'The response is too large to be batched.'
+                )
+        else:
+            if hasattr(response, 'render'):
+                response.render()
+            content = response.content
+    except Exception:
+        logger.exception('Batched %s %s failed', request.method, request.path)
+        return _error(500, 'Internal server error.')
+
+    body = None
+    if content:
+        if response.get('Content-Type', '').startswith('application/json'):
+            body = json.loads(content)
+        else:
+            body = content.decode(response.charset, 'replace')
+    return {
+        'status': response.status_code,
+        'headers': {
+            name: value for name, value in response.items()
+            if name not in ('Content-Type', 'Content-Length')
+        },
+        'body': body,
+    }
+
+
+def _read_stream(response):
+    """Join a streaming response's content, None if it goes over
+    BATCH_MAX_STREAMED_BYTES"""
+    limit = _max_streamed_bytes()
+    chunks = []
+    size = 0
+    try:
+        for chunk in response.streaming_content:
+            size += len(chunk)
+            if size > limit:
+                return None
+            chunks.append(chunk)
+    finally:
+        response.close()
+    return b''.join(chunks)
+
+
+class ReadPool:
+    """Threads running the read sub-requests of one batch.
+
+    Threads are started as the reads need them, up to `size`. Each keeps
+    its database connection from one sub-request to the next and closes
+    it when the pool is closed at the end of the batch.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.jobs = queue.Queue()
+        self.threads = []
+
+    def map(self, requests):
+        """Run the sub-requests and wait for their results"""
+        results = [None] * len(requests)
+        for index, request in enumerate(requests):
+            self.jobs.put((results, index, request))
+        while len(self.threads) < min(self.size, len(requests)):
+            thread = threading.Thread(target=self._work, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        self.jobs.join()
+        return results
+
+    def close(self):
+        for _ in self.threads:
+            self.jobs.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def _work(self):
+        try:
+            while True:
+                job = self.jobs.get()
+                if job is None:
+                    return
+                results, index, request = job
+                try:
+                    results[index] = run_one(request)
+                except Exception:
+                    logger.exception(
+                        'Batched %s %s failed', request.method, request.path
+                    )
+                    results[index] = _error(500, 'Internal server error.')
+                finally:
+                    self.jobs.task_done()
+        finally:
+            connections.close_all()
+
+
+def run_batch(requests):
+    """Run the sub-requests, returning their results in order"""
+    results = [None] * len(requests)
+    # Threads can't see the uncommitted rows of a surrounding transaction
+    # (ATOMIC_REQUESTS, tests), so run everything in this thread then.
+    parallel = not connection.in_atomic_block
+    pool = ReadPool(getattr(settings, 'BATCH_MAX_WORKERS', 4))
+
+    try:
+        i = 0
+        while i < len(requests):
+            if requests[i].method not in SAFE_METHODS or not parallel:
+                results[i] = run_one(requests[i])
+                i += 1
+                continue
+            # A run of consecutive reads, none of them depends on another.
+            j = i
+            while j < len(requests) and requests[j].method in SAFE_METHODS:
+                j += 1
+            if j - i == 1:
+                results[i] = run_one(requests[i])
+            else:
+                results[i:j] = pool.map(requests[i:j])
+            i = j
+    finally:
+        pool.close()
+
+    return results
+
+
+class BatchView(APIView):
+    """Run several API requests in one round trip"""
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = BatchSerializer
+    throttle_scope = 'batch'
+
+    def post(self, request):
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        sub_requests = [
+            build_request(
+                request._request,
+                item['method'], item['path'], item['headers'], item['body'],
+            )
+            for item in serializer.validated_data['requests']
+        ]
+        return Response({'responses': run_batch(sub_requests)})
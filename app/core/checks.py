@@ -0,0 +1,38 @@
+"""
+System checks for settings the app relies on in production.
+"""
+
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+from rest_framework.settings import api_settings
+
+from core.throttling import CounterThrottle
+
+# Backends whose data, or atomic incr(), is not shared between processes.
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+    'django.core.cache.backends.filebased.FileBasedCache',
+    'django.core.cache.backends.db.DatabaseCache',
+}
+
+
+@register(Tags.caches, deploy=True)
+def check_throttle_cache(app_configs, **kwargs):
+    """The throttle counters need a cache shared by all the workers"""
+    throttles = [
+        throttle for throttle in api_settings.DEFAULT_THROTTLE_CLASSES
+        if issubclass(throttle, CounterThrottle)
+    ]
+    backend = settings.CACHES['default']['BACKEND']
+    if not throttles or backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Error(
+        f'The throttles count requests in the default cache, {backend} '
+        f'keeps a separate count per process (or has no atomic incr).',
+        hint='Point CACHE_BACKEND and CACHE_LOCATION at memcached, '
+             'otherwise every limit is multiplied by the number of '
+             'workers and the _global rates are not global.',
+        id='core.E001',
+    )]
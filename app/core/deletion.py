@@ -0,0 +1,101 @@
+"""
+Deleting a user and everything they own in small batches.
+
+user.delete() makes Django's collector load every recipe, tag, ingredient
+and link row of the user into memory and delete them in one transaction,
+which takes minutes and holds locks for the biggest accounts. Here the
+children are deleted bottom up with plain DELETE statements of at most
+`batch_size` rows, each committed on its own, and only the (by then
+almost empty) user row goes through the collector at the end.
+"""
+
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+
+from core.models import Recipe, Tag, Ingredient
+
+
+def _qn(name):
+    return connection.ops.quote_name(name)
+
+
+def _link_statement(through, owner_model, owner_column):
+    """DELETE a batch of link rows whose `owner_column` row is the user's"""
+    owner_field = through._meta.get_field(owner_column)
+    return (
+        'DELETE FROM {links} WHERE {pk} IN ('
+        'SELECT l.{pk} FROM {links} l '
+        'INNER JOIN {owners} o ON o.{owner_pk} = l.{fk} '
+        'WHERE o.{user_fk} = %s LIMIT %s)'
+    ).format(
+        links=_qn(through._meta.db_table),
+        pk=_qn(through._meta.pk.column),
+        owners=_qn(owner_model._meta.db_table),
+        owner_pk=_qn(owner_model._meta.pk.column),
+        fk=_qn(owner_field.column),
+        user_fk=_qn(owner_model._meta.get_field('user').column),
+    )
+
+
+def _owned_statement(model):
+    """DELETE a batch of rows of `model` belonging to the user"""
+    return (
+        'DELETE FROM {table} WHERE {pk} IN ('
+        'SELECT {pk} FROM {table} WHERE {user_fk} = %s LIMIT %s)'
+    ).format(
+        table=_qn(model._meta.db_table),
+        pk=_qn(model._meta.pk.column),
+        user_fk=_qn(model._meta.get_field('user').column),
+    )
+
+
+def deletion_plan():
+    """Return the (label, sql) steps in the order they have to run"""
+    tags = Recipe.tags.through
+    ingredients = Recipe.ingredients.through
+    return [
+        ('recipe tags', _link_statement(tags, Recipe, 'recipe')),
+        ('recipe ingredients', _link_statement(ingredients, Recipe, 'recipe')),
+        # Links from other users' recipes to this user's tags/ingredients
+        # should not exist, but must not block the deletes below.
+        ('tag links', _link_statement(tags, Tag, 'tag')),
+        ('ingredient links', _link_statement(
+            ingredients, Ingredient, 'ingredient'
+        )),
+        ('recipes', _owned_statement(Recipe)),
+        ('tags', _owned_statement(Tag)),
+        ('ingredients', _owned_statement(Ingredient)),
+    ]
+
+
+def delete_user_in_batches(user_id, batch_size=1000, sleep=0, progress=None):
+    """Delete a user and all their data, `batch_size` rows at a time.
+
+    `progress(label, deleted_so_far)` is called after every batch. Returns
+    {label: rows deleted}. Safe to run again after an interruption, it
+    continues with whatever is left.
+    """
+    totals = {}
+    for label, sql in deletion_plan():
+        totals[label] = 0
+        while True:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, [user_id, batch_size])
+                    deleted = cursor.rowcount
+            totals[label] += deleted
+            if progress is not None and deleted:
+                progress(label, totals[label])
+            if deleted < batch_size:
+                break
+            if sleep:
+                time.sleep(sleep)
+
+    # Tokens, permissions, admin log entries... are only a handful of rows.
+    deleted, _ = get_user_model().objects.filter(pk=user_id).delete()
+    totals['user'] = 1 if deleted else 0
+    if progress is not None:
+        progress('user', totals['user'])
+    return totals
@@ -0,0 +1,245 @@
+"""
+Per-user change notifications.
+
+Writes call publish(user_id, ...) and once the transaction commits the
+message is handed to the broker set by EVENTS_BACKEND, which fans it out
+to the user's open event streams (see core/sse.py). Messages only say
+what changed, {"type": "recipe", "action": "updated", "ids": [3]}, the
+client fetches the data itself.
+
+- LocalBroker (default) delivers within the process. Enough for a single
+  ASGI server process that also handles the writes: streams never see the
+  writes of other web workers, nor those of the task worker.
+- PostgresBroker sends messages with NOTIFY and every process LISTENs,
+  so streams get the writes made by any web process or task worker.
+
+A message that can't be sent is logged and dropped, the write it is about
+has committed already.
+"""
+
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+_broker = None
+
+
+def get_broker():
+    """Return the configured broker instance"""
+    global _broker
+    path = getattr(settings, 'EVENTS_BACKEND', 'core.events.LocalBroker')
+    if _broker is None or _broker.path != path:
+        _broker = import_string(path)()
+        _broker.path = path
+    return _broker
+
+
+def publish(user_id, kind, action, ids):
+    """Tell `user_id`'s streams that `ids` of `kind` were changed.
+
+    Sent when the current transaction commits, never for a rollback.
+    """
+    message = {'type': kind, 'action': action, 'ids': sorted(ids)}
+    if not message['ids']:
+        return
+
+    def send():
+        # Raising here would fail a request whose data is committed and
+        # skip the on_commit callbacks after this one.
+        try:
+            get_broker().publish(user_id, message)
+        except Exception:
+            logger.exception('Could not publish %s %s event', kind, action)
+
+    transaction.on_commit(send)
+
+
+class Subscription:
+    """The queue of one open stream. Use from the event loop only."""
+
+    def __init__(self, broker, user_id, maxsize):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # A client this far behind has to refetch everything anyway.
+            self.overflowed = True
+
+    async def get(self):
+        """The next message, or a 'resync' one after an overflow"""
+        if self.overflowed:
+            self.overflowed = False
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            return {'type': 'resync'}
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """Fan messages out to the subscriptions of this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+
+    def subscribe(self, user_id):
+        maxsize = getattr(settings, 'EVENTS_QUEUE_SIZE', 100)
+        subscription = Subscription(self, user_id, maxsize)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def publish(self, user_id, message):
+        self.dispatch(user_id, message)
+
+    def dispatch(self, user_id, message):
+        """Queue `message` on every subscription of the user.
+
+        Can be called from any thread, the queues are only touched from
+        their own event loop.
+        """
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(
+                    subscription.put, message
+                )
+            except RuntimeError:
+                # Its loop is closed, the stream is gone.
+                self.unsubscribe(subscription)
+
+
+class PostgresBroker(LocalBroker):
+    """Broadcast messages to every process with LISTEN/NOTIFY.
+
+    Each process runs one listener thread with its own connection, started
+    with the first subscription. It reconnects after a failure and tells
+    every stream to resync, as notifications sent meanwhile are lost.
+    NOTIFY is transactional, but publish() already runs after the commit.
+    """
+
+    channel = 'recipe_events'
+    # NOTIFY refuses payloads of 8000 bytes and more.
+    max_payload = 7900
+    retry_seconds = 5
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+
+    def subscribe(self, user_id):
+        subscription = super().subscribe(user_id)
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(
+                    target=self._listen, name='events-listener', daemon=True
+                )
+                self._listener.start()
+        return subscription
+
+    def publish(self, user_id, message):
+        with connection.cursor() as cursor:
+            for payload in self.payloads(user_id, message):
+                cursor.execute(
+                    'SELECT pg_notify(%s, %s)', [self.channel, payload]
+                )
+
+    def payloads(self, user_id, message):
+        """The NOTIFY payloads of a message, its ids spread over as many
+        as it takes to stay under max_payload bytes"""
+        payload = json.dumps({'user': user_id, 'message': message})
+        if len(payload.encode()) < self.max_payload:
+            return [payload]
+
+        def dump(ids):
+            return json.dumps(
+                {'user': user_id, 'message': dict(message, ids=ids)}
+            )
+
+        payloads = []
+        ids = []
+        size = len(dump([]).encode())
+        for item in message['ids']:
+            # The id and its ', ' separator.
+            item_size = len(json.dumps(item)) + 2
+            if ids and size + item_size >= self.max_payload:
+                payloads.append(dump(ids))
+                ids = []
+                size = len(dump([]).encode())
+            ids.append(item)
+            size += item_size
+        payloads.append(dump(ids))
+        return payloads
+
+    def resync_all(self):
+        """Ask every stream of this process to refetch everything"""
+        with self._lock:
+            user_ids = list(self._subscriptions)
+        for user_id in user_ids:
+            self.dispatch(user_id, {'type': 'resync'})
+
+    def _listen(self):
+        """Deliver notifications until the process exits, reconnecting
+        after a failure"""
+        reconnect = False
+        while True:
+            try:
+                self._listen_once(reconnect)
+            except Exception:
+                logger.exception(
+                    'Event listener failed, reconnecting in %ss',
+                    self.retry_seconds,
+                )
+            reconnect = True
+            time.sleep(self.retry_seconds)
+
+    def _listen_once(self, reconnect):
+        conn = connection.get_new_connection(
+            connection.get_connection_params()
+        )
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN {self.channel}')
+            if reconnect:
+                self.resync_all()
+            while True:
+                if select.select([conn], [], [], 30) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    try:
+                        data = json.loads(notify.payload)
+                        self.dispatch(data['user'], data['message'])
+                    except (ValueError, KeyError):
+                        logger.warning('Bad event payload %r', notify.payload)
+        finally:
+            conn.close()
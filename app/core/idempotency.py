@@ -0,0 +1,203 @@
+"""
+Idempotency-Key support for create endpoints.
+
+A client that retries a POST with the same Idempotency-Key header gets the
+response of the first request back instead of creating the object again.
+Responses are kept for IDEMPOTENCY_KEY_TTL seconds in the cache, with the
+core.IdempotencyRecord table as the source of truth when the cache misses.
+The table row is inserted before the request is processed, so a duplicate
+arriving while the first is still running gets a 409 instead of racing it.
+That claim is a lease of IDEMPOTENCY_LOCK_SECONDS: if the process handling
+the first request dies, a retry after that runs the request again.
+Requests that fail (validation errors included) are forgotten, so the
+client can retry them with the same key. Expired rows are deleted by
+`manage.py purge_idempotency_keys`.
+
+Keys and request bodies are stored as HMACs keyed with SECRET_KEY, the
+body of a signup holds a password.
+"""
+
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.throttling import BaseThrottle
+
+from core.models import IdempotencyRecord
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+MAX_KEY_LENGTH = 255
+
+
+def _ttl():
+    return getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+
+
+def _lock_seconds():
+    return getattr(settings, 'IDEMPOTENCY_LOCK_SECONDS', 60)
+
+
+def _hash(*parts):
+    return salted_hmac(
+        'core.idempotency', '\0'.join(parts), algorithm='sha256'
+    ).hexdigest()
+
+
+def request_fingerprint(request):
+    """Hash of what the request asks for"""
+    data = request.data
+    if hasattr(data, 'lists'):
+        # QueryDict from a form post, keep repeated values.
+        data = dict(data.lists())
+    body = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder)
+    return _hash(request.method, request.path, body)
+
+
+class IdempotencyStore:
+    """Records the outcome of requests by their scoped key"""
+
+    def _cache_key(self, key):
+        return f'idempotency:{key}'
+
+    def begin(self, key, fingerprint):
+        """Claim `key` for a new request.
+
+        Returns None when the caller should process the request, otherwise
+        the Response to send back instead.
+        """
+        cached = cache.get(self._cache_key(key))
+        if cached is not None:
+            return self._replay(cached, fingerprint)
+
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                IdempotencyRecord.objects.create(
+                    key=key,
+                    fingerprint=fingerprint,
+                    # Until the request completes, see complete().
+                    expires_at=now + timedelta(seconds=_lock_seconds()),
+                )
+            return None
+        except IntegrityError:
+            pass
+
+        record = IdempotencyRecord.objects.filter(key=key).first()
+        if record is None or record.expires_at <= now:
+            # Expired, abandoned or its request died while being
+            # processed, start over with a fresh record.
+            IdempotencyRecord.objects.filter(key=key, expires_at__lte=now) \
+                .delete()
+            return self.begin(key, fingerprint)
+
+        if record.status_code is None:
+            return Response(
+                {'detail': 'A request with this Idempotency-Key is still '
+                           'being processed.'},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        stored = self._stored(record)
+        cache.set(
+            self._cache_key(key), stored,
+            (record.expires_at - now).total_seconds(),
+        )
+        return self._replay(stored, fingerprint)
+
+    def complete(self, key, response):
+        """Remember the response of a processed request"""
+        data = json.loads(json.dumps(response.data, cls=DjangoJSONEncoder))
+        IdempotencyRecord.objects.filter(key=key).update(
+            status_code=response.status_code,
+            response=data,
+            expires_at=timezone.now() + timedelta(seconds=_ttl()),
+        )
+        record = IdempotencyRecord.objects.filter(key=key).first()
+        if record is not None:
+            cache.set(self._cache_key(key), self._stored(record), _ttl())
+
+    def abandon(self, key):
+        """Forget a request that failed so it can be retried"""
+        IdempotencyRecord.objects.filter(key=key).delete()
+        cache.delete(self._cache_key(key))
+
+    def purge(self, batch_size=1000):
+        """Delete up to `batch_size` expired records, return how many"""
+        ids = list(
+            IdempotencyRecord.objects
+            .filter(expires_at__lte=timezone.now())
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0
+        deleted, _ = IdempotencyRecord.objects.filter(
+            id__in=ids, expires_at__lte=timezone.now()
+        ).delete()
+        return deleted
+
+    def _stored(self, record):
+        return {
+            'fingerprint': record.fingerprint,
+            'status': record.status_code,
+            'data': record.response,
+        }
+
+    def _replay(self, stored, fingerprint):
+        if stored['fingerprint'] != fingerprint:
+            return Response(
+                {'detail': 'Idempotency-Key was already used for a '
+                           'different request.'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        response = Response(stored['data'], status=stored['status'])
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+
+class IdempotentCreateMixin:
+    """Honour the Idempotency-Key header on a view's create()"""
+
+    idempotency_store = IdempotencyStore()
+
+    def create(self, request, *args, **kwargs):
+        client_key = request.META.get(HEADER)
+        if not client_key:
+            return super().create(request, *args, **kwargs)
+        if len(client_key) > MAX_KEY_LENGTH:
+            return Response(
+                {'detail': 'Idempotency-Key is too long.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # Keys are only unique per client and endpoint. Anonymous clients
+        # are told apart by address, as the anonymous throttle does.
+        if request.user.is_authenticated:
+            owner = str(request.user.pk)
+        else:
+            owner = 'anonymous:' + BaseThrottle().get_ident(request)
+        key = _hash(owner, request.path, client_key)
+        fingerprint = request_fingerprint(request)
+
+        replay = self.idempotency_store.begin(key, fingerprint)
+        if replay is not None:
+            return replay
+
+        try:
+            response = super().create(request, *args, **kwargs)
+        except Exception:
+            self.idempotency_store.abandon(key)
+            raise
+
+        if response.status_code >= 500:
+            self.idempotency_store.abandon(key)
+        else:
+            self.idempotency_store.complete(key, response)
+        return response
@@ -0,0 +1,122 @@
+"""
+Django command to fill in normalized_name on tags and ingredients and to
+merge the rows whose names only differed by case or whitespace.
+
+Rows created before the normalized_name column existed need this before
+the unique (user, normalized_name) constraint can be added:
+
+1. add the column without the constraint,
+2. run manage.py dedupe_names,
+3. add the constraint.
+
+Both passes work in small batches, each in its own transaction, so it can
+run against the live database.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Min
+
+from core.models import Tag, Ingredient, normalize_name
+from recipe import bulk
+
+MODELS = {'tag': Tag, 'ingredient': Ingredient}
+
+
+class Command(BaseCommand):
+    """Django command to deduplicate tag and ingredient names"""
+
+    help = 'Backfill normalized names and merge duplicate tags/ingredients.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model',
+            choices=sorted(MODELS),
+            action='append',
+            dest='models',
+            help='Only process this model, can be repeated. Default: both.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows (or duplicate groups) handled per transaction.',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.0,
+            help='Seconds to pause between two batches.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        for name in options['models'] or sorted(MODELS):
+            model = MODELS[name]
+            filled = self.backfill(model, options)
+            merged = self.merge_duplicates(model, options)
+            self.stdout.write(self.style.SUCCESS(
+                '%s: %d names normalized, %d duplicates merged'
+                % (name, filled, merged)
+            ))
+
+    def backfill(self, model, options):
+        """Compute normalized_name for the rows that don't have one"""
+        total = 0
+        last_id = 0
+        # Each pass starts after the last id of the previous one, so this
+        # ends even when a name normalizes to ''.
+        while True:
+            objs = list(
+                model.objects.filter(normalized_name='', id__gt=last_id)
+                .order_by('id')[:options['batch_size']]
+            )
+            if not objs:
+                return total
+            for obj in objs:
+                obj.normalized_name = normalize_name(obj.name)
+            with transaction.atomic():
+                model.objects.bulk_update(objs, ['normalized_name'])
+            total += len(objs)
+            last_id = objs[-1].id
+            self.pause(options)
+
+    def merge_duplicates(self, model, options):
+        """Merge every duplicate into the oldest row of its group"""
+        total = 0
+        while True:
+            groups = list(
+                model.objects.values('user_id', 'normalized_name')
+                .annotate(rows=Count('id'), keep=Min('id'))
+                .filter(rows__gt=1)
+                .order_by()[:options['batch_size']]
+            )
+            if not groups:
+                return total
+            merged = 0
+            for group in groups:
+                duplicates = model.objects.filter(
+                    user_id=group['user_id'],
+                    normalized_name=group['normalized_name'],
+                ).exclude(id=group['keep']).values_list('id', flat=True)
+                merged += bulk.merge(
+                    model,
+                    group['user_id'],
+                    list(duplicates),
+                    model.objects.get(id=group['keep']),
+                )
+            total += merged
+            if not merged:
+                # The same groups would come back, forever.
+                self.stderr.write(
+                    '%d duplicate groups could not be merged' % len(groups)
+                )
+                return total
+            self.stdout.write('merged %d duplicates so far' % total)
+            self.pause(options)
+
+    def pause(self, options):
+        if options['sleep']:
+            time.sleep(options['sleep'])
@@ -0,0 +1,53 @@
+"""
+Django command to delete a user with all of their recipes, tags and
+ingredients in small batches, see core/deletion.py.
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.deletion import delete_user_in_batches
+
+
+class Command(BaseCommand):
+    """Django command to delete a user account in batches"""
+
+    help = 'Delete a user and everything they own in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help='Email of the user to delete.')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows deleted per transaction.',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.0,
+            help='Seconds to pause between two batches.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        user = get_user_model().objects.filter(email=options['email']) \
+            .first()
+        if user is None:
+            raise CommandError('No user with email %s' % options['email'])
+
+        # Lock the account out first, deleting a large one takes a while.
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+
+        totals = delete_user_in_batches(
+            user.id,
+            batch_size=options['batch_size'],
+            sleep=options['sleep'],
+            progress=lambda label, done: self.stdout.write(
+                '%s: %d deleted' % (label, done)
+            ),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            'Deleted %s (%d rows)' % (options['email'], sum(totals.values()))
+        ))
@@ -0,0 +1,101 @@
+"""
+Django command to delete tags and ingredients no recipe uses.
+Safe to run against a live database: it works in small batches, each in
+its own transaction, and can sleep between them to limit the load.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.models import Tag, Ingredient
+from core.orphans import delete_orphan_batch, orphaned
+
+MODELS = {'tag': Tag, 'ingredient': Ingredient}
+
+
+class Command(BaseCommand):
+    """Django command to garbage collect orphaned tags and ingredients"""
+
+    help = 'Delete tags and ingredients that no recipe links to.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model',
+            choices=sorted(MODELS),
+            action='append',
+            dest='models',
+            help='Only collect this model, can be repeated. Default: both.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows deleted per transaction.',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.0,
+            help='Seconds to pause between two batches.',
+        )
+        parser.add_argument(
+            '--start-after',
+            type=int,
+            default=0,
+            help='Resume from this id (as reported by a previous run).',
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            default=None,
+            help='Only collect the rows of this user id.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Count the orphans without deleting them.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        for name in options['models'] or sorted(MODELS):
+            model = MODELS[name]
+            if options['dry_run']:
+                self.count(name, model, options)
+            else:
+                self.collect(name, model, options)
+
+    def count(self, name, model, options):
+        orphans = orphaned(model).filter(id__gt=options['start_after'])
+        if options['user'] is not None:
+            orphans = orphans.filter(user_id=options['user'])
+        self.stdout.write('%s: %d orphans' % (name, orphans.count()))
+
+    def collect(self, name, model, options):
+        last_id = options['start_after']
+        total = 0
+        while True:
+            ids, deleted = delete_orphan_batch(
+                model,
+                after_id=last_id,
+                batch_size=options['batch_size'],
+                user_id=options['user'],
+            )
+            if not ids:
+                break
+            last_id = ids[-1]
+            total += deleted
+            # The last id lets an interrupted run pick up where it stopped.
+            self.stdout.write(
+                '%s: deleted %d (total %d), last id %d'
+                % (name, deleted, total, last_id)
+            )
+            if len(ids) < options['batch_size']:
+                break
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            '%s: %d orphans deleted' % (name, total)
+        ))
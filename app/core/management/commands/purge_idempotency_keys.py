@@ -0,0 +1,47 @@
+"""
+Django command to delete the expired Idempotency-Key records.
+Meant to run periodically (cron); works in small batches, each its own
+statement, so it can run against the live database.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.idempotency import IdempotencyStore
+
+
+class Command(BaseCommand):
+    """Django command to purge expired idempotency records"""
+
+    help = 'Delete Idempotency-Key records past their expiry.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows deleted per statement.',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.0,
+            help='Seconds to pause between two batches.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        store = IdempotencyStore()
+        total = 0
+        while True:
+            deleted = store.purge(options['batch_size'])
+            total += deleted
+            if deleted < options['batch_size']:
+                break
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            '%d expired idempotency records deleted' % total
+        ))
@@ -0,0 +1,81 @@
+"""
+Django command to rebuild or verify the per-user recipe stats rows (see
+recipe/stats.py). Goes through the users one at a time.
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import RecipeStats
+from recipe import stats
+
+
+class Command(BaseCommand):
+    """Django command to maintain the recipe stats"""
+
+    help = 'Rebuild the recipe stats of every user, or check them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'action',
+            choices=['rebuild', 'check'],
+            help='rebuild every row, or only report the wrong ones.',
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            default=None,
+            help='Only this user id.',
+        )
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='With check, rebuild the wrong rows it finds.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        user_ids = get_user_model().objects.order_by('id')
+        if options['user'] is not None:
+            user_ids = user_ids.filter(id=options['user'])
+        user_ids = list(user_ids.values_list('id', flat=True))
+
+        wrong = 0
+        for user_id in user_ids:
+            if options['action'] == 'rebuild':
+                stats.rebuild(user_id)
+                continue
+
+            fields = self.mismatches(user_id)
+            if fields:
+                wrong += 1
+                self.stdout.write(
+                    'wrong: user %d (%s)' % (user_id, ', '.join(fields))
+                )
+                if options['fix']:
+                    stats.rebuild(user_id)
+
+        if options['action'] == 'rebuild':
+            self.stdout.write(self.style.SUCCESS(
+                '%d stats rebuilt' % len(user_ids)
+            ))
+        elif wrong and not options['fix']:
+            raise CommandError(
+                '%d of %d stats are wrong' % (wrong, len(user_ids))
+            )
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                '%d stats checked, %d fixed' % (len(user_ids), wrong)
+            ))
+
+    def mismatches(self, user_id):
+        """Names of the stored fields that differ from the aggregates"""
+        expected = stats.compute(user_id)
+        row = RecipeStats.objects.filter(user_id=user_id).first()
+        if row is None:
+            # Built on first use, only wrong if there is something to count.
+            return ['missing'] if expected['recipe_count'] else []
+        return [
+            field for field, value in expected.items()
+            if getattr(row, field) != value
+        ]
@@ -0,0 +1,178 @@
+"""
+Django command that runs the background task worker.
+It polls the core.Task table and executes the due tasks on a pool of
+threads (or processes for CPU bound work).
+"""
+
+import logging
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait,
+)
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections, connections
+
+from core import tasks
+
+logger = logging.getLogger(__name__)
+
+
+def _run(task_id):
+    """Execute a task, a database error only loses this task, which is
+    claimed again once its lease expires"""
+    try:
+        return tasks.execute(task_id)
+    except DatabaseError:
+        logger.exception('Task %s could not be run', task_id)
+        return None
+
+
+def _execute(task_id):
+    """Pool entry point, every pool thread or process has its own db
+    connection which must not be left open between tasks."""
+    close_old_connections()
+    try:
+        return _run(task_id)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    """Django command to run the task worker"""
+
+    help = 'Execute queued background tasks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=4,
+            help='Number of tasks run at the same time.',
+        )
+        parser.add_argument(
+            '--pool',
+            choices=['thread', 'process'],
+            default='thread',
+            help='Run tasks on threads (default) or processes.',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds to sleep when the queue is empty.',
+        )
+        parser.add_argument(
+            '--metrics-interval',
+            type=float,
+            default=60.0,
+            help='Seconds between two latency reports.',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit as soon as the queue is empty.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        self.metrics = tasks.TaskMetrics()
+        backend = tasks.DatabaseBackend()
+        concurrency = options['concurrency']
+
+        # Make sure every task module is registered before we start.
+        tasks.autodiscover_modules('tasks')
+
+        pool = None
+        if concurrency > 1 and options['pool'] == 'thread':
+            pool = ThreadPoolExecutor(max_workers=concurrency)
+        elif concurrency > 1:
+            # Forked children must not share the parent's connections.
+            connections.close_all()
+            pool = ProcessPoolExecutor(
+                max_workers=concurrency, initializer=django.setup
+            )
+
+        self.stdout.write(
+            'Worker started, concurrency %d (%s)'
+            % (concurrency, options['pool'] if pool else 'inline')
+        )
+        last_report = time.monotonic()
+        self.running = set()
+        try:
+            while True:
+                task_ids = []
+                free = concurrency - len(self.running)
+                if free:
+                    try:
+                        task_ids = backend.claim(free)
+                    except DatabaseError:
+                        logger.exception('Could not claim tasks')
+                        close_old_connections()
+                        self.wait(options['poll_interval'])
+                        continue
+                if task_ids:
+                    self.start(pool, task_ids)
+                elif not self.running and options['once']:
+                    break
+                if not task_ids or len(self.running) >= concurrency:
+                    self.wait(options['poll_interval'])
+
+                if time.monotonic() - last_report \
+                        >= options['metrics_interval']:
+                    self.report()
+                    last_report = time.monotonic()
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping worker')
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True)
+                self.collect(self.running)
+            self.report()
+
+    def start(self, pool, task_ids):
+        """Run the claimed tasks, inline or by handing them to the pool.
+
+        The pool is kept full: a task is claimed as soon as a slot frees up
+        rather than once the slowest task of a batch is done.
+        """
+        if pool is None:
+            for task_id in task_ids:
+                self.record(_run(task_id))
+        else:
+            self.running.update(
+                pool.submit(_execute, task_id) for task_id in task_ids
+            )
+
+    def wait(self, timeout):
+        """Wait up to `timeout` seconds for a running task to finish"""
+        if not self.running:
+            time.sleep(timeout)
+            return
+        done, self.running = wait(
+            self.running, timeout=timeout, return_when=FIRST_COMPLETED
+        )
+        self.collect(done)
+
+    def collect(self, futures):
+        """Record the results of finished tasks"""
+        for future in futures:
+            self.record(future.result())
+
+    def record(self, result):
+        """Add the timings of a task run to the metrics"""
+        if result is not None:
+            self.metrics.record(*result)
+
+    def report(self):
+        """Write the latency metrics gathered so far"""
+        for name, stats in sorted(self.metrics.summary().items()):
+            self.stdout.write(
+                '%s: %d run, %d failed, wait p50 %.3fs p95 %.3fs, '
+                'run p50 %.3fs p95 %.3fs' % (
+                    name, stats['count'], stats['failures'],
+                    stats['wait_p50'], stats['wait_p95'],
+                    stats['run_p50'], stats['run_p95'],
+                )
+            )
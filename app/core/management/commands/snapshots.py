@@ -0,0 +1,86 @@
+"""
+Django command to rebuild or verify the denormalized recipe snapshots
+(see recipe/snapshots.py). Works through the recipes in batches of
+increasing id, so it can run against a live database.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Recipe
+from recipe import snapshots
+
+
+class Command(BaseCommand):
+    """Django command to maintain the recipe snapshots"""
+
+    help = 'Rebuild the recipe snapshots, or check them for stale ones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'action',
+            choices=['rebuild', 'check'],
+            help='rebuild every snapshot, or only report stale ones.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Recipes loaded per batch.',
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            default=None,
+            help='Only the recipes of this user id.',
+        )
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='With check, rebuild the stale snapshots it finds.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        total = stale = 0
+        for recipes in self.batches(options):
+            total += len(recipes)
+            if options['action'] == 'rebuild':
+                snapshots.store(recipes)
+                continue
+
+            outdated = [
+                recipe for recipe in recipes
+                if recipe.snapshot != snapshots.build(recipe)
+            ]
+            stale += len(outdated)
+            for recipe in outdated:
+                self.stdout.write('stale: recipe %d' % recipe.id)
+            if options['fix'] and outdated:
+                snapshots.store(outdated)
+
+        if options['action'] == 'rebuild':
+            self.stdout.write(self.style.SUCCESS(
+                '%d snapshots rebuilt' % total
+            ))
+        elif stale and not options['fix']:
+            raise CommandError(
+                '%d of %d snapshots are stale' % (stale, total)
+            )
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                '%d snapshots checked, %d fixed' % (total, stale)
+            ))
+
+    def batches(self, options):
+        recipes = Recipe.objects.order_by('id')
+        if options['user'] is not None:
+            recipes = recipes.filter(user_id=options['user'])
+        last_id = 0
+        while True:
+            batch = list(snapshots.with_relations(
+                recipes.filter(id__gt=last_id)
+            )[:options['batch_size']])
+            if not batch:
+                return
+            yield batch
+            last_id = batch[-1].id
@@ -6,34 +6,113 @@ Anything that is a management
 command will be available with python manage.py.
 """
 
+import random
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-from psycopg2 import OperationalError as Psycopg2Error
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
 
-from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from core.probes import CONNECT_TIMEOUT, probe_database
 
 
 class Command(BaseCommand):
     """Django command to wait for the db"""
 
+    help = 'Wait until the configured databases accept connections.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database',
+            action='append',
+            dest='databases',
+            help='Database alias to wait for, can be repeated. '
+                 'Defaults to every configured database.',
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=None,
+            help='Give up after this many seconds. Waits forever if unset.',
+        )
+        parser.add_argument(
+            '--initial-delay',
+            type=float,
+            default=0.1,
+            help='Seconds to wait after the first failed attempt.',
+        )
+        parser.add_argument(
+            '--max-delay',
+            type=float,
+            default=5.0,
+            help='Upper bound for the delay between two attempts.',
+        )
+
     def handle(self, *args, **options):
         """
         Entry point for command.
         The handle method will get called whenever the command is called.
         """
+        aliases = options['databases'] or list(settings.DATABASES)
+        unknown = set(aliases) - set(settings.DATABASES)
+        if unknown:
+            raise CommandError(
+                'Unknown database(s): %s' % ', '.join(sorted(unknown))
+            )
 
         # stdout is the way that we are able to write to the console.
         self.stdout.write('Waiting for database')
 
-        db_up = False
+        deadline = None
+        if options['timeout'] is not None:
+            deadline = time.monotonic() + options['timeout']
 
-        while db_up is False:
-            try:
-                self.check(databases=['default'])
-                db_up = True
-            except (Psycopg2Error, OperationalError):
-                self.stdout.write('Database unavailable, waiting 1 second.')
-                time.sleep(1)
+        if len(aliases) == 1:
+            results = [self.wait_for(aliases[0], deadline, options)]
+        else:
+            # Wait for all of them at the same time, not one after the other.
+            with ThreadPoolExecutor(max_workers=len(aliases)) as pool:
+                results = list(pool.map(
+                    lambda alias: self.wait_for(alias, deadline, options),
+                    aliases,
+                ))
+
+        failed = [alias for alias, up in zip(aliases, results) if not up]
+        if failed:
+            raise CommandError(
+                'Timed out waiting for database(s): %s' % ', '.join(failed)
+            )
 
         self.stdout.write(self.style.SUCCESS('Database Available'))
+
+    def wait_for(self, alias, deadline, options):
+        """Probe one database until it is up or the deadline passes"""
+        delay = options['initial_delay']
+        time_left = options['timeout']
+        while True:
+            if deadline is None:
+                up = probe_database(alias)
+            else:
+                # Don't let an unanswered connect run past --timeout.
+                up = probe_database(
+                    alias, min(CONNECT_TIMEOUT, max(time_left, 0))
+                )
+            if up:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+            # Exponential backoff with jitter, so containers started
+            # together don't all hit the database at the same moment.
+            sleep_for = random.uniform(delay / 2, delay)
+            if deadline is not None:
+                sleep_for = min(sleep_for, remaining)
+            self.stdout.write(
+                'Database %s unavailable, waiting %.2f seconds.'
+                % (alias, sleep_for)
+            )
+            time.sleep(sleep_for)
+            delay = min(delay * 2, options['max_delay'])
+            if deadline is not None:
+                time_left = remaining - sleep_for
@@ -0,0 +1,323 @@
+"""Custom middleware for the API."""
+
+import cProfile
+import io
+import marshal
+import pstats
+import random
+import re
+import zlib
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, we fall back to gzip only.
+    brotli = None
+
+try:
+    import pyinstrument
+except ImportError:  # Only needed for ?profile=sampling.
+    pyinstrument = None
+
+
+# Matches one coding from the Accept-Encoding header, with its q value.
+re_coding = re.compile(r'\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*')
+
+
+def parse_accept_encoding(header):
+    """Return a dict of coding -> q value from an Accept-Encoding header"""
+    codings = {}
+    for part in header.split(','):
+        match = re_coding.fullmatch(part)
+        if not match:
+            continue
+        coding, quality = match.groups()
+        try:
+            codings[coding.lower()] = float(quality) if quality else 1.0
+        except ValueError:
+            continue
+    return codings
+
+
+def choose_encoding(header, available):
+    """Pick the first coding in `available` the client accepts, or None"""
+    codings = parse_accept_encoding(header)
+    for coding in available:
+        quality = codings.get(coding, codings.get('*', 0))
+        if quality > 0:
+            return coding
+    return None
+
+
+class GzipCompressor:
+    """Wraps zlib so gzip output can be produced in one go or streamed"""
+
+    def __init__(self, level):
+        # wbits 16 + MAX_WBITS makes zlib write the gzip header and trailer.
+        self._zobj = zlib.compressobj(
+            level, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+        )
+
+    def compress(self, data):
+        return self._zobj.compress(data)
+
+    def flush(self):
+        """Emit everything buffered so far without ending the stream"""
+        return self._zobj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._zobj.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor:
+    """Same interface as GzipCompressor for the optional brotli module"""
+
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class CompressionMiddleware:
+    """Compress responses with brotli or gzip when the client accepts it.
+
+    Unlike django's GZipMiddleware this is opt-in through
+    COMPRESSION_ENABLED, skips anything below COMPRESSION_MIN_SIZE bytes and
+    flushes every chunk of a streaming response so streamed exports still
+    reach the client as they are produced.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'COMPRESSION_ENABLED', False):
+            # Django drops the middleware from the chain, so no overhead.
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.gzip_level = getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6)
+        self.brotli_quality = getattr(
+            settings, 'COMPRESSION_BROTLI_QUALITY', 4
+        )
+        self.exempt_paths = tuple(
+            getattr(settings, 'COMPRESSION_EXEMPT_PATHS', ())
+        )
+        self.available = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if not self.should_compress(request, response):
+            return response
+
+        # Everything from here on depends on the request headers, so shared
+        # caches must key on them. Token authenticated responses are
+        # per user as well.
+        vary = ['Accept-Encoding']
+        if 'HTTP_AUTHORIZATION' in request.META:
+            vary.append('Authorization')
+        patch_vary_headers(response, vary)
+
+        encoding = choose_encoding(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''),
+            self.available,
+        )
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = self.compress_stream(
+                response.streaming_content, encoding
+            )
+            # We won't know the compressed size until it has been streamed.
+            if response.has_header('Content-Length'):
+                del response['Content-Length']
+        else:
+            compressor = self.get_compressor(encoding)
+            content = compressor.compress(response.content) + \
+                compressor.finish()
+            # Only keep the compressed content if it is actually smaller.
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        # A strong ETag is no longer valid for the encoded body.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+
+        return response
+
+    def should_compress(self, request, response):
+        """Check the cheap reasons to leave a response alone"""
+        if response.has_header('Content-Encoding'):
+            return False
+        if request.path.startswith(self.exempt_paths):
+            return False
+        if response.streaming:
+            return True
+        return len(response.content) >= self.min_size
+
+    def get_compressor(self, encoding):
+        if encoding == 'br':
+            return BrotliCompressor(self.brotli_quality)
+        return GzipCompressor(self.gzip_level)
+
+    def compress_stream(self, chunks, encoding):
+        """Compress a streaming body, flushing after every chunk"""
+        compressor = self.get_compressor(encoding)
+        for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+
+
+class SlowQueryLogMiddleware:
+    """Log the slow queries of a sample of the requests, see
+    core/querylog.py. Opt-in through SLOW_QUERY_LOG_ENABLED."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SLOW_QUERY_LOG_ENABLED', False):
+            raise MiddlewareNotUsed
+        # Imported once the middleware is used, not when this module is.
+        from core import querylog
+        self.querylog = querylog
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'SLOW_QUERY_LOG_SAMPLE_RATE', 0.1)
+        self.threshold_ms = getattr(
+            settings, 'SLOW_QUERY_LOG_THRESHOLD_MS', 100
+        )
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        timer = self.querylog.QueryTimer(self.threshold_ms)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        if timer.slow:
+            # The EXPLAINs re-run queries, do that once the response has
+            # been sent, before close() lets the connections go.
+            close = response.close
+
+            def record_and_close():
+                try:
+                    self.querylog.record(timer, request)
+                finally:
+                    close()
+
+            response.close = record_and_close
+        return response
+
+
+class ProfilingMiddleware:
+    """Profile one request of a staff user and answer with the profile
+    instead of the response.
+
+    Opt-in through PROFILING_ENABLED, then triggered by an X-Profile header
+    or a ?profile= parameter of:
+
+    - `text` (or `1`): cProfile stats sorted by cumulative time,
+    - `pstats`: the binary cProfile dump, for snakeviz, flameprof and
+      other flamegraph tools,
+    - `sampling`: pyinstrument's HTML report, if it is installed.
+
+    Staff is checked with the API token or the admin session, before the
+    view runs, so the profile covers authentication, the view and the
+    serializers (and the body of a streaming response).
+    """
+
+    FORMATS = ('text', 'pstats', 'sampling')
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.limit = getattr(settings, 'PROFILING_LIMIT', 80)
+
+    def __call__(self, request):
+        mode = request.META.get('HTTP_X_PROFILE') or \
+            request.GET.get('profile')
+        if not mode:
+            return self.get_response(request)
+        if mode == '1':
+            mode = 'text'
+        if mode not in self.FORMATS or not self.is_staff(request):
+            return self.get_response(request)
+
+        if mode == 'sampling' and pyinstrument is not None:
+            profiler = pyinstrument.Profiler()
+            profiler.start()
+            try:
+                response = self.run(request)
+            finally:
+                profiler.stop()
+            return self.profile_response(
+                response, profiler.output_html(), 'text/html'
+            )
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is running in this process.
+            return self.get_response(request)
+        try:
+            response = self.run(request)
+        finally:
+            profiler.disable()
+
+        if mode == 'pstats':
+            profiler.create_stats()
+            return self.profile_response(
+                response, marshal.dumps(profiler.stats),
+                'application/octet-stream',
+            )
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative') \
+            .print_stats(self.limit)
+        return self.profile_response(
+            response, out.getvalue(), 'text/plain; charset=utf-8'
+        )
+
+    def run(self, request):
+        response = self.get_response(request)
+        if response.streaming:
+            # The work of a streaming response happens while it is sent.
+            b''.join(response.streaming_content)
+        return response
+
+    def is_staff(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            return True
+        try:
+            authenticated = TokenAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return False
+        return authenticated is not None and authenticated[0].is_staff
+
+    def profile_response(self, response, content, content_type):
+        profile = HttpResponse(content, content_type=content_type)
+        profile['X-Profiled-Status'] = str(response.status_code)
+        profile['Cache-Control'] = 'no-store'
+        return profile
@@ -1,7 +1,12 @@
 """Database Models"""
 
+import os
+import uuid
+
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
@@ -9,6 +14,21 @@ from django.contrib.auth.models import (
 )
 
 
+def recipe_image_file_path(instance, filename):
+    """Generate file path for new recipe image"""
+    # A random name so uploads never collide or leak the original name.
+    ext = os.path.splitext(filename)[1]
+    filename = f'{uuid.uuid4()}{ext}'
+
+    return os.path.join('uploads', 'recipe', filename)
+
+
+def normalize_name(name):
+    """Return the form of a tag/ingredient name used to spot duplicates.
+    Case and runs of whitespace don't make a different tag."""
+    return ' '.join(name.split()).casefold()
+
+
 class UserManager(BaseUserManager):
     """Manager for users. Used to create users."""
 
@@ -72,6 +92,21 @@ class Recipe(models.Model):
     # My first many to many!
     tags = models.ManyToManyField('Tag')  # make sure to pass as a string
     ingredients = models.ManyToManyField('Ingredient')
+    image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    # Resized copies of the image made in the background, width -> file name
+    image_variants = models.JSONField(default=dict, blank=True)
+    # RecipeDetailSerializer output kept up to date by the API when
+    # RECIPE_SNAPSHOTS_ENABLED, see recipe/snapshots.py
+    snapshot = models.JSONField(null=True, blank=True, editable=False)
+
+    class Meta:
+        # The admin searches recipes by title prefix, see core/admin.py
+        indexes = [
+            models.Index(
+                fields=['title'], name='recipe_title_prefix',
+                opclasses=['varchar_pattern_ops'],
+            ),
+        ]
 
     # We should be able to skip the objects assignment here because we are
     # adopting the model base class and not creating a custom class
@@ -84,8 +119,30 @@ class Recipe(models.Model):
 class Tag(models.Model):
     """Tag for filtering recipes"""
     name = models.CharField(max_length=255)
+    # Filled in by save(), see normalize_name
+    normalized_name = models.CharField(max_length=255, editable=False)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
 
+    class Meta:
+        # Also the index the serializers look tags up with.
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'normalized_name'],
+                name='unique_tag_name_per_user',
+            ),
+        ]
+        # For the admin's name prefix search, see core/admin.py
+        indexes = [
+            models.Index(
+                fields=['normalized_name'], name='tag_name_prefix',
+                opclasses=['varchar_pattern_ops'],
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_name(self.name)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.name
 
@@ -93,8 +150,107 @@ class Tag(models.Model):
 class Ingredient(models.Model):
     """Ingredient that will make up the components of a receipe"""
     name = models.CharField(max_length=255)
+    # Filled in by save(), see normalize_name
+    normalized_name = models.CharField(max_length=255, editable=False)
     # settings.AUTH_USER_MODEL is taken from the settings file that we set.
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'normalized_name'],
+                name='unique_ingredient_name_per_user',
+            ),
+        ]
+        # For the admin's name prefix search, see core/admin.py
+        indexes = [
+            models.Index(
+                fields=['normalized_name'], name='ingredient_name_prefix',
+                opclasses=['varchar_pattern_ops'],
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_name(self.name)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return self.name
+
+
+class Task(models.Model):
+    """Deferred work waiting for, or done by, the background worker"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    # The name the task function was registered under, see core.tasks
+    name = models.CharField(max_length=255)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default=QUEUED
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    # Not picked up before this time, pushed back when a retry is due.
+    run_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        # The worker polls for queued tasks that are due.
+        indexes = [models.Index(fields=['status', 'run_at'])]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
+
+
+class IdempotencyRecord(models.Model):
+    """The response stored for an Idempotency-Key, see core.idempotency"""
+    # Hash of the client's key and what it is scoped to (user and path).
+    key = models.CharField(max_length=64, unique=True)
+    # Hash of the request, the same key with another body is an error.
+    fingerprint = models.CharField(max_length=64)
+    # Both null while the first request is still being processed.
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.key
+
+
+class RecipeStats(models.Model):
+    """Running totals over a user's recipes, see recipe/stats.py"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='recipe_stats',
+    )
+    recipe_count = models.PositiveIntegerField(default=0)
+    price_sum = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    time_sum = models.BigIntegerField(default=0)
+    # Null when the user has no recipes.
+    price_min = models.DecimalField(max_digits=5, decimal_places=2, null=True)
+    price_max = models.DecimalField(max_digits=5, decimal_places=2, null=True)
+    time_min = models.IntegerField(null=True)
+    time_max = models.IntegerField(null=True)
+    # Number of recipes per tag/ingredient id, {"12": 3}. Ids no recipe
+    # uses are left out.
+    tag_counts = models.JSONField(default=dict)
+    ingredient_counts = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return f'{self.user_id}: {self.recipe_count} recipes'
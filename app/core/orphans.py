@@ -0,0 +1,61 @@
+"""
+Finding tags and ingredients that no recipe links to any more.
+"""
+
+from django.db import router
+from django.db.models import Exists, OuterRef
+
+from core.models import Recipe, Tag, Ingredient
+
+# model -> the recipe field linking to it
+LINKED_BY = {
+    Tag: 'tags',
+    Ingredient: 'ingredients',
+}
+
+
+def orphaned(model):
+    """Rows of `model` no recipe links to.
+
+    NOT EXISTS over the through table is planned as an anti-join, which only
+    probes the through table's index instead of counting links per row.
+    """
+    field = Recipe._meta.get_field(LINKED_BY[model])
+    through = field.remote_field.through
+    column = field.m2m_reverse_field_name()
+    links = through.objects.filter(**{column: OuterRef('pk')})
+    return model.objects.filter(~Exists(links))
+
+
+def delete_orphans(model, ids, user_id=None):
+    """Delete those of `ids` that are still orphans, returns the count.
+
+    A recipe may have picked one up since it was found, so the rows are
+    deleted with a single DELETE ... WHERE id IN (...) AND NOT EXISTS
+    (links) statement: the check and the delete see the same links.
+    QuerySet.delete() would collect the rows first and delete a link
+    inserted in between along with them. Only the through table refers to
+    tags and ingredients, and an orphan has no rows there, so bypassing
+    the collector skips nothing.
+    """
+    rows = orphaned(model).filter(id__in=ids)
+    if user_id is not None:
+        rows = rows.filter(user_id=user_id)
+    return rows._raw_delete(router.db_for_write(model))
+
+
+def delete_orphan_batch(model, after_id=0, batch_size=1000, user_id=None):
+    """Delete the next batch of orphans with an id above `after_id`.
+
+    Returns (ids looked at, rows deleted). The ids are walked in order so a
+    run can be resumed from the last id it reported.
+    """
+    candidates = orphaned(model).filter(id__gt=after_id)
+    if user_id is not None:
+        candidates = candidates.filter(user_id=user_id)
+    ids = list(
+        candidates.order_by('id').values_list('id', flat=True)[:batch_size]
+    )
+    if not ids:
+        return ids, 0
+    return ids, delete_orphans(model, ids)
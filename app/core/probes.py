@@ -0,0 +1,77 @@
+"""
+Cheap database connectivity probes, used by wait_for_db and the readiness
+endpoint.
+"""
+
+import math
+import threading
+import time
+
+from django.db import connections
+from django.db.utils import DatabaseError
+
+# Seconds a probe waits for the server to answer, so a host dropping the
+# packets fails the probe instead of hanging it.
+CONNECT_TIMEOUT = 3
+
+
+def probe_database(alias='default', timeout=CONNECT_TIMEOUT):
+    """Try to open (and close) a raw connection to a configured database.
+
+    Unlike BaseCommand.check() this runs no system checks and, unlike
+    ensure_connection(), leaves no connection behind in the connection
+    handler. Returns True when the database accepted the connection
+    within `timeout` seconds.
+    """
+    wrapper = connections[alias]
+    params = wrapper.get_connection_params()
+    if wrapper.vendor in ('postgresql', 'mysql'):
+        # Both take whole seconds.
+        params['connect_timeout'] = max(1, math.ceil(timeout))
+    try:
+        conn = wrapper.get_new_connection(params)
+    except (DatabaseError, wrapper.Database.Error):
+        return False
+    conn.close()
+    return True
+
+
+class ReadinessProbe:
+    """Probe a set of databases, remembering the result for `ttl` seconds.
+
+    Only one request probes at a time, the others get the previous result
+    meanwhile instead of queueing behind a slow probe.
+    """
+
+    def __init__(self, ttl=5):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._results = None
+        self._checked_at = None
+        self._probing = False
+
+    def check(self, aliases):
+        """Return {alias: available} for the given database aliases"""
+        with self._lock:
+            known = self._results is not None and \
+                set(self._results) == set(aliases)
+            fresh = known and time.monotonic() - self._checked_at < self.ttl
+            if fresh or (known and self._probing):
+                return dict(self._results)
+            self._probing = True
+
+        try:
+            results = {alias: probe_database(alias) for alias in aliases}
+        finally:
+            with self._lock:
+                self._probing = False
+        with self._lock:
+            self._results = results
+            self._checked_at = time.monotonic()
+        return dict(results)
+
+    def reset(self):
+        """Forget the cached result"""
+        with self._lock:
+            self._results = None
+            self._checked_at = None
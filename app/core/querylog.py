@@ -0,0 +1,180 @@
+"""
+Slow query log, filled by core.middleware.SlowQueryLogMiddleware.
+
+When SLOW_QUERY_LOG_ENABLED, a SLOW_QUERY_LOG_SAMPLE_RATE share of the
+requests run with a database execute wrapper timing every query. Those
+taking SLOW_QUERY_LOG_THRESHOLD_MS or more are kept with the URL name and
+user of the request and, for plain SELECTs on postgres, the output of
+EXPLAIN (ANALYZE, BUFFERS). The EXPLAINs run the query again, so they
+happen once the response has been sent, at most SLOW_QUERY_LOG_MAX_EXPLAINS
+per request, each in a transaction that is rolled back. Queries taking
+row locks (FOR UPDATE/SHARE) or calling functions other than those in
+EXPLAINABLE_CALLS (pg_notify, nextval...) are never run again.
+
+Entries are kept in memory, the last SLOW_QUERY_LOG_SIZE of each process,
+and shown to staff users at GET /api/debug/slow-queries/. Queries run
+while a streaming response is sent (the snapshot list) are not timed.
+
+Queries on the tables in SENSITIVE_TABLES (users, API tokens, sessions)
+are kept without their parameters and not EXPLAINed, the parameters and
+the plan's conditions would show token keys and password hashes.
+"""
+
+import re
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+# Longest SQL text and parameter repr kept per entry.
+MAX_SQL_LENGTH = 10000
+MAX_PARAM_LENGTH = 200
+# Tables holding credentials, besides the user model's and the API
+# token's, see _sensitive().
+SENSITIVE_TABLES = ['django_session']
+REDACTED = '<redacted>'
+# Words a SELECT may put before a parenthesis and still be re-run by
+# EXPLAIN ANALYZE: SQL keywords and functions without side effects.
+EXPLAINABLE_CALLS = {
+    'select', 'from', 'join', 'where', 'and', 'or', 'not', 'in', 'exists',
+    'any', 'all', 'on', 'as', 'by', 'over', 'filter', 'when', 'then',
+    'else', 'distinct', 'count', 'sum', 'avg', 'min', 'max', 'coalesce',
+    'nullif', 'greatest', 'least', 'lower', 'upper', 'length', 'abs',
+    'round', 'cast', 'array_agg', 'string_agg', 'jsonb_build_object',
+}
+re_call = re.compile(r'(\w+)\s*\(')
+re_row_lock = re.compile(
+    r'\bFOR\s+(NO\s+KEY\s+UPDATE|UPDATE|KEY\s+SHARE|SHARE)\b', re.I
+)
+
+
+class SlowQueryLog:
+    """Ring buffer of the slowest recent queries"""
+
+    def __init__(self, size):
+        self.entries = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def add(self, entry):
+        with self.lock:
+            self.entries.append(entry)
+
+    def recent(self):
+        """The entries, newest first"""
+        with self.lock:
+            return list(reversed(self.entries))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+log = SlowQueryLog(getattr(settings, 'SLOW_QUERY_LOG_SIZE', 200))
+
+
+class QueryTimer:
+    """Execute wrapper collecting the queries slower than `threshold_ms`"""
+
+    def __init__(self, threshold_ms):
+        self.threshold = threshold_ms / 1000
+        self.slow = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            if duration >= self.threshold:
+                self.slow.append(
+                    (context['connection'], sql, params, many, duration)
+                )
+
+
+def _sensitive(sql):
+    # Imported here, the models need the app registry and this module is
+    # imported by core.middleware.
+    from rest_framework.authtoken.models import Token
+
+    tables = SENSITIVE_TABLES + [
+        get_user_model()._meta.db_table, Token._meta.db_table,
+    ]
+    sql = sql.lower()
+    return any(table in sql for table in tables)
+
+
+def explainable(sql):
+    """Whether `sql` can be run again by EXPLAIN ANALYZE without side
+    effects: a SELECT taking no row locks and calling no other functions
+    than EXPLAINABLE_CALLS"""
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return False
+    if re_row_lock.search(sql):
+        return False
+    return all(
+        name.lower() in EXPLAINABLE_CALLS for name in re_call.findall(sql)
+    )
+
+
+def _params(params):
+    if params is None:
+        return None
+    return [repr(param)[:MAX_PARAM_LENGTH] for param in params]
+
+
+def explain(connection, sql, params):
+    """The EXPLAIN (ANALYZE, BUFFERS) lines of a postgres SELECT, or None"""
+    if connection.vendor != 'postgresql':
+        return None
+    if not explainable(sql):
+        # ANALYZE executes the statement, never do that for side effects.
+        return None
+    try:
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + sql, params)
+                plan = [row[0] for row in cursor.fetchall()]
+            transaction.set_rollback(True, using=connection.alias)
+        return plan
+    except Exception as exc:
+        # In a failed transaction, or the query can't be re-run as is.
+        return ['EXPLAIN failed: %s' % exc]
+
+
+def record(timer, request):
+    """Add what `timer` caught during `request` to the log"""
+    match = getattr(request, 'resolver_match', None)
+    user = getattr(request, 'user', None)
+    explains = getattr(settings, 'SLOW_QUERY_LOG_MAX_EXPLAINS', 5)
+    # The slowest queries get the EXPLAINs.
+    for connection, sql, params, many, duration in sorted(
+        timer.slow, key=lambda query: -query[-1]
+    ):
+        sensitive = _sensitive(sql)
+        plan = None
+        if explains > 0 and not many and not sensitive:
+            plan = explain(connection, sql, params)
+            if plan is not None:
+                explains -= 1
+        if many:
+            logged_params = None
+        elif sensitive:
+            logged_params = REDACTED
+        else:
+            logged_params = _params(params)
+        log.add({
+            'time': timezone.now().isoformat(),
+            'duration_ms': round(duration * 1000, 2),
+            'database': connection.alias,
+            'sql': sql[:MAX_SQL_LENGTH],
+            'params': logged_params,
+            'method': request.method,
+            'path': request.path,
+            'url_name': match.view_name if match else None,
+            'user_id': user.pk if user is not None else None,
+            'plan': plan,
+        })
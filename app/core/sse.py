@@ -0,0 +1,180 @@
+"""
+Server-sent events stream of a user's changes, GET /api/events/.
+
+Clients open one stream instead of polling the recipe list: an `event:
+ready` first, then one event per change published through core.events
+and a comment line every EVENTS_HEARTBEAT_SECONDS to keep proxies from
+closing the connection. After (re)connecting, a client should reload what
+it shows once, changes made while it was disconnected are not replayed.
+
+This is a plain ASGI app mounted in app/asgi.py next to django. Django 3.2
+can only send streaming responses from a thread, which a stream that
+stays open would hold forever; here a stream costs an idle coroutine.
+Authentication is the API token in the Authorization header or, since
+EventSource can't set headers, a `ticket` query parameter: a random
+string from POST /api/events/ticket/ that opens one stream and expires
+after EVENTS_TICKET_SECONDS. Query strings end up in access logs, the
+long-lived token must not. Tickets are kept in the default cache, which
+has to be shared by the process issuing and the one streaming.
+
+Streams only get the messages of the broker of their own process. With
+the default LocalBroker that is the writes made by this ASGI process
+alone, never those of other web workers or of the task worker, so any
+deployment running more than one process needs PostgresBroker.
+"""
+
+import asyncio
+import json
+import secrets
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from rest_framework.authtoken.models import Token
+
+from core.events import get_broker
+
+PATH = '/api/events/'
+
+
+def _ticket_key(ticket):
+    return f'events-ticket:{ticket}'
+
+
+def issue_ticket(user_id):
+    """A single use ticket opening one stream of `user_id`"""
+    ticket = secrets.token_urlsafe(32)
+    cache.set(
+        _ticket_key(ticket), user_id,
+        getattr(settings, 'EVENTS_TICKET_SECONDS', 30),
+    )
+    return ticket
+
+
+def _token_key(scope):
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            parts = value.decode('latin-1').split()
+            if len(parts) == 2 and parts[0].lower() == 'token':
+                return parts[1]
+    return None
+
+
+def _ticket(scope):
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    return query.get('ticket', [None])[0]
+
+
+def _redeem(ticket):
+    """The user id of a valid ticket, which can't be used again"""
+    user_id = cache.get(_ticket_key(ticket))
+    # Only one of two concurrent uses gets to delete it.
+    if user_id is None or not cache.delete(_ticket_key(ticket)):
+        return None
+    return user_id
+
+
+def _user_id(key):
+    """The id of the active user owning the token, or None"""
+    token = Token.objects.select_related('user').filter(key=key).first()
+    if token is None or not token.user.is_active:
+        return None
+    return token.user_id
+
+
+async def _send_json(send, status, data, headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json')] + list(headers),
+    })
+    await send({
+        'type': 'http.response.body',
+        'body': json.dumps(data).encode(),
+    })
+
+
+def format_event(message):
+    """Encode a message as one SSE event"""
+    return (
+        f"event: {message['type']}\n"
+        f'data: {json.dumps(message)}\n\n'
+    ).encode()
+
+
+async def events_app(scope, receive, send):
+    """ASGI app streaming the authenticated user's change events"""
+    if scope['method'] != 'GET':
+        detail = 'Method "%s" not allowed.' % scope['method']
+        await _send_json(
+            send, 405, {'detail': detail}, headers=[(b'allow', b'GET')]
+        )
+        return
+
+    key = _token_key(scope)
+    ticket = _ticket(scope)
+    user_id = None
+    if key:
+        user_id = await sync_to_async(_user_id)(key)
+    elif ticket:
+        user_id = await sync_to_async(_redeem)(ticket)
+    if user_id is None:
+        await _send_json(
+            send, 401, {'detail': 'Invalid or missing token or ticket.'},
+            headers=[(b'www-authenticate', b'Token')],
+        )
+        return
+
+    heartbeat = getattr(settings, 'EVENTS_HEARTBEAT_SECONDS', 15)
+    subscription = get_broker().subscribe(user_id)
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                # Don't let nginx buffer the stream.
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        await _send_body(send, b'retry: 3000\n' + format_event(
+            {'type': 'ready'}
+        ))
+
+        while True:
+            message = asyncio.ensure_future(subscription.get())
+            done, _ = await asyncio.wait(
+                {message, disconnected},
+                timeout=heartbeat,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if disconnected in done:
+                message.cancel()
+                break
+            if message in done:
+                await _send_body(send, format_event(message.result()))
+            else:
+                message.cancel()
+                await _send_body(send, b': ping\n\n')
+    finally:
+        subscription.close()
+        disconnected.cancel()
+
+
+async def _wait_for_disconnect(receive):
+    while True:
+        event = await receive()
+        if event['type'] == 'http.disconnect':
+            return
+
+
+async def _send_body(send, body):
+    await send({
+        'type': 'http.response.body',
+        'body': body,
+        'more_body': True,
+    })
@@ -0,0 +1,228 @@
+"""
+A small queue for work that should not run inside the request.
+
+Functions are registered with the @task decorator, usually in a tasks.py
+module of an app, and queued with func.delay(**kwargs). The kwargs must be
+JSON serializable. Which backend stores the queue is set by
+TASK_QUEUE_BACKEND:
+
+- DatabaseBackend (default) writes a core.Task row in the current
+  transaction, so a task is only queued if the work that queued it is
+  committed. `manage.py run_worker` executes them. A claimed task is
+  leased for TASK_VISIBILITY_TIMEOUT seconds, if it is still running
+  after that its worker is assumed dead and another one picks it up, so
+  tasks may run more than once and should be safe to repeat.
+- ImmediateBackend runs the task right after the transaction commits in
+  the same process, handy for development.
+"""
+
+import logging
+import statistics
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules, import_string
+
+from core.models import Task
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+_backend = None
+
+
+def task(func=None, *, name=None, max_attempts=3):
+    """Register a function as a task, adding .delay() to queue it"""
+    def register(func):
+        task_name = name or f'{func.__module__}.{func.__name__}'
+        func.task_name = task_name
+        func.max_attempts = max_attempts
+        func.delay = lambda **kwargs: enqueue(task_name, **kwargs)
+        _registry[task_name] = func
+        return func
+
+    if func is not None:
+        return register(func)
+    return register
+
+
+def get_task(name):
+    """Return the function registered as `name`"""
+    if name not in _registry:
+        # The worker may not have imported the module defining it yet.
+        autodiscover_modules('tasks')
+    return _registry[name]
+
+
+def get_backend():
+    """Return the configured backend instance"""
+    global _backend
+    path = getattr(
+        settings, 'TASK_QUEUE_BACKEND', 'core.tasks.DatabaseBackend'
+    )
+    if _backend is None or _backend.path != path:
+        _backend = import_string(path)()
+        _backend.path = path
+    return _backend
+
+
+def enqueue(name, **kwargs):
+    """Queue the task registered as `name`"""
+    return get_backend().enqueue(name, kwargs)
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next attempt, doubling each time"""
+    return min(5 * 2 ** (attempts - 1), 3600)
+
+
+class DatabaseBackend:
+    """Store queued tasks as core.Task rows"""
+
+    def enqueue(self, name, kwargs):
+        return Task.objects.create(
+            name=name,
+            kwargs=kwargs,
+            max_attempts=get_task(name).max_attempts,
+        )
+
+    def claim(self, limit):
+        """Mark up to `limit` due tasks as running and return their ids.
+
+        SKIP LOCKED lets several workers poll the same table without
+        waiting on, or claiming, each others rows. Running tasks whose
+        lease expired are claimed again, the lost run counts as a failed
+        attempt.
+        """
+        now = timezone.now()
+        expired = now - timedelta(
+            seconds=getattr(settings, 'TASK_VISIBILITY_TIMEOUT', 3600)
+        )
+        with transaction.atomic():
+            rows = list(
+                Task.objects.select_for_update(skip_locked=True)
+                .filter(
+                    Q(status=Task.QUEUED, run_at__lte=now)
+                    | Q(status=Task.RUNNING, started_at__lt=expired)
+                )
+                .order_by('run_at')
+                .values_list('id', 'status', 'attempts', 'max_attempts')
+                [:limit]
+            )
+            ids, lost = [], []
+            for task_id, status, attempts, max_attempts in rows:
+                if status == Task.QUEUED:
+                    ids.append(task_id)
+                    continue
+                logger.warning('Task %s lease expired, reclaiming', task_id)
+                if attempts + 1 < max_attempts:
+                    ids.append(task_id)
+                lost.append(task_id)
+            if lost:
+                Task.objects.filter(id__in=lost).update(
+                    attempts=F('attempts') + 1,
+                    last_error='Lease expired, the worker running it died.',
+                )
+                Task.objects.filter(
+                    id__in=lost, attempts__gte=F('max_attempts')
+                ).update(status=Task.FAILED, finished_at=now)
+            Task.objects.filter(id__in=ids).update(
+                status=Task.RUNNING, started_at=now
+            )
+        return ids
+
+
+class ImmediateBackend:
+    """Run tasks in process as soon as the current transaction commits"""
+
+    def enqueue(self, name, kwargs):
+        func = get_task(name)
+        transaction.on_commit(lambda: func(**kwargs))
+
+
+def execute(task_id):
+    """Run a claimed task and record the outcome.
+
+    Returns (name, seconds queued, seconds running, succeeded) for the
+    worker metrics.
+    """
+    row = Task.objects.get(id=task_id)
+    # How long the task sat in the queue after it was due.
+    due = max(row.run_at, row.created_at)
+    waited = (row.started_at - due).total_seconds() if row.started_at else 0
+    row.attempts += 1
+    start = time.monotonic()
+    succeeded = True
+    try:
+        get_task(row.name)(**row.kwargs)
+    except Exception:
+        succeeded = False
+        row.last_error = traceback.format_exc()
+        logger.exception('Task %s (%s) failed', row.id, row.name)
+
+    row.finished_at = timezone.now()
+    if succeeded:
+        row.status = Task.DONE
+    elif row.attempts < row.max_attempts:
+        row.status = Task.QUEUED
+        row.run_at = row.finished_at + timedelta(
+            seconds=retry_delay(row.attempts)
+        )
+    else:
+        row.status = Task.FAILED
+    row.save()
+
+    return row.name, max(waited, 0.0), time.monotonic() - start, succeeded
+
+
+class TaskMetrics:
+    """Latency and failure counts per task name for one worker process.
+
+    Percentiles are computed over the last `window` runs of each task.
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._waits = {}
+        self._runs = {}
+        self._failures = {}
+
+    def record(self, name, waited, ran, succeeded):
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + 1
+            self._waits.setdefault(name, deque(maxlen=self.window)) \
+                .append(waited)
+            self._runs.setdefault(name, deque(maxlen=self.window)) \
+                .append(ran)
+            if not succeeded:
+                self._failures[name] = self._failures.get(name, 0) + 1
+
+    def summary(self):
+        """Return {name: stats} with counts and latency percentiles"""
+        with self._lock:
+            return {
+                name: {
+                    'count': self._counts[name],
+                    'failures': self._failures.get(name, 0),
+                    'wait_p50': _percentile(self._waits[name], 50),
+                    'wait_p95': _percentile(self._waits[name], 95),
+                    'run_p50': _percentile(runs, 50),
+                    'run_p95': _percentile(runs, 95),
+                }
+                for name, runs in self._runs.items()
+            }
+
+
+def _percentile(values, percent):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100)[percent - 1]
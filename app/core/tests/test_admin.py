@@ -1,10 +1,21 @@
 """Test for the django admin modifications."""
 
+import csv
+import io
+from unittest.mock import patch
+
 from django.test import TestCase
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.test import Client
 
+from core import exports
+from core.admin import EstimatedCountPaginator
+from core.models import Recipe, Tag
+
+
 class AdminSiteTests(TestCase):
     """Tests that will be run for the admin test.
     Set up will be run before."""
@@ -55,4 +66,167 @@ class AdminSiteTests(TestCase):
         url = reverse('admin:core_user_add')
         res = self.client.get(url)
 
-        self.assertEqual(res.status_code, 200)
\ No newline at end of file
+        self.assertEqual(res.status_code, 200)
+
+
+class LargeTableAdminTests(TestCase):
+    """The recipe, tag and ingredient changelists stay cheap"""
+
+    def setUp(self):
+        self.admin_user = get_user_model().objects.create_superuser(
+            email='admin@example.com', password='testpass123'
+        )
+        self.client = Client()
+        self.client.force_login(self.admin_user)
+
+    def create_recipes(self, count):
+        start = Recipe.objects.count()
+        for i in range(start, start + count):
+            user = get_user_model().objects.create_user(
+                email=f'user{i}@example.com', password='testpass123'
+            )
+            recipe = Recipe.objects.create(
+                user=user, title=f'Recipe {i}', time_minutes=5, price='1.00'
+            )
+            recipe.tags.add(Tag.objects.create(user=user, name=f'Tag {i}'))
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.get(url)
+        self.assertEqual(res.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_query_count_independent_of_rows(self):
+        for name in ('recipe', 'tag'):
+            url = reverse(f'admin:core_{name}_changelist')
+            self.create_recipes(3)
+            few = self.count_queries(url)
+            self.create_recipes(10)
+
+            self.assertEqual(self.count_queries(url), few, name)
+
+    def test_no_full_count_when_filtered(self):
+        self.create_recipes(3)
+        url = reverse('admin:core_recipe_changelist')
+
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url, {'q': 'Recipe 1'})
+
+        counts = [q['sql'] for q in context.captured_queries
+                  if 'COUNT(*)' in q['sql']]
+        self.assertEqual(len(counts), 1)
+        self.assertIn('WHERE', counts[0])
+
+    def test_prefix_search(self):
+        self.create_recipes(3)
+        tag = Tag.objects.get(name='Tag 2')
+
+        res = self.client.get(
+            reverse('admin:core_tag_changelist'), {'q': 'TAG  2'}
+        )
+        self.assertEqual(list(res.context['cl'].result_list), [tag])
+
+        res = self.client.get(
+            reverse('admin:core_tag_changelist'), {'q': str(tag.id)}
+        )
+        self.assertEqual(list(res.context['cl'].result_list), [tag])
+
+    def test_recipe_change_page(self):
+        self.create_recipes(1)
+        recipe = Recipe.objects.get()
+
+        res = self.client.get(
+            reverse('admin:core_recipe_change', args=[recipe.id])
+        )
+
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(res, 'vManyToManyRawIdAdminField')
+
+    def test_estimated_count(self):
+        self.create_recipes(3)
+        paginator = EstimatedCountPaginator(Recipe.objects.order_by('id'), 10)
+        # No estimate on sqlite.
+        self.assertEqual(paginator.count, 3)
+
+        with patch('core.admin.estimated_count', return_value=2000000):
+            paginator = EstimatedCountPaginator(
+                Recipe.objects.order_by('id'), 10
+            )
+            self.assertEqual(paginator.count, 2000000)
+
+
+class AdminExportTests(TestCase):
+    """The CSV export action of the changelists"""
+
+    def setUp(self):
+        self.admin_user = get_user_model().objects.create_superuser(
+            email='admin@example.com', password='testpass123'
+        )
+        self.client = Client()
+        self.client.force_login(self.admin_user)
+
+    def export(self, name, data, query=''):
+        res = self.client.post(
+            reverse(f'admin:core_{name}_changelist') + query,
+            dict({'action': 'export_csv'}, **data),
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.streaming)
+        self.assertIn('attachment;', res['Content-Disposition'])
+        content = b''.join(res.streaming_content).decode()
+        return list(csv.reader(io.StringIO(content)))
+
+    def test_export_selected_recipes(self):
+        recipes = [
+            Recipe.objects.create(
+                user=self.admin_user, title=title, time_minutes=5,
+                price='2.50',
+            )
+            for title in ('Soup', '=HYPERLINK("x")', 'Stew')
+        ]
+
+        rows = self.export('recipe', {
+            '_selected_action': [recipes[0].id, recipes[1].id],
+        })
+
+        self.assertEqual(rows[0][:4], ['id', 'user_id', 'user__email',
+                                       'title'])
+        self.assertEqual(
+            [row[3] for row in rows[1:]], ['Soup', '\'=HYPERLINK("x")']
+        )
+        self.assertEqual(rows[1][2], 'admin@example.com')
+
+    def test_export_filtered_tags(self):
+        for name in ('Vegan', 'Vegetarian', 'Spicy'):
+            Tag.objects.create(user=self.admin_user, name=name)
+
+        # "Select all" of a search sends every matching row.
+        rows = self.export('tag', {
+            'select_across': '1', 'index': '0',
+            '_selected_action': [Tag.objects.first().id],
+        }, query='?q=veg')
+
+        self.assertEqual(
+            [row[3] for row in rows[1:]], ['Vegan', 'Vegetarian']
+        )
+
+    def test_user_export_has_no_password(self):
+        rows = self.export('user', {
+            '_selected_action': [self.admin_user.id],
+        })
+
+        self.assertNotIn('password', rows[0])
+        self.assertEqual(rows[1][1], 'admin@example.com')
+        self.assertNotIn(self.admin_user.password, ','.join(rows[1]))
+
+    def test_rows_sent_in_chunks(self):
+        for i in range(5):
+            Tag.objects.create(user=self.admin_user, name=f'Tag {i}')
+
+        chunks = list(exports.csv_rows(
+            Tag.objects.order_by('id'), ['id', 'name'], chunk_size=2
+        ))
+
+        # The header, then 2 + 2 + 1 rows.
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(chunks[-1].count('\n'), 1)
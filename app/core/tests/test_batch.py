@@ -0,0 +1,225 @@
+"""Tests for the batch request endpoint"""
+
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import batch
+from core.models import Tag, Recipe
+
+BATCH_URL = reverse('batch')
+
+
+def create_user(email='user@example.com'):
+    return get_user_model().objects.create_user(
+        email=email, password='testpass123', name='Test'
+    )
+
+
+def token_client(user):
+    """Sub-requests are authenticated with the batch's token"""
+    client = APIClient()
+    token = Token.objects.create(user=user)
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
+
+
+class BatchAPITests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.client = token_client(self.user)
+
+    def batch(self, *requests):
+        return self.client.post(
+            BATCH_URL, {'requests': list(requests)}, format='json'
+        )
+
+    def test_auth_required(self):
+        res = APIClient().post(BATCH_URL, {'requests': []}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_reads_return_in_order(self):
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.batch(
+            {'method': 'GET', 'path': '/api/recipe/tags/'},
+            {'method': 'GET', 'path': '/api/user/me/'},
+            {'method': 'GET', 'path': '/api/recipe/recipes/'},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        tags, me, recipes = res.data['responses']
+        self.assertEqual(tags['status'], 200)
+        self.assertEqual(tags['body'][0]['name'], 'Vegan')
+        self.assertEqual(me['body']['email'], self.user.email)
+        self.assertEqual(recipes['body'], [])
+
+    def test_writes_run_in_order(self):
+        res = self.batch(
+            {
+                'method': 'POST',
+                'path': '/api/recipe/recipes/',
+                'body': {'title': 'Soup', 'time_minutes': 5, 'price': '2.00'},
+            },
+            {'method': 'GET', 'path': '/api/recipe/recipes/'},
+        )
+
+        created, listed = res.data['responses']
+        self.assertEqual(created['status'], 201)
+        self.assertEqual(listed['body'][0]['id'], created['body']['id'])
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 1)
+
+    def test_sub_requests_only_see_own_data(self):
+        Tag.objects.create(user=create_user('other@example.com'), name='X')
+
+        res = self.batch({'method': 'GET', 'path': '/api/recipe/tags/'})
+
+        self.assertEqual(res.data['responses'][0]['body'], [])
+
+    def test_errors_are_passed_through(self):
+        res = self.batch(
+            {'method': 'GET', 'path': '/api/recipe/recipes/9999/'},
+            {'method': 'GET', 'path': '/api/nothing-here/'},
+            {'method': 'PUT', 'path': '/api/recipe/tags/', 'body': {}},
+        )
+
+        statuses = [r['status'] for r in res.data['responses']]
+        self.assertEqual(statuses, [404, 404, 405])
+
+    def test_headers_are_passed_to_sub_requests(self):
+        item = {
+            'method': 'POST',
+            'path': '/api/recipe/recipes/',
+            'headers': {'Idempotency-Key': 'abc'},
+            'body': {'title': 'Soup', 'time_minutes': 5, 'price': '2.00'},
+        }
+
+        res = self.batch(item, item)
+
+        first, second = res.data['responses']
+        self.assertEqual(second['body'], first['body'])
+        self.assertEqual(second['headers']['Idempotent-Replayed'], 'true')
+        self.assertEqual(Recipe.objects.count(), 1)
+
+    def test_sub_requests_authenticate_with_batch_token(self):
+        """Every sub-request goes through its view's authentication"""
+        with patch(
+            'rest_framework.authentication.TokenAuthentication'
+            '.authenticate_credentials',
+            wraps=TokenAuthentication().authenticate_credentials,
+        ) as check:
+            res = self.batch(
+                {'method': 'GET', 'path': '/api/recipe/tags/'},
+                {'method': 'GET', 'path': '/api/recipe/ingredients/'},
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(check.call_count, 3)
+
+    def test_client_headers_are_restricted(self):
+        for name in ('Authorization', 'X-Forwarded-For', 'Host'):
+            res = self.batch({
+                'method': 'GET',
+                'path': '/api/recipe/tags/',
+                'headers': {name: 'spoofed'},
+            })
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn(name, str(res.data))
+
+    def test_async_views_are_refused(self):
+        res = self.batch(
+            {'method': 'GET', 'path': '/api/recipe/async/recipes/'},
+            {'method': 'GET', 'path': '/api/recipe/tags/'},
+        )
+
+        refused, tags = res.data['responses']
+        self.assertEqual(refused['status'], 400)
+        self.assertEqual(tags['status'], 200)
+
+    @override_settings(RECIPE_SNAPSHOTS_ENABLED=True)
+    def test_streaming_responses_are_read(self):
+        Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5, price=5
+        )
+        res = self.batch(
+            {'method': 'GET', 'path': '/api/recipe/recipes/'},
+            {'method': 'GET', 'path': '/api/recipe/tags/'},
+        )
+
+        streamed, tags = res.data['responses']
+        self.assertEqual(streamed['status'], 200)
+        self.assertEqual(streamed['body'][0]['title'], 'Soup')
+        self.assertEqual(tags['status'], 200)
+
+    @override_settings(RECIPE_SNAPSHOTS_ENABLED=True,
+                       BATCH_MAX_STREAMED_BYTES=10)
+    def test_large_streaming_responses_are_refused(self):
+        Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5, price=5
+        )
+        res = self.batch({'method': 'GET', 'path': '/api/recipe/recipes/'})
+
+        streamed, = res.data['responses']
+        self.assertEqual(streamed['status'], 400)
+        self.assertIn('too large', streamed['body']['detail'])
+
+    def test_rejects_paths_outside_api_and_nesting(self):
+        for path in ('/admin/', 'http://evil.example.com/api/', '/api/batch/'):
+            res = self.batch({'method': 'GET', 'path': path})
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(BATCH_MAX_REQUESTS=2)
+    def test_rejects_too_many_requests(self):
+        item = {'method': 'GET', 'path': '/api/recipe/tags/'}
+
+        res = self.batch(item, item, item)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ParallelBatchTests(TransactionTestCase):
+    """Without a surrounding transaction reads run in worker threads"""
+
+    @override_settings(BATCH_MAX_WORKERS=2)
+    def test_reads_run_in_threads(self):
+        """The threads and their connections last for the whole batch"""
+        user = create_user()
+        Tag.objects.create(user=user, name='Vegan')
+        client = token_client(user)
+        read = {'method': 'GET', 'path': '/api/recipe/tags/'}
+        write = {
+            'method': 'POST', 'path': '/api/recipe/tags/',
+            'body': {'name': 'Lunch'},
+        }
+
+        with patch.object(
+            batch, 'run_one', wraps=batch.run_one
+        ) as run_one, patch.object(
+            batch.threading, 'Thread', wraps=batch.threading.Thread
+        ) as threads, patch.object(
+            batch.connections, 'close_all', wraps=batch.connections.close_all
+        ) as close_all:
+            res = client.post(BATCH_URL, {'requests': [
+                read, read, read, write, read, read,
+            ]}, format='json')
+
+        self.assertEqual(run_one.call_count, 6)
+        self.assertEqual(threads.call_count, 2)
+        self.assertEqual(close_all.call_count, 2)
+        reads = res.data['responses'][:3] + res.data['responses'][4:]
+        for result in reads:
+            self.assertEqual(result['status'], 200)
+            self.assertEqual(result['body'][0]['name'], 'Vegan')
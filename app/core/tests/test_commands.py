@@ -2,18 +2,14 @@
 Test custom Django management commands.
 """
 
+from io import StringIO
+
 # This is used to mock the behavior of the database.
 from unittest.mock import patch
 
-# This is one of the possibilies of the errors if we try to access to early.
-from psycopg2 import OperationalError as Psycopg2Error
-
 # This allows us to call the command that we are testing.
 from django.core.management import call_command
-
-# This could be an error depending on the stage that we
-# request from the database.
-from django.db.utils import OperationalError
+from django.core.management.base import CommandError
 
 # This allows us to test commands. We only need simple as it does not
 # require any db set up.
@@ -22,44 +18,73 @@ from django.test import SimpleTestCase
 
 # Here we are testing the patch method by navigating to the wait_for_db
 # management command.
-# Then we are going to call the command check.
-# Here we are mocking the check method to see how it is going to return
+# Then we are going to mock the probe that opens a raw connection.
+# Here we are mocking the probe to see how it is going to return
 # a response.
 # Adding this decorator will add a new arg to each of the methods.
-@patch('core.management.commands.wait_for_db.Command.check')
+@patch('core.management.commands.wait_for_db.probe_database')
 class CommandTests(SimpleTestCase):
     """Test commands"""
 
-    def test_wait_for_db_ready(self, patched_check):
+    def test_wait_for_db_ready(self, patched_probe):
         """Test waiting for database if database ready."""
 
         # Mock the return value of the database.
-        patched_check.return_value = True
+        patched_probe.return_value = True
 
         # Call the command, this should read the value set above.
-        call_command('wait_for_db')
+        call_command('wait_for_db', stdout=StringIO())
 
-        # The command should execute only once, as when it executes,
+        # The probe should run only once, as when it executes,
         # it should read the returned_value = True and then continue.
-        patched_check.assert_called_once_with(databases=['default'])
+        patched_probe.assert_called_once_with('default')
 
     # By including this here we are able to mock the sleeping of the database
     # without actually requiring it to sleep. Inside out.
     @patch('time.sleep')
-    def test_wait_for_db_delay(self, patched_sleep, patched_check):
-        """Test waiting for database when getting OperationalError"""
+    def test_wait_for_db_delay(self, patched_sleep, patched_probe):
+        """Test waiting for database when it is unavailable"""
 
-        # This odd looking data is a strange aspect of mocking.
-        # The first 2 times that we call the method, raise psycopg2Error,
-        # then 3 OperationalError then returns True.
-        patched_check.side_effect = [Psycopg2Error] * 2 + \
-            [OperationalError] * 3 + [True]
+        # The first 5 probes fail, then the database comes up.
+        patched_probe.side_effect = [False] * 5 + [True]
 
-        call_command('wait_for_db')
+        call_command('wait_for_db', stdout=StringIO())
 
         # There is a call counter for these basic commands.
-        self.assertEqual(patched_check.call_count, 6)
+        self.assertEqual(patched_probe.call_count, 6)
+        patched_probe.assert_called_with('default')
+
+        # The delay grows exponentially, capped by --max-delay.
+        delays = [args[0] for args, _ in patched_sleep.call_args_list]
+        self.assertEqual(len(delays), 5)
+        self.assertTrue(0.05 <= delays[0] <= 0.1)
+        self.assertTrue(0.8 <= delays[4] <= 1.6)
+
+    @patch('time.sleep')
+    def test_wait_for_db_timeout(self, patched_sleep, patched_probe):
+        """Test the command fails once the timeout is reached"""
+        patched_probe.return_value = False
+
+        with patch('time.monotonic', side_effect=[0, 1, 2, 11]):
+            with self.assertRaises(CommandError):
+                call_command('wait_for_db', timeout=10, stdout=StringIO())
+
+        self.assertEqual(patched_probe.call_count, 3)
+
+    def test_wait_for_multiple_databases(self, patched_probe):
+        """Test every configured database is probed"""
+        patched_probe.return_value = True
+
+        with patch(
+            'core.management.commands.wait_for_db.settings'
+        ) as patched_settings:
+            patched_settings.DATABASES = {'default': {}, 'replica': {}}
+            call_command('wait_for_db', stdout=StringIO())
+
+        probed = sorted(args[0] for args, _ in patched_probe.call_args_list)
+        self.assertEqual(probed, ['default', 'replica'])
 
-        # This checks to ensure that it was called with the databases,
-        # this checks the arguments that are being passed.
-        patched_check.assert_called_with(databases=['default'])
+    def test_unknown_database(self, patched_probe):
+        """Test asking for an unconfigured database is an error"""
+        with self.assertRaises(CommandError):
+            call_command('wait_for_db', database=['nope'], stdout=StringIO())
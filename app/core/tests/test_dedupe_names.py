@@ -0,0 +1,38 @@
+"""Tests for the dedupe_names management command"""
+
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from core import models
+
+
+class DedupeNamesTests(TestCase):
+    """Test backfilling normalized names"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'
+        )
+
+    def test_backfill(self):
+        """Rows from before the column existed get a normalized name"""
+        tag = models.Tag.objects.create(user=self.user, name='Ice  Cream')
+        ingredient = models.Ingredient.objects.create(
+            user=self.user, name='SALT'
+        )
+        # What the rows look like before the backfill.
+        models.Tag.objects.update(normalized_name='')
+        models.Ingredient.objects.update(normalized_name='')
+
+        out = StringIO()
+        call_command('dedupe_names', batch_size=1, stdout=out)
+
+        tag.refresh_from_db()
+        ingredient.refresh_from_db()
+        self.assertEqual(tag.normalized_name, 'ice cream')
+        self.assertEqual(ingredient.normalized_name, 'salt')
+        self.assertIn('tag: 1 names normalized, 0 duplicates merged',
+                      out.getvalue())
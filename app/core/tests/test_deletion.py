@@ -0,0 +1,92 @@
+"""Tests for deleting users in batches"""
+
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from rest_framework.authtoken.models import Token
+
+from core import models
+from core.deletion import delete_user_in_batches
+
+
+def create_catalog(user, recipes=5):
+    """Give a user some recipes with tags and ingredients"""
+    tags = [
+        models.Tag.objects.create(user=user, name=f'Tag {i}')
+        for i in range(3)
+    ]
+    ingredients = [
+        models.Ingredient.objects.create(user=user, name=f'Ingredient {i}')
+        for i in range(4)
+    ]
+    for i in range(recipes):
+        recipe = models.Recipe.objects.create(
+            user=user,
+            title=f'Recipe {i}',
+            time_minutes=5,
+            price=Decimal('5.50'),
+        )
+        recipe.tags.add(*tags)
+        recipe.ingredients.add(*ingredients)
+
+
+class DeleteUserTests(TestCase):
+    """Test the batched user deletion"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'
+        )
+        self.other = get_user_model().objects.create_user(
+            email='other@example.com', password='testpass123'
+        )
+        create_catalog(self.user)
+        create_catalog(self.other, recipes=2)
+        Token.objects.create(user=self.user)
+
+    def assert_deleted(self):
+        self.assertFalse(
+            get_user_model().objects.filter(id=self.user.id).exists()
+        )
+        for model in (models.Recipe, models.Tag, models.Ingredient):
+            self.assertFalse(model.objects.filter(user=self.user).exists())
+        self.assertFalse(Token.objects.filter(user_id=self.user.id).exists())
+
+        # The other user is untouched.
+        self.assertEqual(models.Recipe.objects.count(), 2)
+        self.assertEqual(models.Recipe.tags.through.objects.count(), 6)
+        self.assertEqual(models.Recipe.ingredients.through.objects.count(), 8)
+
+    def test_delete_in_batches(self):
+        """Everything is deleted, in batches of the requested size"""
+        progress = []
+
+        totals = delete_user_in_batches(
+            self.user.id,
+            batch_size=4,
+            progress=lambda label, done: progress.append((label, done)),
+        )
+
+        self.assert_deleted()
+        self.assertEqual(totals['recipe tags'], 15)
+        self.assertEqual(totals['recipe ingredients'], 20)
+        self.assertEqual(totals['recipes'], 5)
+        # 15 link rows in batches of 4 means 4 batches.
+        self.assertEqual(
+            [done for label, done in progress if label == 'recipe tags'],
+            [4, 8, 12, 15],
+        )
+
+    def test_delete_user_command(self):
+        """The management command deletes the account and reports"""
+        out = StringIO()
+        call_command(
+            'delete_user', self.user.email, batch_size=10, stdout=out
+        )
+
+        self.assert_deleted()
+        self.assertIn('recipes: 5 deleted', out.getvalue())
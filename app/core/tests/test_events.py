@@ -0,0 +1,309 @@
+"""Tests for the change notifications and their event stream"""
+
+import asyncio
+import json
+from unittest.mock import call, patch
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import events, sse
+from core.models import Tag
+
+EVENTS_TICKET_URL = reverse('events-ticket')
+
+
+def create_user(email='user@example.com'):
+    return get_user_model().objects.create_user(
+        email=email, password='testpass123'
+    )
+
+
+class PublishTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        patcher = patch.object(events, 'get_broker')
+        self.broker = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+
+    def published(self):
+        return [call.args for call in self.broker.publish.call_args_list]
+
+    def test_sent_on_commit_only(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            events.publish(self.user.id, 'recipe', 'updated', [2, 1])
+            self.assertFalse(self.broker.publish.called)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.published(), [
+            (self.user.id, {'type': 'recipe', 'action': 'updated',
+                            'ids': [1, 2]}),
+        ])
+
+    def test_failed_publish_is_logged(self):
+        """The committed write and the callbacks after it go on"""
+        self.broker.publish.side_effect = RuntimeError('payload too large')
+        later = []
+
+        with self.assertLogs('core.events', 'ERROR'), \
+                self.captureOnCommitCallbacks(execute=True):
+            events.publish(self.user.id, 'recipe', 'updated', [1])
+            events.publish(self.user.id, 'tag', 'updated', [2])
+            transaction.on_commit(lambda: later.append(True))
+
+        self.assertEqual(self.broker.publish.call_count, 2)
+        self.assertEqual(later, [True])
+
+    def test_recipe_writes_publish(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(
+                reverse('recipe:recipe-list'),
+                {'title': 'Soup', 'time_minutes': 5, 'price': '1.00'},
+            )
+        recipe_id = res.data['id']
+        url = reverse('recipe:recipe-detail', args=[recipe_id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(url, {'title': 'Stew'})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(url)
+
+        self.assertEqual(
+            [message['action'] for _, message in self.published()],
+            ['created', 'updated', 'deleted'],
+        )
+        for user_id, message in self.published():
+            self.assertEqual(user_id, self.user.id)
+            self.assertEqual(message['ids'], [recipe_id])
+
+    def test_tag_rename_publishes_tag_and_recipes(self):
+        tag = Tag.objects.create(user=self.user, name='Hot')
+        res = self.client.post(
+            reverse('recipe:recipe-list'),
+            {'title': 'Soup', 'time_minutes': 5, 'price': '1.00',
+             'tags': [{'name': 'Hot'}]},
+            format='json',
+        )
+        self.broker.reset_mock()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                reverse('recipe:tag-detail', args=[tag.id]), {'name': 'Mild'}
+            )
+
+        self.assertEqual([message for _, message in self.published()], [
+            {'type': 'tag', 'action': 'updated', 'ids': [tag.id]},
+            {'type': 'recipe', 'action': 'updated', 'ids': [res.data['id']]},
+        ])
+
+
+class LocalBrokerTests(TestCase):
+
+    async def test_fan_out_per_user(self):
+        broker = events.LocalBroker()
+        first = broker.subscribe(1)
+        second = broker.subscribe(1)
+        other = broker.subscribe(2)
+
+        broker.publish(1, {'type': 'recipe'})
+        await asyncio.sleep(0)
+
+        self.assertEqual(await first.get(), {'type': 'recipe'})
+        self.assertEqual(await second.get(), {'type': 'recipe'})
+        self.assertTrue(other.queue.empty())
+
+    async def test_overflow_asks_for_resync(self):
+        broker = events.LocalBroker()
+        with self.settings(EVENTS_QUEUE_SIZE=2):
+            subscription = broker.subscribe(1)
+        for i in range(3):
+            broker.publish(1, {'type': 'recipe', 'ids': [i]})
+        await asyncio.sleep(0)
+
+        self.assertEqual(await subscription.get(), {'type': 'resync'})
+        self.assertTrue(subscription.queue.empty())
+
+    async def test_closed_subscriptions_get_nothing(self):
+        broker = events.LocalBroker()
+        subscription = broker.subscribe(1)
+        subscription.close()
+
+        broker.publish(1, {'type': 'recipe'})
+        await asyncio.sleep(0)
+
+        self.assertTrue(subscription.queue.empty())
+
+
+class PostgresBrokerTests(TestCase):
+
+    def test_large_messages_are_split(self):
+        broker = events.PostgresBroker()
+        ids = list(range(1000000, 1003000))
+
+        payloads = broker.payloads(7, {
+            'type': 'recipe', 'action': 'updated', 'ids': ids,
+        })
+
+        self.assertGreater(len(payloads), 1)
+        sent = []
+        for payload in payloads:
+            self.assertLess(len(payload.encode()), 8000)
+            data = json.loads(payload)
+            self.assertEqual(data['user'], 7)
+            self.assertEqual(data['message']['action'], 'updated')
+            sent.extend(data['message']['ids'])
+        self.assertEqual(sent, ids)
+
+    def test_small_message_is_one_payload(self):
+        broker = events.PostgresBroker()
+
+        payloads = broker.payloads(7, {'type': 'tag', 'ids': [1, 2]})
+
+        self.assertEqual([json.loads(payload) for payload in payloads], [
+            {'user': 7, 'message': {'type': 'tag', 'ids': [1, 2]}},
+        ])
+
+    def test_listener_reconnects(self):
+        broker = events.PostgresBroker()
+        broker.retry_seconds = 0
+
+        with patch.object(broker, '_listen_once', side_effect=[
+            OSError('connection lost'), SystemExit,
+        ]) as listen_once, self.assertLogs('core.events', 'ERROR'), \
+                self.assertRaises(SystemExit):
+            broker._listen()
+
+        self.assertEqual(listen_once.call_args_list, [call(False), call(True)])
+
+    async def test_resync_all(self):
+        broker = events.PostgresBroker()
+        # Without starting a listener.
+        subscription = events.LocalBroker.subscribe(broker, 1)
+
+        broker.resync_all()
+        await asyncio.sleep(0)
+
+        self.assertEqual(await subscription.get(), {'type': 'resync'})
+
+
+class EventStreamTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.token = Token.objects.create(user=self.user)
+        self.broker = events.LocalBroker()
+        patcher = patch.object(sse, 'get_broker', return_value=self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def stream(self, scope, on_body=None):
+        """Run the app, return the messages it sent"""
+        sent = []
+        disconnect = asyncio.Event()
+
+        async def receive():
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+            if message['type'] == 'http.response.body':
+                if on_body is None or on_body(message['body']):
+                    disconnect.set()
+
+        scope = dict({
+            'type': 'http', 'method': 'GET', 'path': sse.PATH,
+            'headers': [], 'query_string': b'',
+        }, **scope)
+        await asyncio.wait_for(sse.events_app(scope, receive, send), 5)
+        return sent
+
+    def ticket(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        res = client.post(EVENTS_TICKET_URL)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        return res.data['ticket']
+
+    async def test_requires_token(self):
+        sent = await self.stream({})
+
+        self.assertEqual(sent[0]['status'], 401)
+
+    async def test_token_not_accepted_in_query(self):
+        """It would end up in the access logs"""
+        sent = await self.stream(
+            {'query_string': f'token={self.token.key}'.encode()}
+        )
+
+        self.assertEqual(sent[0]['status'], 401)
+
+    async def test_ticket_is_single_use(self):
+        ticket = await sync_to_async(self.ticket)()
+        scope = {'query_string': f'ticket={ticket}'.encode()}
+
+        first = await self.stream(scope)
+        second = await self.stream(scope)
+
+        self.assertEqual(first[0]['status'], 200)
+        self.assertEqual(second[0]['status'], 401)
+
+    def test_ticket_requires_authentication(self):
+        res = APIClient().post(EVENTS_TICKET_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_streams_user_events(self):
+        def on_body(body):
+            if b'event: ready' in body:
+                self.broker.publish(self.user.id, {'type': 'recipe',
+                                                   'ids': [7]})
+                self.broker.publish(self.user.id + 1, {'type': 'other'})
+                return False
+            return True
+
+        ticket = await sync_to_async(self.ticket)()
+        sent = await self.stream(
+            {'query_string': f'ticket={ticket}'.encode()}, on_body
+        )
+
+        start, ready, event = sent
+        self.assertEqual(start['status'], 200)
+        self.assertIn(
+            (b'content-type', b'text/event-stream'), start['headers']
+        )
+        self.assertEqual(event['body'], sse.format_event(
+            {'type': 'recipe', 'ids': [7]}
+        ))
+        self.assertEqual(self.broker._subscriptions, {})
+
+    async def test_token_header_and_heartbeat(self):
+        with self.settings(EVENTS_HEARTBEAT_SECONDS=0.01):
+            sent = await self.stream(
+                {'headers': [(
+                    b'authorization', f'Token {self.token.key}'.encode()
+                )]},
+                lambda body: body == b': ping\n\n',
+            )
+
+        self.assertEqual(sent[-1]['body'], b': ping\n\n')
+
+    def test_format_event(self):
+        message = {'type': 'recipe', 'action': 'deleted', 'ids': [1]}
+
+        self.assertEqual(
+            sse.format_event(message),
+            b'event: recipe\ndata: ' + json.dumps(message).encode() + b'\n\n',
+        )
@@ -0,0 +1,117 @@
+"""Tests for the gc_orphans management command"""
+
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from core import models
+from core.orphans import delete_orphan_batch, delete_orphans, orphaned
+
+
+class GcOrphansTests(TestCase):
+    """Test deleting unreferenced tags and ingredients"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'
+        )
+        self.recipe = models.Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=5,
+            price=Decimal('5.50'),
+        )
+        self.used_tag = models.Tag.objects.create(user=self.user, name='Used')
+        self.used_ingredient = models.Ingredient.objects.create(
+            user=self.user, name='Salt'
+        )
+        self.recipe.tags.add(self.used_tag)
+        self.recipe.ingredients.add(self.used_ingredient)
+
+        self.orphan_tags = [
+            models.Tag.objects.create(user=self.user, name=f'Orphan {i}')
+            for i in range(5)
+        ]
+        models.Ingredient.objects.create(user=self.user, name='Pepper')
+
+    def test_orphaned_queryset(self):
+        """Only unlinked rows are orphans"""
+        self.assertEqual(
+            set(orphaned(models.Tag)), set(self.orphan_tags)
+        )
+
+    def test_delete_rechecks_links_in_one_statement(self):
+        """The delete itself checks the links, in the same statement"""
+        picked_up = self.orphan_tags[0]
+        self.recipe.tags.add(picked_up)
+
+        with CaptureQueriesContext(connection) as context:
+            _, deleted = delete_orphan_batch(models.Tag)
+
+        self.assertEqual(deleted, 4)
+        self.assertEqual(
+            set(models.Tag.objects.all()), {self.used_tag, picked_up}
+        )
+        deletes = [query['sql'] for query in context.captured_queries
+                   if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 1)
+        self.assertIn('NOT EXISTS', deletes[0])
+
+    def test_delete_given_orphans_of_a_user(self):
+        """Only the given ids of that user are deleted, if still orphans"""
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='testpass123'
+        )
+        foreign = models.Tag.objects.create(user=other, name='Foreign')
+        ids = [self.used_tag.id, self.orphan_tags[0].id, foreign.id]
+
+        with CaptureQueriesContext(connection) as context:
+            deleted = delete_orphans(models.Tag, ids, user_id=self.user.id)
+
+        self.assertEqual(deleted, 1)
+        self.assertFalse(
+            models.Tag.objects.filter(id=self.orphan_tags[0].id).exists()
+        )
+        self.assertTrue(models.Tag.objects.filter(id=foreign.id).exists())
+        self.assertEqual(len(context.captured_queries), 1)
+
+    def test_gc_orphans(self):
+        """Orphans are deleted in batches, linked rows are kept"""
+        out = StringIO()
+        call_command('gc_orphans', batch_size=2, stdout=out)
+
+        self.assertEqual(list(models.Tag.objects.all()), [self.used_tag])
+        self.assertEqual(
+            list(models.Ingredient.objects.all()), [self.used_ingredient]
+        )
+        # 5 orphan tags in batches of 2.
+        self.assertEqual(out.getvalue().count('tag: deleted'), 3)
+        self.assertIn('tag: 5 orphans deleted', out.getvalue())
+
+    def test_resume(self):
+        """A run can resume after the last id it reported"""
+        resume_after = self.orphan_tags[2].id
+
+        call_command(
+            'gc_orphans', model=['tag'], start_after=resume_after,
+            stdout=StringIO(),
+        )
+
+        remaining = set(models.Tag.objects.all())
+        self.assertEqual(
+            remaining, {self.used_tag, *self.orphan_tags[:3]}
+        )
+
+    def test_dry_run(self):
+        """Dry runs only count"""
+        out = StringIO()
+        call_command('gc_orphans', dry_run=True, stdout=out)
+
+        self.assertIn('tag: 5 orphans', out.getvalue())
+        self.assertIn('ingredient: 1 orphans', out.getvalue())
+        self.assertEqual(models.Tag.objects.count(), 6)
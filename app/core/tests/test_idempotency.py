@@ -0,0 +1,202 @@
+"""Tests for Idempotency-Key handling on create endpoints"""
+
+import hashlib
+import json
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import IdempotencyRecord, Recipe
+
+RECIPE_URL = reverse('recipe:recipe-list')
+CREATE_USER_URL = reverse('user:create')
+
+PAYLOAD = {'title': 'Soup', 'time_minutes': 10, 'price': '4.50'}
+
+
+class IdempotencyTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, payload, key='abc'):
+        return self.client.post(
+            RECIPE_URL, payload, format='json', HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def test_retry_replays_response(self):
+        """Retrying with the same key returns the first response"""
+        first = self.post(PAYLOAD)
+        second = self.post(PAYLOAD)
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Recipe.objects.count(), 1)
+
+    def test_replay_from_database_when_cache_is_empty(self):
+        first = self.post(PAYLOAD)
+        cache.clear()
+        second = self.post(PAYLOAD)
+
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(Recipe.objects.count(), 1)
+
+    def test_different_keys_create_twice(self):
+        self.post(PAYLOAD, key='one')
+        self.post(PAYLOAD, key='two')
+
+        self.assertEqual(Recipe.objects.count(), 2)
+
+    def test_no_key_is_not_idempotent(self):
+        self.client.post(RECIPE_URL, PAYLOAD, format='json')
+        self.client.post(RECIPE_URL, PAYLOAD, format='json')
+
+        self.assertEqual(Recipe.objects.count(), 2)
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+    def test_same_key_different_body_rejected(self):
+        self.post(PAYLOAD)
+        res = self.post(dict(PAYLOAD, title='Stew'))
+
+        self.assertEqual(res.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Recipe.objects.count(), 1)
+
+    def test_key_in_progress_conflicts(self):
+        """A duplicate of a request still being processed gets a 409"""
+        self.post(PAYLOAD)
+        cache.clear()
+        IdempotencyRecord.objects.update(status_code=None, response=None)
+
+        res = self.post(PAYLOAD)
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Recipe.objects.count(), 1)
+
+    def test_abandoned_key_in_progress_runs_again(self):
+        """The first request died, a retry after its lease goes through"""
+        self.post(PAYLOAD)
+        cache.clear()
+        IdempotencyRecord.objects.update(
+            status_code=None, response=None,
+            expires_at=timezone.now() - timedelta(seconds=1),
+        )
+
+        res = self.post(PAYLOAD)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Recipe.objects.count(), 2)
+        record = IdempotencyRecord.objects.get()
+        # Completed, kept for the whole TTL again.
+        self.assertGreater(
+            record.expires_at, timezone.now() + timedelta(hours=1)
+        )
+
+    def test_expired_key_runs_again(self):
+        self.post(PAYLOAD)
+        cache.clear()
+        IdempotencyRecord.objects.update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+
+        res = self.post(PAYLOAD)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Recipe.objects.count(), 2)
+
+    def test_keys_are_scoped_per_user(self):
+        self.post(PAYLOAD)
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='testpass123'
+        )
+        self.client.force_authenticate(other)
+
+        res = self.post(PAYLOAD)
+
+        self.assertNotIn('Idempotent-Replayed', res)
+        self.assertEqual(Recipe.objects.filter(user=other).count(), 1)
+
+    def test_anonymous_keys_are_scoped_per_address(self):
+        payload = {'email': 'new@example.com', 'password': 'testpass123',
+                   'name': 'New'}
+        APIClient().post(
+            CREATE_USER_URL, payload, HTTP_IDEMPOTENCY_KEY='signup',
+            REMOTE_ADDR='10.0.0.1',
+        )
+
+        res = APIClient().post(
+            CREATE_USER_URL, dict(payload, email='other@example.com'),
+            HTTP_IDEMPOTENCY_KEY='signup', REMOTE_ADDR='10.0.0.2',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('Idempotent-Replayed', res)
+        self.assertEqual(IdempotencyRecord.objects.count(), 2)
+
+    def test_failed_request_can_be_retried(self):
+        """Errors are not stored, a retry with fixed data goes through"""
+        first = self.post({'title': 'No time'})
+        second = self.post(PAYLOAD)
+
+        self.assertEqual(first.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('Idempotent-Replayed', second)
+
+    def test_create_user_is_idempotent(self):
+        payload = {
+            'email': 'new@example.com',
+            'password': 'testpass123',
+            'name': 'New',
+        }
+        client = APIClient()
+        first = client.post(
+            CREATE_USER_URL, payload, HTTP_IDEMPOTENCY_KEY='signup'
+        )
+        second = client.post(
+            CREATE_USER_URL, payload, HTTP_IDEMPOTENCY_KEY='signup'
+        )
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('password', second.data)
+        self.assertEqual(
+            get_user_model().objects.filter(email='new@example.com').count(),
+            1,
+        )
+        # Not a plain hash of the body, that would be one of the password.
+        body = json.dumps(
+            {field: [value] for field, value in payload.items()},
+            sort_keys=True,
+        )
+        plain = hashlib.sha256(
+            '\0'.join(['POST', CREATE_USER_URL, body]).encode()
+        ).hexdigest()
+        self.assertNotEqual(IdempotencyRecord.objects.get().fingerprint, plain)
+
+    def test_purge_expired(self):
+        self.post(PAYLOAD, key='old')
+        self.post(PAYLOAD, key='new')
+        IdempotencyRecord.objects.filter(
+            id=IdempotencyRecord.objects.order_by('id').first().id
+        ).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        out = StringIO()
+        call_command('purge_idempotency_keys', batch_size=1, stdout=out)
+
+        self.assertEqual(IdempotencyRecord.objects.count(), 1)
+        self.assertIn('1 expired idempotency records deleted', out.getvalue())
@@ -0,0 +1,163 @@
+"""Tests for the custom middleware."""
+
+import gzip
+import marshal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import (
+    SimpleTestCase, RequestFactory, TestCase, override_settings
+)
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import middleware
+
+
+def make_middleware(response):
+    """Wrap a fixed response in the compression middleware"""
+    return middleware.CompressionMiddleware(lambda request: response)
+
+
+@override_settings(COMPRESSION_ENABLED=True, COMPRESSION_MIN_SIZE=100)
+@patch('core.middleware.brotli', None)
+class CompressionMiddlewareTests(SimpleTestCase):
+    """Test the response compression middleware"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.body = b'{"title": "sample recipe title"}' * 50
+
+    def test_disabled_by_default(self):
+        """The middleware removes itself unless it is enabled"""
+        with override_settings(COMPRESSION_ENABLED=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                make_middleware(HttpResponse())
+
+    def test_compresses_large_response(self):
+        """Large responses are gzipped when the client accepts gzip"""
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip, br')
+        res = make_middleware(HttpResponse(self.body))(request)
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(res.content), self.body)
+        self.assertEqual(res['Content-Length'], str(len(res.content)))
+        self.assertIn('Accept-Encoding', res['Vary'])
+
+    def test_small_response_untouched(self):
+        """Responses under the size threshold are sent as is"""
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip')
+        res = make_middleware(HttpResponse(b'small'))(request)
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+        self.assertEqual(res.content, b'small')
+
+    def test_not_accepted(self):
+        """Nothing is compressed when the client refuses gzip"""
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        res = make_middleware(HttpResponse(self.body))(request)
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', res['Vary'])
+
+    def test_vary_on_authorization(self):
+        """Token authenticated responses also vary on Authorization"""
+        request = self.factory.get(
+            '/',
+            HTTP_ACCEPT_ENCODING='gzip',
+            HTTP_AUTHORIZATION='Token abc',
+        )
+        res = make_middleware(HttpResponse(self.body))(request)
+
+        self.assertIn('Authorization', res['Vary'])
+
+    def test_exempt_path(self):
+        """Responses for exempt paths are never compressed"""
+        request = self.factory.get(
+            '/api/user/token/', HTTP_ACCEPT_ENCODING='gzip'
+        )
+        res = make_middleware(HttpResponse(self.body))(request)
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+
+    def test_streaming_response(self):
+        """Each streamed chunk is flushed and the whole body decodes"""
+        chunks = [b'a' * 500, b'b' * 500, b'c' * 500]
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip')
+        res = make_middleware(StreamingHttpResponse(iter(chunks)))(request)
+
+        parts = list(res.streaming_content)
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        # One part per chunk plus the gzip trailer.
+        self.assertEqual(len(parts), len(chunks) + 1)
+        self.assertEqual(gzip.decompress(b''.join(parts)), b''.join(chunks))
+
+    def test_choose_encoding(self):
+        """The preferred available coding accepted by the client wins"""
+        self.assertEqual(
+            middleware.choose_encoding('gzip, br', ('br', 'gzip')), 'br'
+        )
+        self.assertEqual(
+            middleware.choose_encoding('br;q=0, *', ('br', 'gzip')), 'gzip'
+        )
+        self.assertIsNone(middleware.choose_encoding('identity', ('gzip',)))
+
+
+@override_settings(PROFILING_ENABLED=True)
+class ProfilingMiddlewareTests(TestCase):
+    """Test the on demand profiling of staff requests"""
+
+    def setUp(self):
+        self.staff = get_user_model().objects.create_user(
+            email='staff@example.com', password='testpass123', is_staff=True
+        )
+        self.token = Token.objects.create(user=self.staff)
+        # Built after the settings are overridden, so it has the middleware.
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.url = reverse('recipe:recipe-list')
+
+    def test_disabled_by_default(self):
+        with override_settings(PROFILING_ENABLED=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                middleware.ProfilingMiddleware(lambda r: HttpResponse())
+
+    def test_not_requested(self):
+        res = self.client.get(self.url)
+
+        self.assertEqual(res['Content-Type'], 'application/json')
+
+    def test_text_profile_covers_the_view(self):
+        res = self.client.get(self.url, HTTP_X_PROFILE='1')
+
+        self.assertEqual(res['X-Profiled-Status'], '200')
+        self.assertTrue(res['Content-Type'].startswith('text/plain'))
+        content = res.content.decode()
+        self.assertIn('cumulative', content)
+        self.assertIn('authentication.py', content)
+
+    def test_pstats_dump(self):
+        res = self.client.get(self.url, {'profile': 'pstats'})
+
+        stats = marshal.loads(res.content)
+        self.assertTrue(any(
+            'serializers' in filename for filename, _, _ in stats
+        ))
+
+    def test_non_staff_not_profiled(self):
+        user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'
+        )
+        token = Token.objects.create(user=user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        res = client.get(self.url, HTTP_X_PROFILE='1')
+
+        self.assertEqual(res['Content-Type'], 'application/json')
+        self.assertFalse(res.has_header('X-Profiled-Status'))
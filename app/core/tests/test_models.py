@@ -4,6 +4,7 @@ from decimal import Decimal
 
 # We need to use test case because this will work with the db.
 # Reference the db changes that are made in create_user.
+from django.db import IntegrityError
 from django.test import TestCase
 # Get user model will stay up to date even if you updated it. BP
 from django.contrib.auth import get_user_model
@@ -109,4 +110,22 @@ class ModelTests(TestCase):
         )
 
         # String reps of the instance is the best way to show succ.
-        self.assertEqual(str(ingredient), ingredient.name)
\ No newline at end of file
+        self.assertEqual(str(ingredient), ingredient.name)
+
+    def test_tag_normalized_name(self):
+        """Case and whitespace variants of a tag name clash"""
+        user = create_user()
+        tag = models.Tag.objects.create(user=user, name='  Ice   Cream ')
+
+        self.assertEqual(tag.normalized_name, 'ice cream')
+        with self.assertRaises(IntegrityError):
+            models.Tag.objects.create(user=user, name='ice cream')
+
+    def test_ingredient_names_per_user(self):
+        """Different users may have the same ingredient name"""
+        user = create_user()
+        other = create_user(email='other@example.com')
+        models.Ingredient.objects.create(user=user, name='Salt')
+        ingredient = models.Ingredient.objects.create(user=other, name='salt')
+
+        self.assertEqual(ingredient.normalized_name, 'salt')
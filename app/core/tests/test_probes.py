@@ -0,0 +1,94 @@
+"""Tests for the database probes and the readiness endpoint"""
+
+import threading
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from core import probes, views
+
+READINESS_URL = reverse('readiness')
+
+
+class ProbeTests(TestCase):
+    """Test the raw connection probe"""
+
+    def test_probe_available_database(self):
+        """The configured test database is reachable"""
+        self.assertTrue(probes.probe_database('default'))
+
+    def test_probe_failure(self):
+        """A refused connection is reported, not raised"""
+        with patch.object(
+            probes.connections['default'], 'get_new_connection',
+            side_effect=probes.DatabaseError,
+        ):
+            self.assertFalse(probes.probe_database('default'))
+
+    def test_connect_timeout_passed(self):
+        """Postgres is told how long to wait for the server"""
+        wrapper = probes.connections['default']
+        with patch.object(wrapper, 'vendor', 'postgresql'), \
+                patch.object(wrapper, 'get_new_connection') as connect:
+            probes.probe_database('default', timeout=2.5)
+
+        self.assertEqual(connect.call_args.args[0]['connect_timeout'], 3)
+
+
+@patch('core.probes.probe_database')
+class ReadinessTests(SimpleTestCase):
+    """Test the readiness endpoint"""
+
+    def setUp(self):
+        views.readiness_probe.reset()
+
+    def test_ready(self, patched_probe):
+        """200 when the databases are up"""
+        patched_probe.return_value = True
+
+        res = self.client.get(READINESS_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['databases'], {'default': True})
+
+    def test_not_ready(self, patched_probe):
+        """503 when a database is down"""
+        patched_probe.return_value = False
+
+        res = self.client.get(READINESS_URL)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json()['status'], 'unavailable')
+
+    def test_result_cached(self, patched_probe):
+        """The probe result is reused within the TTL"""
+        patched_probe.return_value = True
+
+        self.client.get(READINESS_URL)
+        self.client.get(READINESS_URL)
+
+        self.assertEqual(patched_probe.call_count, 1)
+
+    def test_previous_result_while_probing(self, patched_probe):
+        """Requests don't queue behind a probe that is running"""
+        probe = views.readiness_probe
+        patched_probe.return_value = True
+        probe.check(['default'])
+        probe._checked_at -= probe.ttl
+
+        started, release = threading.Event(), threading.Event()
+
+        def slow_probe(alias):
+            started.set()
+            release.wait(5)
+            return False
+        patched_probe.side_effect = slow_probe
+        thread = threading.Thread(target=probe.check, args=(['default'],))
+        thread.start()
+        started.wait(5)
+
+        self.assertEqual(probe.check(['default']), {'default': True})
+        release.set()
+        thread.join()
+        self.assertEqual(probe.check(['default']), {'default': False})
@@ -0,0 +1,200 @@
+"""Tests for the sampled slow query log"""
+
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import request_finished
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import middleware, querylog
+from core.models import Recipe
+
+SLOW_QUERIES_URL = reverse('slow-queries')
+
+
+def create_user(**params):
+    return get_user_model().objects.create_user(
+        email=params.pop('email', 'user@example.com'),
+        password='testpass123', **params
+    )
+
+
+@override_settings(
+    SLOW_QUERY_LOG_ENABLED=True,
+    SLOW_QUERY_LOG_SAMPLE_RATE=1,
+    SLOW_QUERY_LOG_THRESHOLD_MS=0,
+)
+class SlowQueryLogTests(TestCase):
+
+    def setUp(self):
+        querylog.log.clear()
+        self.addCleanup(querylog.log.clear)
+        self.user = create_user()
+        # Built after the settings are overridden, so it has the middleware.
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_disabled_by_default(self):
+        with override_settings(SLOW_QUERY_LOG_ENABLED=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                middleware.SlowQueryLogMiddleware(lambda r: HttpResponse())
+
+    def test_records_queries_with_request(self):
+        self.client.get(reverse('recipe:recipe-list'))
+
+        entries = querylog.log.recent()
+        self.assertTrue(entries)
+        entry = next(e for e in entries if 'core_recipe' in e['sql'])
+        self.assertEqual(entry['url_name'], 'recipe:recipe-list')
+        self.assertEqual(entry['user_id'], self.user.id)
+        self.assertEqual(entry['method'], 'GET')
+        # No query plans on sqlite.
+        self.assertIsNone(entry['plan'])
+
+    def test_credentials_are_redacted(self):
+        token = Token.objects.create(user=self.user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        client.patch(reverse('user:me'), {'password': 'newpass123'})
+
+        entries = querylog.log.recent()
+        lookup = next(e for e in entries if 'authtoken_token' in e['sql'])
+        update = next(e for e in entries if e['sql'].startswith('UPDATE'))
+        for entry in (lookup, update):
+            self.assertEqual(entry['params'], querylog.REDACTED)
+            self.assertIsNone(entry['plan'])
+        self.assertNotIn(token.key, str(entries))
+        self.user.refresh_from_db()
+        self.assertNotIn(self.user.password, str(entries))
+
+    def test_recorded_once_the_response_is_sent(self):
+        def view(request):
+            list(Recipe.objects.all())
+            return HttpResponse()
+
+        request = RequestFactory().get('/api/recipe/recipes/')
+        response = middleware.SlowQueryLogMiddleware(view)(request)
+        self.assertEqual(querylog.log.recent(), [])
+
+        # What the test client does, the test transaction must stay open.
+        request_finished.disconnect(close_old_connections)
+        try:
+            response.close()
+        finally:
+            request_finished.connect(close_old_connections)
+        self.assertTrue(querylog.log.recent())
+
+    def test_not_sampled(self):
+        with self.settings(SLOW_QUERY_LOG_SAMPLE_RATE=0):
+            client = APIClient()
+            client.force_authenticate(self.user)
+            client.get(reverse('recipe:recipe-list'))
+
+        self.assertEqual(querylog.log.recent(), [])
+
+    def test_ring_buffer_keeps_newest(self):
+        log = querylog.SlowQueryLog(2)
+        for i in range(3):
+            log.add({'n': i})
+
+        self.assertEqual(log.recent(), [{'n': 2}, {'n': 1}])
+
+    def test_staff_only_endpoint(self):
+        res = self.client.get(SLOW_QUERIES_URL)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        staff = create_user(email='staff@example.com', is_staff=True)
+        self.client.force_authenticate(staff)
+        self.client.get(reverse('recipe:tag-list'))
+
+        res = self.client.get(SLOW_QUERIES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.data['enabled'])
+        self.assertEqual(
+            res.data['entries'][0]['url_name'], 'recipe:tag-list'
+        )
+
+        res = self.client.delete(SLOW_QUERIES_URL)
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(querylog.log.recent(), [])
+
+
+class ExplainTests(TestCase):
+
+    def postgres(self):
+        connection = MagicMock(vendor='postgresql', alias='default')
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = [('Seq Scan on core_recipe',)]
+        return connection, cursor
+
+    def test_select_is_explained(self):
+        connection, cursor = self.postgres()
+
+        plan = querylog.explain(connection, 'SELECT 1 WHERE %s', [1])
+
+        self.assertEqual(plan, ['Seq Scan on core_recipe'])
+        cursor.execute.assert_called_once_with(
+            'EXPLAIN (ANALYZE, BUFFERS) SELECT 1 WHERE %s', [1]
+        )
+
+    def test_explain_is_rolled_back(self):
+        connection, cursor = self.postgres()
+
+        with patch.object(
+            querylog.transaction, 'set_rollback',
+            wraps=querylog.transaction.set_rollback,
+        ) as set_rollback:
+            querylog.explain(connection, 'SELECT COUNT(*) FROM x', [])
+
+        self.assertTrue(cursor.execute.called)
+        set_rollback.assert_called_once_with(True, using='default')
+
+    def test_side_effects_are_not_explained(self):
+        for sql in (
+            'SELECT pg_notify(%s, %s)',
+            'SELECT "core_recipe"."id" FROM "core_recipe" FOR UPDATE',
+            'SELECT * FROM "core_task" FOR NO KEY UPDATE SKIP LOCKED',
+            "SELECT nextval('core_recipe_id_seq')",
+            'WITH x AS (DELETE FROM core_recipe RETURNING id) SELECT * '
+            'FROM x',
+        ):
+            self.assertFalse(querylog.explainable(sql), sql)
+        self.assertTrue(querylog.explainable(
+            'SELECT COUNT(*) AS "n" FROM "core_recipe" WHERE EXISTS('
+            'SELECT 1 FROM "core_tag" WHERE "core_tag"."id" IN (%s, %s))'
+        ))
+
+    def test_credential_queries_are_not_explained(self):
+        connection, cursor = self.postgres()
+        connection.alias = 'default'
+        timer = querylog.QueryTimer(0)
+        timer.slow.append((
+            connection,
+            'SELECT * FROM "authtoken_token" WHERE "key" = %s',
+            ['secret'], False, 0.5,
+        ))
+        querylog.log.clear()
+        self.addCleanup(querylog.log.clear)
+
+        querylog.record(timer, MagicMock(user=None, resolver_match=None))
+
+        self.assertFalse(cursor.execute.called)
+        entry, = querylog.log.recent()
+        self.assertEqual(entry['params'], querylog.REDACTED)
+
+    def test_writes_are_not_explained(self):
+        connection, cursor = self.postgres()
+
+        plan = querylog.explain(connection, 'DELETE FROM core_recipe', [])
+
+        self.assertIsNone(plan)
+        self.assertFalse(cursor.execute.called)
@@ -0,0 +1,196 @@
+"""Tests for the background task queue"""
+
+from datetime import timedelta
+from io import StringIO
+from threading import Event
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core import tasks
+from core.models import Task
+
+calls = []
+
+
+@tasks.task(name='tests.record')
+def record(value):
+    calls.append(value)
+
+
+@tasks.task(name='tests.explode', max_attempts=2)
+def explode():
+    raise RuntimeError('boom')
+
+
+def run_worker():
+    out = StringIO()
+    call_command('run_worker', once=True, concurrency=1, stdout=out)
+    return out.getvalue()
+
+
+class TaskQueueTests(TestCase):
+    """Test queueing and running tasks"""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_delay_queues_row(self):
+        """Tasks are stored in the database by default"""
+        record.delay(value=1)
+
+        row = Task.objects.get()
+        self.assertEqual(row.name, 'tests.record')
+        self.assertEqual(row.kwargs, {'value': 1})
+        self.assertEqual(row.status, Task.QUEUED)
+        self.assertEqual(calls, [])
+
+    def test_worker_runs_tasks(self):
+        """The worker runs due tasks and reports their latency"""
+        record.delay(value=1)
+        record.delay(value=2)
+
+        out = run_worker()
+
+        self.assertEqual(sorted(calls), [1, 2])
+        self.assertFalse(Task.objects.exclude(status=Task.DONE).exists())
+        self.assertIn('tests.record: 2 run, 0 failed', out)
+
+    def test_tasks_not_due_are_skipped(self):
+        """Tasks scheduled for later are left alone"""
+        row = record.delay(value=1)
+        row.run_at = timezone.now() + timedelta(minutes=5)
+        row.save()
+
+        run_worker()
+
+        self.assertEqual(calls, [])
+
+    def test_failed_task_retried(self):
+        """A failing task is retried later, then marked failed"""
+        explode.delay()
+
+        run_worker()
+        row = Task.objects.get()
+        self.assertEqual(row.status, Task.QUEUED)
+        self.assertEqual(row.attempts, 1)
+        self.assertGreater(row.run_at, timezone.now())
+        self.assertIn('boom', row.last_error)
+
+        # Make the retry due right away.
+        Task.objects.update(run_at=timezone.now())
+        run_worker()
+        row.refresh_from_db()
+        self.assertEqual(row.status, Task.FAILED)
+        self.assertEqual(row.attempts, 2)
+
+    def test_expired_lease_reclaimed(self):
+        """Tasks left running by a dead worker are run again"""
+        row = record.delay(value=1)
+        Task.objects.update(
+            status=Task.RUNNING,
+            started_at=timezone.now() - timedelta(hours=2),
+        )
+        running = record.delay(value=2)
+        Task.objects.filter(id=running.id).update(
+            status=Task.RUNNING, started_at=timezone.now(),
+        )
+
+        with self.assertLogs('core.tasks', 'WARNING'):
+            run_worker()
+
+        self.assertEqual(calls, [1])
+        row.refresh_from_db()
+        self.assertEqual(row.status, Task.DONE)
+        self.assertEqual(row.attempts, 2)
+        running.refresh_from_db()
+        self.assertEqual(running.status, Task.RUNNING)
+
+    def test_expired_lease_on_last_attempt_fails(self):
+        """A task whose worker died on the last attempt is not rerun"""
+        row = explode.delay()
+        Task.objects.update(
+            status=Task.RUNNING, attempts=1,
+            started_at=timezone.now() - timedelta(hours=2),
+        )
+
+        with self.assertLogs('core.tasks', 'WARNING'):
+            run_worker()
+
+        row.refresh_from_db()
+        self.assertEqual(row.status, Task.FAILED)
+        self.assertEqual(row.attempts, 2)
+        self.assertIn('Lease expired', row.last_error)
+
+    def test_database_error_only_loses_the_task(self):
+        """The worker goes on with the other tasks"""
+        record.delay(value=1)
+        record.delay(value=2)
+        execute = tasks.execute
+
+        def flaky(task_id):
+            if Task.objects.get(id=task_id).kwargs['value'] == 1:
+                raise OperationalError('connection lost')
+            return execute(task_id)
+
+        with patch.object(tasks, 'execute', flaky), \
+                self.assertLogs('core.management.commands.run_worker'):
+            out = run_worker()
+
+        self.assertEqual(calls, [2])
+        self.assertIn('tests.record: 1 run, 0 failed', out)
+
+    def test_free_slot_claims_next_task(self):
+        """A slow task doesn't hold back the tasks claimed after it"""
+        batches = [[1, 2], [3]]
+        requested = []
+        finished = []
+        slow_may_finish = Event()
+
+        def claim(backend, limit):
+            requested.append(limit)
+            if batches:
+                return batches.pop(0)
+            slow_may_finish.set()
+            return []
+
+        def execute(task_id):
+            if task_id == 1:
+                slow_may_finish.wait(5)
+            finished.append(task_id)
+
+        with patch.object(tasks.DatabaseBackend, 'claim', claim), \
+                patch('core.management.commands.run_worker._execute',
+                      execute):
+            call_command(
+                'run_worker', once=True, concurrency=2, poll_interval=0.01,
+                stdout=StringIO(),
+            )
+
+        # Task 3 took the slot of task 2 while task 1 was still running.
+        self.assertEqual(finished, [2, 3, 1])
+        self.assertEqual(requested[:3], [2, 1, 1])
+
+    @override_settings(TASK_QUEUE_BACKEND='core.tasks.ImmediateBackend')
+    def test_immediate_backend(self):
+        """The immediate backend runs the task once committed"""
+        with self.captureOnCommitCallbacks(execute=True):
+            record.delay(value=3)
+
+        self.assertEqual(calls, [3])
+        self.assertFalse(Task.objects.exists())
+
+    def test_metrics_summary(self):
+        """Percentiles are computed per task name"""
+        metrics = tasks.TaskMetrics()
+        for ran in (0.1, 0.2, 0.3, 0.4):
+            metrics.record('a', 0.0, ran, True)
+        metrics.record('a', 0.0, 1.0, False)
+
+        summary = metrics.summary()['a']
+        self.assertEqual(summary['count'], 5)
+        self.assertEqual(summary['failures'], 1)
+        self.assertAlmostEqual(summary['run_p50'], 0.3)
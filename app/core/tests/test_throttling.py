@@ -0,0 +1,190 @@
+"""Tests for the counter based API throttles"""
+
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.checks import check_throttle_cache
+from core.throttling import CounterThrottle, parse_rate
+
+TAGS_URL = reverse('recipe:tag-list')
+TOKEN_URL = reverse('user:token')
+
+
+def rates(**overrides):
+    """REST_FRAMEWORK settings with some throttle rates replaced"""
+    config = dict(settings.REST_FRAMEWORK)
+    config['DEFAULT_THROTTLE_RATES'] = dict(
+        config['DEFAULT_THROTTLE_RATES'], **overrides
+    )
+    return config
+
+
+class ParseRateTests(TestCase):
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('100/min'), (100, 60))
+        self.assertEqual(parse_rate('5/s'), (5, 1))
+        self.assertEqual(parse_rate('1000/day'), (1000, 86400))
+
+
+class CacheCheckTests(TestCase):
+
+    def test_process_local_cache_rejected(self):
+        errors = check_throttle_cache(None)
+
+        self.assertEqual([error.id for error in errors], ['core.E001'])
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': 'memcached:11211',
+    }})
+    def test_shared_cache_accepted(self):
+        self.assertEqual(check_throttle_cache(None), [])
+
+    def test_no_counter_throttles(self):
+        config = dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_CLASSES=[])
+        with self.settings(REST_FRAMEWORK=config):
+            self.assertEqual(check_throttle_cache(None), [])
+
+
+class ThrottleTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Pin the clock to the start of a window.
+        patcher = patch.object(CounterThrottle, 'timer', lambda self: 6000.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_user_limit_sets_retry_after(self):
+        with self.settings(REST_FRAMEWORK=rates(tags='3/min')):
+            for _ in range(3):
+                res = self.client.get(TAGS_URL)
+                self.assertEqual(res.status_code, status.HTTP_200_OK)
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res['Retry-After'], '60')
+
+    def test_limit_is_per_user(self):
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='testpass123'
+        )
+        with self.settings(REST_FRAMEWORK=rates(tags='1/min')):
+            self.client.get(TAGS_URL)
+            self.client.force_authenticate(other)
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_scopes_are_separate(self):
+        with self.settings(REST_FRAMEWORK=rates(tags='1/min')):
+            self.client.get(TAGS_URL)
+            res = self.client.get(reverse('recipe:ingredient-list'))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_global_limit_covers_all_users(self):
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='testpass123'
+        )
+        with self.settings(REST_FRAMEWORK=rates(tags_global='1/min')):
+            self.client.get(TAGS_URL)
+            self.client.force_authenticate(other)
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_rejected_requests_not_counted_globally(self):
+        """A client over its own limit doesn't use up the global one"""
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='testpass123'
+        )
+        with self.settings(
+            REST_FRAMEWORK=rates(tags='1/min', tags_global='2/min')
+        ):
+            for _ in range(5):
+                self.client.get(TAGS_URL)
+            self.client.force_authenticate(other)
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_previous_window_is_weighted(self):
+        """Requests late in a window still count early in the next one"""
+        with self.settings(REST_FRAMEWORK=rates(tags='4/min')):
+            for _ in range(4):
+                self.client.get(TAGS_URL)
+            # 10 seconds into the next window 5/6 of the old one overlaps,
+            # 4 * 5/6 + 0 is under the limit, 4 * 5/6 + 1 is not.
+            with patch.object(CounterThrottle, 'timer', lambda self: 6070.0):
+                allowed = self.client.get(TAGS_URL)
+                blocked = self.client.get(TAGS_URL)
+            with patch.object(CounterThrottle, 'timer', lambda self: 6076.0):
+                later = self.client.get(TAGS_URL)
+
+        self.assertEqual(allowed.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            blocked.status_code, status.HTTP_429_TOO_MANY_REQUESTS
+        )
+        # 4 * (1 - (10 + t) / 60) + 1 < 4 once t > 5
+        self.assertEqual(blocked['Retry-After'], '5')
+        self.assertEqual(later.status_code, status.HTTP_200_OK)
+
+    def test_anonymous_clients_limited_by_ip(self):
+        client = APIClient()
+        payload = {'email': 'user@example.com', 'password': 'wrong'}
+        with self.settings(REST_FRAMEWORK=rates(token='2/min')):
+            client.post(TOKEN_URL, payload)
+            client.post(TOKEN_URL, payload)
+            res = client.post(TOKEN_URL, payload)
+            other_ip = client.post(
+                TOKEN_URL, payload, REMOTE_ADDR='10.0.0.2'
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(other_ip.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_spoofed_forwarded_for_ignored(self):
+        """A client can't get a fresh limit by making up a proxy header"""
+        client = APIClient()
+        payload = {'email': 'user@example.com', 'password': 'wrong'}
+        with self.settings(REST_FRAMEWORK=rates(token='2/min')):
+            for i in range(3):
+                res = client.post(
+                    TOKEN_URL, payload, HTTP_X_FORWARDED_FOR=f'10.1.0.{i}'
+                )
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_trusted_proxy_hop_used(self):
+        """Behind a proxy the address it appended is the client"""
+        client = APIClient()
+        payload = {'email': 'user@example.com', 'password': 'wrong'}
+        config = dict(rates(token='2/min'), NUM_PROXIES=1)
+        with self.settings(REST_FRAMEWORK=config):
+            for i in range(3):
+                res = client.post(
+                    TOKEN_URL, payload,
+                    HTTP_X_FORWARDED_FOR=f'10.1.0.{i}, 10.0.0.9',
+                )
+            other_ip = client.post(
+                TOKEN_URL, payload, HTTP_X_FORWARDED_FOR='10.0.0.8'
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(other_ip.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,146 @@
+"""
+Rate limiting with constant cost per request.
+
+DRF's SimpleRateThrottle keeps a list with the timestamp of every request
+in the window and rewrites it to the cache on each request, so the work
+and the cache traffic grow with the rate. These throttles keep one integer
+counter per window, bumped with an atomic cache incr, and smooth the
+window edges by weighting the previous window's count by how much of it
+still overlaps the last `duration` seconds (a sliding window counter).
+
+Views pick a bucket with `throttle_scope`, the same attribute DRF's
+ScopedRateThrottle uses. Views without one are not throttled. Rates are
+read from REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']:
+
+- '<scope>' limits each user (or client IP when anonymous).
+- '<scope>_global' limits all clients of the scope together.
+
+The client IP is REMOTE_ADDR. Behind proxies, REST_FRAMEWORK['NUM_PROXIES']
+says how many of them append to X-Forwarded-For, the address the outermost
+one saw is used. Entries further left are sent by the client and can't be
+trusted.
+
+The counters are kept in the default cache, which must be shared by every
+process serving the API (memcached, see CACHES in the settings). With the
+process-local LocMemCache each worker counts on its own, the limits are
+multiplied by the number of workers; `manage.py check --deploy` reports
+that as core.E001.
+"""
+
+import math
+import time
+
+from django.core.cache import cache as default_cache
+
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+def parse_rate(rate):
+    """Turn '100/min' into (100, 60)"""
+    num, period = rate.split('/')
+    return int(num), DURATIONS[period[0]]
+
+
+class CounterThrottle(BaseThrottle):
+    """Sliding window counters over a scope's rates, see module docstring.
+
+    `get_buckets` lists the (rate suffix, ident key) pairs a request is
+    counted in. They are checked in order and a request only counts once
+    every bucket allowed it, the ones that already counted it are given
+    their request back.
+    """
+
+    cache = default_cache
+    timer = time.time
+
+    def get_buckets(self, request):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        scope = getattr(view, 'throttle_scope', None)
+        if not scope:
+            return True
+        rates = api_settings.DEFAULT_THROTTLE_RATES
+        now = self.timer()
+
+        counted = []
+        for suffix, ident in self.get_buckets(request):
+            rate = rates.get(scope + suffix)
+            if rate is None:
+                continue
+            limit, duration = parse_rate(rate)
+            window = int(now // duration)
+            elapsed = now - window * duration
+            base = f'throttle:{scope}{suffix}:{ident}'
+            current_key = f'{base}:{window}'
+
+            # Count first and decide on the value incr returned, two
+            # concurrent requests never see the same count. The previous
+            # window is closed, nothing bumps it any more.
+            before = self._incr(current_key, duration * 2) - 1
+            previous = self.cache.get(f'{base}:{window - 1}', 0)
+            overlap = 1 - elapsed / duration
+            counted.append(current_key)
+
+            if previous * overlap + before >= limit:
+                for key in counted:
+                    self._decr(key)
+                self.wait_seconds = self._wait(
+                    limit, duration, elapsed, before, previous
+                )
+                return False
+        return True
+
+    def _incr(self, key, timeout):
+        """Count a request in `key` and return the new count"""
+        # add() only succeeds for the first request of the window, every
+        # other one is an atomic increment. The key has to outlive the
+        # next window, which weights it.
+        if self.cache.add(key, 1, timeout):
+            return 1
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # Expired between add() and incr().
+            self.cache.set(key, 1, timeout)
+            return 1
+
+    def _decr(self, key):
+        """Take back a request counted in `key`"""
+        try:
+            self.cache.decr(key)
+        except ValueError:
+            pass
+
+    def _wait(self, limit, duration, elapsed, current, previous):
+        """Seconds until the weighted count drops below the limit"""
+        if current < limit and previous:
+            # previous * (1 - (elapsed + t) / duration) + current < limit
+            wait = duration * (1 - (limit - current) / previous) - elapsed
+        else:
+            # Only the start of the next window can help.
+            wait = duration - elapsed
+        return max(1, math.ceil(wait))
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class ScopedThrottle(CounterThrottle):
+    """Limit each user, or anonymous client IP, per throttle_scope, then
+    all clients of the scope together.
+
+    A request the per client limit rejects isn't counted globally, so one
+    client going over its limit doesn't use up everybody else's.
+    """
+
+    def get_buckets(self, request):
+        if request.user and request.user.is_authenticated:
+            ident = f'user:{request.user.pk}'
+        else:
+            ident = f'ip:{self.get_ident(request)}'
+        return [('', ident), ('_global', 'all')]
@@ -0,0 +1,63 @@
+"""Views that are not part of the API itself"""
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.http import require_safe
+
+from rest_framework import status
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core import querylog, sse
+from core.probes import ReadinessProbe
+
+readiness_probe = ReadinessProbe(
+    ttl=getattr(settings, 'READINESS_CACHE_SECONDS', 5)
+)
+
+
+@require_safe
+def readiness(request):
+    """Report whether every configured database accepts connections.
+
+    Load balancers poll this a lot, so the probe result is cached for
+    READINESS_CACHE_SECONDS instead of connecting on every request.
+    """
+    databases = readiness_probe.check(list(settings.DATABASES))
+    ready = all(databases.values())
+    return JsonResponse(
+        {'status': 'ok' if ready else 'unavailable', 'databases': databases},
+        status=200 if ready else 503,
+    )
+
+
+class SlowQueryLogView(APIView):
+    """The slow queries this process logged, newest first, see
+    core/querylog.py. DELETE empties the log."""
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            'enabled': getattr(settings, 'SLOW_QUERY_LOG_ENABLED', False),
+            'entries': querylog.log.recent(),
+        })
+
+    def delete(self, request):
+        querylog.log.clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class EventTicketView(APIView):
+    """A single use ticket for opening the event stream, see core/sse.py"""
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'user'
+
+    def post(self, request):
+        return Response({
+            'ticket': sse.issue_ticket(request.user.id),
+            'expires_in': getattr(settings, 'EVENTS_TICKET_SECONDS', 30),
+        }, status=status.HTTP_201_CREATED)
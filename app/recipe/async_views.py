@@ -0,0 +1,153 @@
+"""
+Async versions of the read only recipe endpoints.
+
+DRF views are synchronous, so under ASGI each request holds a worker thread
+for its whole duration. These plain django async views hop onto a thread
+once, for the authentication, the throttles and the query together, and
+hand the event loop back while they wait. They return the same JSON as the
+DRF viewsets, apply the same throttles and read the recipe snapshots when
+those are on.
+
+The database work runs with thread_sensitive=False, on asgiref's thread
+pool. The default would run it on the one thread shared by all
+thread-sensitive code of the process (Django 3.2's ASGIHandler doesn't
+give each request its own), so the requests would queue for it. The call
+uses one connection and closes it afterwards like the end of a request
+would, subject to CONN_MAX_AGE.
+"""
+
+import functools
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import HttpResponse, JsonResponse
+
+from rest_framework import exceptions, status
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+from core.models import Recipe, Tag, Ingredient
+from recipe import serializers
+from recipe import snapshots
+
+
+def _in_thread(func):
+    """Run `func` on the thread pool, with connections handled like a
+    request's"""
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+def _authenticate(request, throttle_scope):
+    """Run DRF token authentication and the throttles of `throttle_scope`
+    against a plain django request"""
+    auth = TokenAuthentication()
+    result = auth.authenticate(request)
+    if result is None:
+        raise exceptions.NotAuthenticated()
+    # What the throttles look at on a DRF request.
+    request.user = result[0]
+    view = SimpleNamespace(throttle_scope=throttle_scope)
+    for throttle_class in api_settings.DEFAULT_THROTTLE_CLASSES:
+        throttle = throttle_class()
+        if not throttle.allow_request(request, view):
+            raise exceptions.Throttled(throttle.wait())
+    return result[0]
+
+
+def _error(exc):
+    """Build the same error response DRF gives for `exc`"""
+    res = JsonResponse({'detail': str(exc.detail)}, status=exc.status_code)
+    if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+        res['WWW-Authenticate'] = \
+            TokenAuthentication().authenticate_header(None)
+    wait = getattr(exc, 'wait', None)
+    if wait is not None:
+        res['Retry-After'] = '%d' % wait
+    return res
+
+
+def _render(data):
+    return HttpResponse(
+        JSONRenderer().render(data),
+        content_type='application/json',
+    )
+
+
+def async_api_view(throttle_scope):
+    """Turn `func(request, user, ...)`, returning the response data, into
+    an async view authenticated and throttled like a DRF view with this
+    `throttle_scope`. All of it runs in a single thread pool call.
+
+    Only GET and HEAD are accepted, these endpoints are read only.
+    """
+    def decorator(func):
+        def handle(request, *args, **kwargs):
+            user = _authenticate(request, throttle_scope)
+            return func(request, user, *args, **kwargs)
+
+        run = _in_thread(handle)
+
+        @functools.wraps(func)
+        async def view(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                res = JsonResponse(
+                    {'detail': 'Method "%s" not allowed.' % request.method},
+                    status=status.HTTP_405_METHOD_NOT_ALLOWED,
+                )
+                res['Allow'] = 'GET, HEAD'
+                return res
+            try:
+                data = await run(request, *args, **kwargs)
+            except exceptions.APIException as exc:
+                return _error(exc)
+            return _render(data)
+
+        return view
+
+    return decorator
+
+
+@async_api_view('recipes')
+def recipe_list(request, user):
+    """List the recipes of the authenticated user"""
+    recipes = Recipe.objects.filter(user=user).order_by('-id')
+    if snapshots.enabled():
+        return list(snapshots.list_rows(recipes))
+    recipes = recipes.prefetch_related('tags', 'ingredients')
+    return serializers.RecipeSerializer(recipes, many=True).data
+
+
+@async_api_view('recipes')
+def recipe_detail(request, user, pk):
+    """Return a single recipe of the authenticated user"""
+    if snapshots.enabled():
+        data = snapshots.detail(pk, Recipe.objects.filter(user=user), request)
+        if data is not None:
+            return data
+    recipe = Recipe.objects.filter(user=user, pk=pk) \
+        .prefetch_related('tags', 'ingredients').first()
+    if recipe is None:
+        raise exceptions.NotFound()
+    return serializers.RecipeDetailSerializer(recipe).data
+
+
+@async_api_view('tags')
+def tag_list(request, user):
+    """List the tags of the authenticated user"""
+    tags = Tag.objects.filter(user=user).order_by('-name')
+    return serializers.TagSerializer(tags, many=True).data
+
+
+@async_api_view('ingredients')
+def ingredient_list(request, user):
+    """List the ingredients of the authenticated user"""
+    ingredients = Ingredient.objects.filter(user=user).order_by('-name')
+    return serializers.IngredientSerializer(ingredients, many=True).data
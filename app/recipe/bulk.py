@@ -0,0 +1,147 @@
+"""
+Set based bulk operations on a user's tags or ingredients.
+
+Each operation runs as a handful of statements in one transaction, no
+matter how many rows or recipes it touches.
+"""
+
+from django.db import connection, transaction
+
+from core import events
+from core.models import Recipe, normalize_name
+from core.orphans import LINKED_BY
+from recipe import similarity
+from recipe import snapshots
+from recipe import stats
+
+
+def _link_columns(model):
+    """Return the through model and its recipe and item column names"""
+    field = Recipe._meta.get_field(LINKED_BY[model])
+    through = field.remote_field.through
+    recipe_column = through._meta.get_field(field.m2m_field_name()).column
+    item_column = through._meta.get_field(field.m2m_reverse_field_name()) \
+        .column
+    return through, recipe_column, item_column
+
+
+def owned_ids(model, user, ids):
+    """The subset of `ids` that belong to `user`"""
+    return set(
+        model.objects.filter(user=user, id__in=ids)
+        .values_list('id', flat=True)
+    )
+
+
+def linked_recipe_ids(model, ids):
+    """Ids of the recipes linked to the given tags or ingredients"""
+    if not ids:
+        return []
+    return list(
+        Recipe.objects.filter(**{f'{LINKED_BY[model]}__in': ids})
+        .values_list('id', flat=True).distinct()
+    )
+
+
+def _changed(model, user, action, ids, recipe_ids, merged_into=None):
+    """Refresh what is derived from the affected recipes, tell the user"""
+    # The commands pass a user id instead of a user.
+    user_id = getattr(user, 'pk', user)
+    snapshots.refresh_later(recipe_ids)
+    events.publish(user_id, model._meta.model_name, action, ids)
+    events.publish(user_id, 'recipe', 'updated', recipe_ids)
+    if action == 'deleted':
+        # Renames don't change which tags/ingredients a recipe has.
+        similarity.recipes_changed(user_id, recipe_ids)
+        if recipe_ids:
+            stats.remove_items(user_id, model, ids, merged_into)
+
+
+def merge(model, user, source_ids, target):
+    """Merge the `source_ids` rows into `target`.
+
+    Every recipe linked to a source ends up linked to the target (once)
+    and the sources are deleted. Returns the number of sources merged.
+    """
+    sources = sorted(owned_ids(model, user, source_ids) - {target.id})
+    if not sources:
+        return 0
+
+    through, recipe_column, item_column = _link_columns(model)
+    qn = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(sources))
+    # Re-point the links with INSERT ... SELECT, skipping recipes already
+    # linked to the target thanks to the through table's unique constraint
+    # (ON CONFLICT DO NOTHING on postgres). A plain UPDATE would fail when
+    # a recipe is linked to two of the sources or to the target already.
+    insert = (
+        '{insert} {table} ({recipe}, {item}) '
+        'SELECT DISTINCT {recipe}, %s FROM {table} '
+        'WHERE {item} IN ({ids}) {suffix}'
+    ).format(
+        insert=connection.ops.insert_statement(ignore_conflicts=True),
+        table=qn(through._meta.db_table),
+        recipe=qn(recipe_column),
+        item=qn(item_column),
+        ids=placeholders,
+        suffix=connection.ops.ignore_conflicts_suffix_sql(
+            ignore_conflicts=True
+        ),
+    )
+    delete = 'DELETE FROM {table} WHERE {item} IN ({ids})'.format(
+        table=qn(through._meta.db_table),
+        item=qn(item_column),
+        ids=placeholders,
+    )
+
+    with transaction.atomic():
+        recipe_ids = linked_recipe_ids(model, sources)
+        with connection.cursor() as cursor:
+            cursor.execute(insert, [target.id] + sources)
+            cursor.execute(delete, sources)
+        model.objects.filter(id__in=sources).delete()
+        _changed(model, user, 'deleted', sources, recipe_ids, target.id)
+
+    return len(sources)
+
+
+class NamePassedOn(Exception):
+    """A rename gives a row the current name of another renamed row"""
+
+
+def rename(model, user, names):
+    """Rename many rows at once, `names` maps id -> new name.
+
+    Returns the renamed objects. Ids that are not the user's are ignored.
+    Raises IntegrityError when two rows would end up with the same
+    normalized name, and NamePassedOn when a row takes the name another
+    one is renamed away from (A <-> B swaps): the unique constraint is
+    checked row by row during the UPDATE, so whether that passes would
+    depend on the order postgres updates the rows in.
+    """
+    objs = list(model.objects.filter(user=user, id__in=names))
+    current = {obj.normalized_name: obj.id for obj in objs}
+    for obj in objs:
+        if current.get(normalize_name(names[obj.id]), obj.id) != obj.id:
+            raise NamePassedOn(names[obj.id])
+        obj.name = names[obj.id]
+        # bulk_update doesn't call save(), keep the normalized name in sync.
+        obj.normalized_name = normalize_name(obj.name)
+
+    with transaction.atomic():
+        # One UPDATE ... SET name = CASE id WHEN ... END for the lot.
+        model.objects.bulk_update(objs, ['name', 'normalized_name'])
+        ids = [obj.id for obj in objs]
+        _changed(model, user, 'updated', ids, linked_recipe_ids(model, ids))
+
+    return objs
+
+
+def delete(model, user, ids):
+    """Delete many rows at once, returns how many were deleted"""
+    with transaction.atomic():
+        ids = list(owned_ids(model, user, ids))
+        recipe_ids = linked_recipe_ids(model, ids)
+        _, deleted = model.objects.filter(user=user, id__in=ids).delete()
+        _changed(model, user, 'deleted', ids, recipe_ids)
+    return deleted.get(model._meta.label, 0)
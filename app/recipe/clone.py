@@ -0,0 +1,160 @@
+"""
+Server-side copies of recipes, to the same user or into another user's
+account.
+
+Recipes only land in another account when that user asks for them: the
+owner gets a share token for a set of their recipes (`share_token()`) and
+hands it over, the recipient copies them into their own account with it
+(`shared_recipes()`). The token is signed with SECRET_KEY and holds the
+owner and the recipe ids, it expires after CLONE_SHARE_MAX_AGE seconds.
+
+A copy is made with a fixed number of statements however many recipes
+are copied: the tags and ingredients are matched by normalized name in the
+target user's namespace and only the missing ones inserted, then the
+recipes and all their link rows are bulk inserted, in one transaction.
+
+The image file is shared with the original (uploaded files are never
+deleted), its resized variants are made again for the copy by the worker
+since those of the original go away when it gets a new image.
+"""
+
+from django.conf import settings
+from django.core import signing
+from django.db import connection, transaction
+
+from core import events
+from core.models import Recipe, Tag, Ingredient
+from recipe import similarity
+from recipe import snapshots
+from recipe import stats
+from recipe import tasks
+
+SHARE_SALT = 'recipe.clone.share'
+
+# Recipe fields copied as they are.
+COPIED_FIELDS = ['title', 'time_minutes', 'link', 'price', 'description',
+                 'image']
+
+
+def _map_names(model, user, sources):
+    """{source id: id of the row with the same name owned by `user`}"""
+    by_name = {}
+    for source in sources:
+        by_name.setdefault(source.normalized_name, source)
+    existing = dict(
+        model.objects.filter(user=user, normalized_name__in=by_name)
+        .values_list('normalized_name', 'id')
+    )
+    missing = [
+        model(user=user, name=source.name,
+              normalized_name=source.normalized_name)
+        for name, source in by_name.items() if name not in existing
+    ]
+    if missing:
+        # bulk_create skips save(), normalized_name is set above. A
+        # concurrent request may create the same names, keep theirs.
+        model.objects.bulk_create(missing, ignore_conflicts=True)
+        existing.update(
+            model.objects.filter(
+                user=user, normalized_name__in=[m.normalized_name
+                                                for m in missing],
+            ).values_list('normalized_name', 'id')
+        )
+    return {source.id: existing[source.normalized_name]
+            for source in sources}
+
+
+def _insert(recipes):
+    if connection.features.can_return_rows_from_bulk_insert:
+        return Recipe.objects.bulk_create(recipes, batch_size=500)
+    # Without INSERT ... RETURNING (sqlite on Django 3.2) the ids of a
+    # bulk insert aren't known, insert one by one.
+    for recipe in recipes:
+        recipe.save(force_insert=True)
+    return recipes
+
+
+def clone_recipes(recipes, user):
+    """Copy `recipes` (a queryset) into `user`'s account, return the
+    copies in the same order"""
+    sources = list(recipes.order_by('id').prefetch_related(
+        'tags', 'ingredients'
+    ))
+    if not sources:
+        return []
+
+    with transaction.atomic():
+        tag_ids = _map_names(
+            Tag, user, [t for r in sources for t in r.tags.all()]
+        )
+        ingredient_ids = _map_names(
+            Ingredient, user, [i for r in sources for i in r.ingredients.all()]
+        )
+
+        copies = _insert([
+            Recipe(user=user, **{
+                field: getattr(source, field) for field in COPIED_FIELDS
+            })
+            for source in sources
+        ])
+
+        tag_links, ingredient_links, states = [], [], []
+        for source, copy in zip(sources, copies):
+            tags = sorted({tag_ids[t.id] for t in source.tags.all()})
+            ingredients = sorted(
+                {ingredient_ids[i.id] for i in source.ingredients.all()}
+            )
+            tag_links += [
+                Recipe.tags.through(recipe_id=copy.id, tag_id=tag_id)
+                for tag_id in tags
+            ]
+            ingredient_links += [
+                Recipe.ingredients.through(
+                    recipe_id=copy.id, ingredient_id=ingredient_id
+                )
+                for ingredient_id in ingredients
+            ]
+            states.append(stats.RecipeState(
+                copy.price, copy.time_minutes, tags, ingredients
+            ))
+        Recipe.tags.through.objects.bulk_create(tag_links, batch_size=1000)
+        Recipe.ingredients.through.objects.bulk_create(
+            ingredient_links, batch_size=1000
+        )
+
+        copy_ids = [copy.id for copy in copies]
+        stats.apply(user.id, added=states)
+        snapshots.refresh(copy_ids)
+        events.publish(user.id, 'recipe', 'created', copy_ids)
+        similarity.recipes_changed(user.id, copy_ids)
+        for copy in copies:
+            if copy.image:
+                tasks.generate_image_variants.delay(
+                    recipe_id=copy.id, image_name=copy.image.name,
+                )
+    return copies
+
+
+def share_max_age():
+    return getattr(settings, 'CLONE_SHARE_MAX_AGE', 7 * 24 * 60 * 60)
+
+
+def share_token(user, recipes):
+    """A token letting another user copy `recipes`, which are `user`'s"""
+    ids = sorted(recipes.values_list('id', flat=True))
+    return signing.dumps(
+        {'user': user.pk, 'ids': ids}, salt=SHARE_SALT, compress=True
+    ), len(ids)
+
+
+def shared_recipes(token):
+    """The recipes a share token gives access to.
+
+    Raises signing.BadSignature for a forged or expired token. Recipes
+    deleted since, or no longer the owner's, are left out, as are all of
+    them when the owner was deactivated.
+    """
+    data = signing.loads(token, salt=SHARE_SALT, max_age=share_max_age())
+    return Recipe.objects.filter(
+        user_id=data['user'], user__is_active=True, id__in=data['ids'],
+    )
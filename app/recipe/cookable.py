@@ -0,0 +1,30 @@
+"""
+"What can I cook": the recipes a pantry of ingredients (nearly) covers.
+
+One grouped query over the recipe-ingredient through table counts, per
+recipe, all of its ingredients and those in the pantry, in the same pass.
+The difference is what is missing, so filtering and ranking on it happen
+in the database and only the recipes returned are loaded.
+"""
+
+from django.db.models import Count, F, Q
+
+from core.models import Recipe
+
+
+def cookable_recipes(user, pantry, max_missing=0):
+    """`user`'s recipes missing at most `max_missing` ingredients from
+    `pantry` (ingredient ids), fewest missing first.
+
+    Recipes without any ingredient of the pantry are left out, as are
+    recipes without ingredients.
+    """
+    return Recipe.objects.filter(user=user).annotate(
+        ingredient_count=Count('ingredients'),
+        matched_count=Count('ingredients', filter=Q(ingredients__in=pantry)),
+    ).annotate(
+        missing_count=F('ingredient_count') - F('matched_count'),
+    ).filter(
+        matched_count__gt=0,
+        missing_count__lte=max_missing,
+    ).order_by('missing_count', '-matched_count', '-id')
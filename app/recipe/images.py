@@ -0,0 +1,104 @@
+"""
+Background generation of resized recipe image variants.
+
+Uploads are saved as they are on the request thread, the resizing is
+queued as a task for the background worker (see recipe/tasks.py). JPEGs
+are decoded with Pillow's draft mode so only the DCT scale we need is
+decoded, which is several times faster than decoding the full image and
+scaling it down.
+"""
+
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from PIL import Image, ImageOps, features
+
+from core import events
+from core.models import Recipe
+from recipe import snapshots
+
+
+def variant_format():
+    """WebP when Pillow was built with it, JPEG otherwise"""
+    if features.check('webp'):
+        return 'WEBP', '.webp'
+    return 'JPEG', '.jpg'
+
+
+def make_variants(source, widths):
+    """Resize an image file into one encoded copy per width.
+
+    Returns a list of (width, extension, bytes), largest first. Widths
+    larger than the original are skipped, images are never upscaled.
+    """
+    fmt, ext = variant_format()
+    quality = getattr(settings, 'IMAGE_VARIANT_QUALITY', 80)
+    variants = []
+
+    with Image.open(source) as img:
+        largest = max(widths)
+        # For JPEG this makes the decoder skip straight to the smallest
+        # 1/2, 1/4 or 1/8 scale that is still at least as large as needed.
+        # It does nothing for other formats.
+        img.draft('RGB', (largest, largest))
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGB')
+        if fmt == 'JPEG' and img.mode == 'RGBA':
+            img = img.convert('RGB')
+
+        for width in sorted(widths, reverse=True):
+            if width >= img.width:
+                continue
+            height = max(1, round(img.height * width / img.width))
+            # reducing_gap lets Pillow use the cheap reduce() first and only
+            # run the expensive filter over the last factor of 3.
+            # Each variant is made from the previous, larger, one.
+            img = img.resize(
+                (width, height), Image.LANCZOS, reducing_gap=3.0
+            )
+            buf = BytesIO()
+            img.save(buf, fmt, quality=quality)
+            variants.append((width, ext, buf.getvalue()))
+
+    return variants
+
+
+def generate_variants(recipe_id, image_name, stale=()):
+    """Build the variants of a recipe image and record them on the recipe.
+
+    Only applied if the recipe still has `image_name`, a newer upload may
+    have replaced it while we were working. `stale` are variant files of a
+    previous image to delete afterwards.
+    """
+    widths = getattr(settings, 'IMAGE_VARIANT_WIDTHS', (320, 640, 1280))
+    base = os.path.splitext(image_name)[0]
+
+    with default_storage.open(image_name) as source:
+        variants = make_variants(source, widths)
+
+    names = {}
+    for width, ext, data in variants:
+        names[str(width)] = default_storage.save(
+            f'{base}_{width}{ext}', ContentFile(data)
+        )
+
+    updated = Recipe.objects.filter(pk=recipe_id, image=image_name) \
+        .update(image_variants=names)
+    if updated:
+        snapshots.refresh([recipe_id])
+        user_id = Recipe.objects.filter(pk=recipe_id) \
+            .values_list('user_id', flat=True).first()
+        events.publish(user_id, 'recipe', 'updated', [recipe_id])
+    else:
+        # The image changed underneath us, these are stale too.
+        stale = list(stale) + list(names.values())
+
+    for name in stale:
+        default_storage.delete(name)
+
+    return names
@@ -1,11 +1,55 @@
 """Contains the recipe Serializer"""
 
+from django.core.files.storage import default_storage
+from django.db import transaction
+
 from rest_framework import serializers
-from core.models import Recipe, Tag, Ingredient
+from core import events
+from core.models import Recipe, Tag, Ingredient, normalize_name
+from recipe import bulk
+from recipe import similarity
+from recipe import snapshots
+from recipe import stats
+from recipe import tasks
+
+
+class LinkedRecipesMixin:
+    """Renaming a tag/ingredient changes the recipes showing it"""
+
+    def update(self, instance, validated_data):
+        instance = super().update(instance, validated_data)
+        recipe_ids = bulk.linked_recipe_ids(type(instance), [instance.id])
+        snapshots.refresh_later(recipe_ids)
+        events.publish(
+            instance.user_id, instance._meta.model_name, 'updated',
+            [instance.id],
+        )
+        events.publish(instance.user_id, 'recipe', 'updated', recipe_ids)
+        return instance
+
+
+class UniqueNameMixin:
+    """Refuse renaming a tag/ingredient to a name the user already has.
+    Only applies to renames, nested inside a recipe an existing name is
+    simply reused."""
+
+    def validate_name(self, value):
+        if self.instance is None:
+            return value
+        taken = type(self.instance).objects.filter(
+            user=self.instance.user,
+            normalized_name=normalize_name(value),
+        ).exclude(pk=self.instance.pk)
+        if taken.exists():
+            raise serializers.ValidationError(
+                'You already have one with this name.'
+            )
+        return value
 
 
 # Moved above because it is assigned below
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(LinkedRecipesMixin, UniqueNameMixin,
+                    serializers.ModelSerializer):
     """Serializer used for the Tag model"""
 
     class Meta:
@@ -13,7 +57,8 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ['id','name']
         read_only_fields = ['id']
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(LinkedRecipesMixin, UniqueNameMixin,
+                           serializers.ModelSerializer):
     """Serializer for the Ingredient Model"""
 
     class Meta:
@@ -21,6 +66,49 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ['id','name']
         read_only_fields = ['id']
 
+
+# Largest number of rows a single bulk request may touch.
+BULK_MAX_ITEMS = 1000
+
+
+class BulkIdsSerializer(serializers.Serializer):
+    """Ids of the tags or ingredients a bulk delete applies to"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=BULK_MAX_ITEMS,
+    )
+
+
+class MergeSerializer(serializers.Serializer):
+    """Merge the source tags or ingredients into the target"""
+    target_id = serializers.IntegerField()
+    source_ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=BULK_MAX_ITEMS,
+    )
+
+
+class RenameItemSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField(max_length=255)
+
+
+class BulkRenameSerializer(serializers.Serializer):
+    """New names for many tags or ingredients"""
+    items = RenameItemSerializer(many=True, allow_empty=False)
+
+    def validate_items(self, items):
+        if len(items) > BULK_MAX_ITEMS:
+            raise serializers.ValidationError(
+                f'At most {BULK_MAX_ITEMS} items per request.'
+            )
+        if len({item['id'] for item in items}) != len(items):
+            raise serializers.ValidationError('Duplicate ids.')
+        return items
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """Contains the serializers for the recipe model"""
     # many = list of items
@@ -37,9 +125,11 @@ class RecipeSerializer(serializers.ModelSerializer):
         auth_user = self.context['request'].user
 
         for ingredient in ingredients:
+            # Matched on the normalized name, one probe of the unique index.
             ingredient_obj, created = Ingredient.objects.get_or_create(
                 user = auth_user,
-                **ingredient # unpack the remainder of the args
+                normalized_name=normalize_name(ingredient['name']),
+                defaults=ingredient # the remainder of the args
             )
             receipe.ingredients.add(ingredient_obj)
 
@@ -50,10 +140,12 @@ class RecipeSerializer(serializers.ModelSerializer):
         auth_user = self.context['request'].user
 
     # get or create will get if all fields passed in if all fields passed in match!
+    # "Vegan" and " vegan" are the same tag, so match on the normalized name.
         for tag in tags:
             tag_obj, created = Tag.objects.get_or_create(
                 user = auth_user,
-                **tag
+                normalized_name=normalize_name(tag['name']),
+                defaults=tag
             )
             recipe.tags.add(tag_obj)
 
@@ -64,12 +156,18 @@ class RecipeSerializer(serializers.ModelSerializer):
         tags = validated_data.pop('tags', [])  # remove and assign, doesn't exist? default to empty list
         ingredients = validated_data.pop('ingredients', [])
 
-        # Pass in all the other fields that are associated with recipe, not tags
-        # Recipe expects a related field, meaning an already created tag.
-        recipe = Recipe.objects.create(**validated_data)
+        with transaction.atomic():
+            # Pass in all the other fields that are associated with recipe,
+            # not tags
+            # Recipe expects a related field, meaning an already created tag.
+            recipe = Recipe.objects.create(**validated_data)
 
-        self._get_or_create_tags(tags, recipe)
-        self._get_or_create_ingredients(ingredients, recipe)
+            self._get_or_create_tags(tags, recipe)
+            self._get_or_create_ingredients(ingredients, recipe)
+            stats.apply(recipe.user_id, added=[stats.state(recipe)])
+            snapshots.refresh([recipe.id])
+            events.publish(recipe.user_id, 'recipe', 'created', [recipe.id])
+            similarity.recipes_changed(recipe.user_id, [recipe.id])
 
         return recipe
 
@@ -79,22 +177,58 @@ class RecipeSerializer(serializers.ModelSerializer):
         # pop out the tags. NOT AN EMPTY LIST. EMPTY LIST IS NOT NONE
         tags = validated_data.pop('tags', None)
         ingredients = validated_data.pop('ingredients', None)
+        with transaction.atomic():
+            stats.lock(instance)
+            old_state = stats.state(instance)
+
+            # if they aren't none then we are going to clear out what is
+            # already there then assign it.
+            unlinked_tags = set()
+            if tags is not None:
+                unlinked_tags = set(instance.tags.values_list('id', flat=True))
+                instance.tags.clear()  # Clear the tags that were already there
+                self._get_or_create_tags(tags, instance)
+                unlinked_tags -= set(
+                    instance.tags.values_list('id', flat=True)
+                )
 
-        # if they aren't none then we are going to clear out what is already there then assign it.
-        if tags is not None:
-            instance.tags.clear()  # Clear the tags that were already there
-            self._get_or_create_tags(tags, instance)
+            unlinked_ingredients = set()
+            if ingredients is not None:
+                unlinked_ingredients = set(
+                    instance.ingredients.values_list('id', flat=True)
+                )
+                # Clear the tags that were already there
+                instance.ingredients.clear()
+                self._get_or_create_ingredients(ingredients, instance)
+                unlinked_ingredients -= set(
+                    instance.ingredients.values_list('id', flat=True)
+                )
 
-        if ingredients is not None:
-            instance.ingredients.clear()  # Clear the tags that were already there
-            self._get_or_create_ingredients(ingredients, instance)
+            # Dropped tags/ingredients may be orphans now, the worker checks
+            # and deletes them outside of the request.
+            if unlinked_tags or unlinked_ingredients:
+                tasks.prune_unlinked.delay(
+                    user_id=instance.user_id,
+                    tag_ids=sorted(unlinked_tags),
+                    ingredient_ids=sorted(unlinked_ingredients),
+                )
 
-        # This is probably the default language in the update value.
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
+            # This is probably the default language in the update value.
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
 
-        # Save all of the updated instances.
-        instance.save()
+            # Save all of the updated instances.
+            instance.save()
+            stats.apply(
+                instance.user_id,
+                removed=[old_state], added=[stats.state(instance)],
+            )
+            snapshots.refresh([instance.id])
+            events.publish(
+                instance.user_id, 'recipe', 'updated', [instance.id]
+            )
+            if tags is not None or ingredients is not None:
+                similarity.recipes_changed(instance.user_id, [instance.id])
         return instance
 
 class RecipeDetailSerializer(RecipeSerializer):
@@ -102,6 +236,201 @@ class RecipeDetailSerializer(RecipeSerializer):
 
     # Here we are passing the meta class off of the inhereted serializers
     # meta class. Pass in all of the fields.
+    image_variants = serializers.SerializerMethodField()
+
     class Meta(RecipeSerializer.Meta):
-        fields = RecipeSerializer.Meta.fields + ['description']
+        fields = RecipeSerializer.Meta.fields + [
+            'description', 'image', 'image_variants'
+        ]
+        # The image is only set through the upload-image endpoint.
+        read_only_fields = RecipeSerializer.Meta.read_only_fields + ['image']
+
+    def get_image_variants(self, obj):
+        """Return the URL of every resized variant that is ready"""
+        return image_variant_urls(obj, self.context.get('request'))
+
+
+def image_variant_urls(recipe, request=None):
+    """Map each variant width to the URL it is served from"""
+    urls = {}
+    for width, name in sorted(
+        recipe.image_variants.items(), key=lambda item: int(item[0])
+    ):
+        url = default_storage.url(name)
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        urls[width] = url
+    return urls
+
+
+class RecipeImageSerializer(serializers.ModelSerializer):
+    """Serializer for uploading images to recipes"""
+    image_variants = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Recipe
+        fields = ['id', 'image', 'image_variants']
+        read_only_fields = ['id']
+        extra_kwargs = {'image': {'required': True}}
+
+    def get_image_variants(self, obj):
+        """Empty until the background workers have made the variants"""
+        return image_variant_urls(obj, self.context.get('request'))
+
+
+class SimilarRecipeSerializer(RecipeSerializer):
+    """A recipe and how similar it is to the one asked about"""
+    score = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ['score']
+
+
+class SimilarQuerySerializer(serializers.Serializer):
+    """?limit=10&metric=jaccard"""
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=10)
+    metric = serializers.ChoiceField(
+        choices=similarity.METRICS, default='jaccard'
+    )
+
+
+class IdListField(serializers.CharField):
+    """A comma separated list of ids in a query parameter, ?ids=1,2,3"""
+
+    def __init__(self, max_items, **kwargs):
+        self.max_items = max_items
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        try:
+            ids = {int(part) for part in value.split(',') if part.strip()}
+        except ValueError:
+            raise serializers.ValidationError(
+                'Expected a comma separated list of ids.'
+            )
+        if not ids:
+            raise serializers.ValidationError('No ids given.')
+        if len(ids) > self.max_items:
+            raise serializers.ValidationError(
+                f'At most {self.max_items} ids.'
+            )
+        return sorted(ids)
+
+
+# Most recipes a single shopping list may be built from.
+SHOPPING_LIST_MAX_RECIPES = 500
+
+
+class ShoppingListQuerySerializer(serializers.Serializer):
+    """?recipes=1,2,3"""
+    recipes = IdListField(max_items=SHOPPING_LIST_MAX_RECIPES)
+
+
+class ShoppingListItemSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    recipe_count = serializers.IntegerField()
+
+
+class ShoppingListSerializer(serializers.Serializer):
+    """Ingredients needed for a set of recipes"""
+    recipe_count = serializers.IntegerField()
+    total_price = serializers.DecimalField(max_digits=12, decimal_places=2)
+    ingredients = ShoppingListItemSerializer(many=True)
+
+
+# Most ingredients a pantry may list.
+PANTRY_MAX_INGREDIENTS = 1000
+
+
+class CookableQuerySerializer(serializers.Serializer):
+    """?ingredients=1,2,3&max_missing=0&limit=50"""
+    ingredients = IdListField(max_items=PANTRY_MAX_INGREDIENTS)
+    max_missing = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=200, default=50)
+
+
+class CookableRecipeSerializer(RecipeSerializer):
+    """A recipe and what the pantry lacks for it"""
+    ingredient_count = serializers.IntegerField(read_only=True)
+    missing_count = serializers.IntegerField(read_only=True)
+    missing_ingredients = serializers.SerializerMethodField()
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + [
+            'ingredient_count', 'missing_count', 'missing_ingredients'
+        ]
+
+    def get_missing_ingredients(self, obj):
+        pantry = self.context.get('pantry', ())
+        return IngredientSerializer(
+            [i for i in obj.ingredients.all() if i.id not in pantry],
+            many=True,
+        ).data
+
+
+class StatsQuerySerializer(serializers.Serializer):
+    """?top=10"""
+    top = serializers.IntegerField(min_value=0, max_value=100, default=10)
+
+
+class PriceStatsSerializer(serializers.Serializer):
+    avg = serializers.DecimalField(max_digits=12, decimal_places=2)
+    min = serializers.DecimalField(max_digits=5, decimal_places=2)
+    max = serializers.DecimalField(max_digits=5, decimal_places=2)
+
+
+class TimeStatsSerializer(serializers.Serializer):
+    avg = serializers.DecimalField(
+        max_digits=12, decimal_places=1, coerce_to_string=False
+    )
+    min = serializers.IntegerField()
+    max = serializers.IntegerField()
+
+
+class RecipeStatsSerializer(serializers.Serializer):
+    """Totals over all of a user's recipes"""
+    recipe_count = serializers.IntegerField()
+    price = PriceStatsSerializer()
+    time_minutes = TimeStatsSerializer()
+    tag_count = serializers.IntegerField()
+    ingredient_count = serializers.IntegerField()
+    tags = ShoppingListItemSerializer(many=True)
+    ingredients = ShoppingListItemSerializer(many=True)
+
+
+# Most recipes one bulk clone may copy.
+CLONE_MAX_RECIPES = 1000
+
+
+class BulkCloneSerializer(serializers.Serializer):
+    """Copy (or share) the recipes with these ids, having any of these tag
+    ids, or both"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False,
+        max_length=CLONE_MAX_RECIPES,
+    )
+    tags = serializers.ListField(
+        child=serializers.IntegerField(), required=False,
+        max_length=BULK_MAX_ITEMS,
+    )
+
+    def validate(self, attrs):
+        if not attrs.get('ids') and not attrs.get('tags'):
+            raise serializers.ValidationError(
+                'Pass the ids or tags of the recipes to copy.'
+            )
+        return attrs
+
+
+class ShareSerializer(serializers.Serializer):
+    """A token another user can copy the shared recipes with"""
+    token = serializers.CharField(read_only=True)
+    count = serializers.IntegerField(read_only=True)
+    expires_in = serializers.IntegerField(read_only=True)
+
 
+class CloneSharedSerializer(serializers.Serializer):
+    """Copy the recipes shared with `token` into your own account"""
+    token = serializers.CharField(max_length=20000)
@@ -0,0 +1,357 @@
+"""
+"More like this" for recipes.
+
+Each recipe is the set of its tag and ingredient ids. Every recipe of a
+user gets a bit position. A feature on many recipes gets a bitset (a
+Python int) of them, a rare one a sorted array of their positions (a
+posting list), whichever is smaller: the bitset costs one bit per recipe
+of the user, the array 4 bytes per recipe having the feature.
+
+To rank the recipes like one with features F, the recipes found in the
+posting lists of F are scored one by one. The bitsets of F are added up
+bit-sliced (a few big-int ANDs and XORs per feature, whatever the number
+of recipes), which gives for every other recipe the number of features it
+shares. Those are scored level by level from the most shared features
+down, and since a recipe sharing s of the |F| features scores at most
+s/|F| (Jaccard) or sqrt(s/|F|) (cosine), the walk stops as soon as no
+lower level can beat the results found. Only those candidates are looked
+at individually.
+
+Indexes are built per user on first use and kept in process, up to
+SIMILARITY_CACHE_BYTES of them by their estimated size. A version number
+per user in the shared cache is bumped after every write that changes a
+recipe's features. The process that made the write updates its index in
+place for the recipes involved; other processes see the version moved and
+rebuild on their next query. That needs a cache shared by the processes
+(not the default per-process LocMemCache) when there is more than one.
+"""
+
+import heapq
+import math
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core.models import Recipe
+
+METRICS = ('jaccard', 'cosine')
+
+
+def _tag(tag_id):
+    # Tags and ingredients share one feature space, tags get negative ids.
+    return -tag_id
+
+
+def _dense(members, recipes):
+    """Whether a feature on `members` of `recipes` recipes is stored as a
+    bitset (recipes / 8 bytes) rather than positions (4 bytes each)"""
+    return members * 32 > recipes
+
+
+def _bitset(positions, size):
+    """An int with the given bits set, for `size` recipes"""
+    # Setting bits one by one in a big int would copy it every time.
+    data = bytearray((size + 7) // 8)
+    for position in positions:
+        data[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(data, 'little')
+
+
+def _set_positions(bits):
+    """Yield the positions of the set bits of a non-negative int"""
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    for offset, byte in enumerate(data):
+        while byte:
+            low = byte & -byte
+            yield offset * 8 + low.bit_length() - 1
+            byte ^= low
+
+
+class SimilarityIndex:
+    """Features of a user's recipes, and the recipes of each feature as a
+    bitset (`bits`) or a posting list (`postings`).
+
+    The features of a recipe are kept as a sorted tuple, a fifth of the
+    size of a frozenset.
+    """
+
+    def __init__(self):
+        self.features = {}
+        self.bits = {}
+        self.postings = {}
+        self.positions = {}
+        self.recipe_ids = []
+        self.free = []
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_pairs(cls, tag_pairs, ingredient_pairs):
+        """Build from (recipe_id, tag_id) and (recipe_id, ingredient_id)"""
+        features = {}
+        for recipe_id, tag_id in tag_pairs:
+            features.setdefault(recipe_id, set()).add(_tag(tag_id))
+        for recipe_id, ingredient_id in ingredient_pairs:
+            features.setdefault(recipe_id, set()).add(ingredient_id)
+
+        index = cls()
+        members = {}
+        for position, (recipe_id, recipe_features) in enumerate(
+            sorted(features.items())
+        ):
+            index.features[recipe_id] = tuple(sorted(recipe_features))
+            index.positions[recipe_id] = position
+            index.recipe_ids.append(recipe_id)
+            for feature in recipe_features:
+                members.setdefault(feature, []).append(position)
+
+        size = len(index.recipe_ids)
+        for feature, positions in members.items():
+            if _dense(len(positions), size):
+                index.bits[feature] = _bitset(positions, size)
+            else:
+                index.postings[feature] = array('I', positions)
+        return index
+
+    def nbytes(self):
+        """Rough memory use of the index"""
+        total = sys.getsizeof(self.recipe_ids)
+        for mapping in (self.features, self.bits, self.postings):
+            total += sys.getsizeof(mapping)
+            total += sum(map(sys.getsizeof, mapping.values()))
+        # The position of each recipe.
+        total += sys.getsizeof(self.positions) + 32 * len(self.positions)
+        return total
+
+    def _add(self, recipe_id, features):
+        if self.free:
+            position = self.free.pop()
+            self.recipe_ids[position] = recipe_id
+        else:
+            position = len(self.recipe_ids)
+            self.recipe_ids.append(recipe_id)
+        self.positions[recipe_id] = position
+        self.features[recipe_id] = tuple(sorted(features))
+        for feature in features:
+            if feature in self.bits:
+                self.bits[feature] |= 1 << position
+                continue
+            posting = self.postings.setdefault(feature, array('I'))
+            posting.append(position)
+            if _dense(len(posting), len(self.recipe_ids)):
+                del self.postings[feature]
+                self.bits[feature] = _bitset(posting, len(self.recipe_ids))
+
+    def _remove(self, recipe_id):
+        position = self.positions.pop(recipe_id, None)
+        if position is None:
+            return
+        for feature in self.features.pop(recipe_id):
+            if feature in self.postings:
+                posting = self.postings[feature]
+                posting.remove(position)
+                if not posting:
+                    del self.postings[feature]
+                continue
+            bits = self.bits[feature] & ~(1 << position)
+            if bits:
+                self.bits[feature] = bits
+            else:
+                del self.bits[feature]
+        self.recipe_ids[position] = None
+        self.free.append(position)
+
+    def replace(self, features_by_recipe, removed=()):
+        """Set the features of some recipes and drop the `removed` ones"""
+        with self.lock:
+            for recipe_id in removed:
+                self._remove(recipe_id)
+            for recipe_id, features in features_by_recipe.items():
+                self._remove(recipe_id)
+                if features:
+                    self._add(recipe_id, features)
+
+    def similar(self, recipe_id, limit=10, metric='jaccard'):
+        """[(score, recipe_id)] of the best matches, best first"""
+        with self.lock:
+            if not self.features.get(recipe_id):
+                return []
+            features = frozenset(self.features[recipe_id])
+            size = len(features)
+            best = []
+
+            def consider(shared, position):
+                other = self.recipe_ids[position]
+                other_size = len(self.features[other])
+                if metric == 'cosine':
+                    score = shared / math.sqrt(size * other_size)
+                else:
+                    score = shared / (size + other_size - shared)
+                if len(best) < limit:
+                    heapq.heappush(best, (score, other))
+                elif (score, other) > best[0]:
+                    heapq.heapreplace(best, (score, other))
+
+            # Recipes with a rare feature are few, score them directly.
+            own = self.positions[recipe_id]
+            scored = {own}
+            for feature in features:
+                for position in self.postings.get(feature, ()):
+                    if position not in scored:
+                        scored.add(position)
+                        other = self.recipe_ids[position]
+                        consider(
+                            len(features.intersection(self.features[other])),
+                            position,
+                        )
+
+            # counters[i] holds bit i of each recipe's shared feature count.
+            counters = []
+            for feature in features:
+                carry = self.bits.get(feature)
+                if carry is None:
+                    continue
+                for i, counter in enumerate(counters):
+                    counters[i] = counter ^ carry
+                    carry &= counter
+                    if not carry:
+                        break
+                if carry:
+                    counters.append(carry)
+            if len(scored) == 1:
+                not_scored = ~(1 << own)
+            else:
+                not_scored = ~_bitset(scored, len(self.recipe_ids))
+            counters = [counter & not_scored for counter in counters]
+
+            for shared in range(size, 0, -1):
+                if len(best) == limit:
+                    bound = shared / size
+                    if metric == 'cosine':
+                        bound = math.sqrt(bound)
+                    if best[0][0] > bound:
+                        break
+                if shared >> len(counters):
+                    continue
+                level = -1
+                for i, counter in enumerate(counters):
+                    level &= counter if shared >> i & 1 else ~counter
+                for position in _set_positions(level):
+                    consider(shared, position)
+
+        # Ties go to the newest recipe.
+        return sorted(best, reverse=True)
+
+
+def _features(user_id, recipe_ids=None):
+    """Query the tag and ingredient pairs of a user's recipes"""
+    tags = Recipe.tags.through.objects.filter(tag__user_id=user_id)
+    ingredients = Recipe.ingredients.through.objects.filter(
+        ingredient__user_id=user_id
+    )
+    if recipe_ids is not None:
+        tags = tags.filter(recipe_id__in=recipe_ids)
+        ingredients = ingredients.filter(recipe_id__in=recipe_ids)
+    return (
+        tags.values_list('recipe_id', 'tag_id').iterator(),
+        ingredients.values_list('recipe_id', 'ingredient_id').iterator(),
+    )
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def _version_key(user_id):
+    return f'similarity:version:{user_id}'
+
+
+def _version(user_id):
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # Start from the clock rather than 1, so an index built before the
+        # cache lost the key can't match a version handed out again.
+        cache.add(_version_key(user_id), time.time_ns(), None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def _keep(user_id, version, index):
+    """Cache an index, dropping the least recently used ones over
+    SIMILARITY_CACHE_BYTES. Call with _indexes_lock held."""
+    _indexes[user_id] = (version, index, index.nbytes())
+    _indexes.move_to_end(user_id)
+    limit = getattr(settings, 'SIMILARITY_CACHE_BYTES', 256 * 1024 * 1024)
+    total = sum(entry[2] for entry in _indexes.values())
+    # The index just built is kept even when it is over the limit alone.
+    while total > limit and len(_indexes) > 1:
+        total -= _indexes.popitem(last=False)[1][2]
+
+
+def get_index(user_id):
+    """The up to date index of a user's recipes"""
+    version = _version(user_id)
+    with _indexes_lock:
+        entry = _indexes.get(user_id)
+        if entry is not None and entry[0] == version:
+            _indexes.move_to_end(user_id)
+            return entry[1]
+
+    index = SimilarityIndex.from_pairs(*_features(user_id))
+    with _indexes_lock:
+        _keep(user_id, version, index)
+    return index
+
+
+def recipes_changed(user_id, recipe_ids):
+    """Record that the tags/ingredients of some recipes changed, or that
+    they were created or deleted. Applied once the transaction commits."""
+    recipe_ids = list(recipe_ids)
+    if recipe_ids:
+        transaction.on_commit(lambda: _apply(user_id, recipe_ids))
+
+
+def _apply(user_id, recipe_ids):
+    key = _version_key(user_id)
+    try:
+        version = cache.incr(key)
+    except ValueError:
+        # Nobody built an index for this user since the cache lost it.
+        version = None
+
+    with _indexes_lock:
+        entry = _indexes.pop(user_id, None)
+    # Only patch our index if no other process wrote in between, in that
+    # case it is missing their change as well and has to be rebuilt.
+    if entry is None or version != entry[0] + 1:
+        return
+
+    index = entry[1]
+    tag_pairs, ingredient_pairs = _features(user_id, recipe_ids)
+    updated = SimilarityIndex.from_pairs(tag_pairs, ingredient_pairs)
+    index.replace(
+        updated.features,
+        removed=set(recipe_ids) - set(updated.features),
+    )
+    with _indexes_lock:
+        _keep(user_id, version, index)
+
+
+def similar_recipes(recipe, limit=10, metric='jaccard'):
+    """The user's recipes most like `recipe`, each with a .score"""
+    matches = get_index(recipe.user_id).similar(recipe.id, limit, metric)
+    recipes = Recipe.objects.filter(id__in=[rid for _, rid in matches]) \
+        .prefetch_related('tags', 'ingredients').in_bulk()
+    result = []
+    for score, recipe_id in matches:
+        # Deleted since the index was built.
+        if recipe_id in recipes:
+            match = recipes[recipe_id]
+            match.score = round(score, 4)
+            result.append(match)
+    return result
@@ -0,0 +1,145 @@
+"""
+Denormalized recipe snapshots.
+
+With RECIPE_SNAPSHOTS_ENABLED every recipe keeps the output of
+RecipeDetailSerializer in its `snapshot` column, refreshed whenever the
+recipe, one of its tags or ingredients, or its image changes. A tag or
+ingredient can be on thousands of recipes, so changing one only marks
+their snapshots stale (NULL) and rebuilds them on the task queue, in the
+meantime they are served like recipes without a snapshot. The recipe
+list and detail endpoints then read that one column instead of joining the
+tag and ingredient tables, and the list is streamed to the client while
+the rows are fetched.
+
+Snapshots are built without a request, so URLs in them are relative and
+made absolute when they are served. Writes made outside the API (admin,
+shell) are not tracked: run `manage.py snapshots check` to find stale
+snapshots and `manage.py snapshots rebuild` to fix them, which is also
+needed once after turning the setting on.
+"""
+
+import json
+
+from django.conf import settings
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from core.models import Recipe, Tag, Ingredient
+from recipe import serializers
+from recipe import tasks
+
+
+def enabled():
+    return getattr(settings, 'RECIPE_SNAPSHOTS_ENABLED', False)
+
+
+def with_relations(queryset):
+    """Prefetch what building snapshots of `queryset` needs"""
+    return queryset.prefetch_related(
+        Prefetch('tags', queryset=Tag.objects.only('id', 'name')),
+        Prefetch(
+            'ingredients', queryset=Ingredient.objects.only('id', 'name')
+        ),
+    )
+
+
+def build(recipe):
+    """The snapshot of a recipe, as stored in the database"""
+    data = serializers.RecipeDetailSerializer(recipe).data
+    # Decimals and the like become what the JSON renderer would send.
+    return json.loads(json.dumps(data, cls=JSONEncoder))
+
+
+def store(recipes):
+    """Build and save the snapshots of recipes fetched with_relations()"""
+    for recipe in recipes:
+        recipe.snapshot = build(recipe)
+    Recipe.objects.bulk_update(recipes, ['snapshot'], batch_size=500)
+
+
+def refresh(recipe_ids, chunk_size=500):
+    """Rebuild the snapshots of the given recipes, if snapshots are on"""
+    if not enabled() or not recipe_ids:
+        return
+    recipe_ids = list(recipe_ids)
+    for start in range(0, len(recipe_ids), chunk_size):
+        chunk = recipe_ids[start:start + chunk_size]
+        store(list(with_relations(Recipe.objects.filter(id__in=chunk))))
+
+
+def refresh_later(recipe_ids):
+    """Mark the snapshots of the given recipes stale and queue their
+    rebuild, if snapshots are on"""
+    if not enabled() or not recipe_ids:
+        return
+    Recipe.objects.filter(id__in=recipe_ids).update(snapshot=None)
+    tasks.refresh_snapshots.delay(recipe_ids=list(recipe_ids))
+
+
+def absolute_urls(snapshot, request):
+    """Make the image URLs of a snapshot absolute, like the serializer"""
+    if snapshot.get('image'):
+        snapshot['image'] = request.build_absolute_uri(snapshot['image'])
+    snapshot['image_variants'] = {
+        width: request.build_absolute_uri(url)
+        for width, url in snapshot.get('image_variants', {}).items()
+    }
+    return snapshot
+
+
+def detail(recipe_id, queryset, request):
+    """The detail representation from the snapshot.
+
+    Returns None when there is no snapshot to use.
+    """
+    try:
+        rows = queryset.filter(pk=recipe_id)
+    except (TypeError, ValueError):
+        # Not a valid id, let the regular view answer with the 404.
+        return None
+    snapshot = rows.values_list('snapshot', flat=True).first()
+    if snapshot is None:
+        return None
+    return absolute_urls(snapshot, request)
+
+
+def list_rows(queryset, chunk_size=200):
+    """Yield the list representation of the recipes from their snapshots"""
+    # The snapshot holds the detail representation, a superset of these.
+    fields = serializers.RecipeSerializer.Meta.fields
+    missing = []
+    for recipe_id, snapshot in queryset.values_list('id', 'snapshot') \
+            .iterator(chunk_size=chunk_size):
+        if snapshot is None:
+            # Not built yet, fall back to the serializer for this one.
+            snapshot = build(with_relations(Recipe.objects).get(
+                pk=recipe_id
+            ))
+            missing.append(recipe_id)
+        yield {field: snapshot[field] for field in fields}
+    refresh(missing)
+
+
+def stream_list(queryset, chunk_size=200):
+    """A streaming JSON response with the list representation"""
+
+    def content():
+        encoder = JSONEncoder()
+        separator = '['
+        chunk = []
+        for item in list_rows(queryset, chunk_size):
+            chunk.append(encoder.encode(item))
+            # Every yield is a write (and a compressor flush), so send the
+            # rows a fetched chunk at a time.
+            if len(chunk) == chunk_size:
+                yield separator + ','.join(chunk)
+                separator, chunk = ',', []
+        if chunk:
+            yield separator + ','.join(chunk)
+        elif separator == '[':
+            yield '['
+        yield ']'
+
+    return StreamingHttpResponse(content(), content_type='application/json')
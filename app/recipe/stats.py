@@ -0,0 +1,232 @@
+"""
+Per-user recipe statistics kept in a summary row, core.models.RecipeStats.
+
+Instead of aggregating over every recipe of a user when the stats are
+read, the API's recipe writes adjust the row in their own transaction:
+`lock()` the recipe, `state()` captures what it contributes before it
+changes, `apply()` takes the old states out and the new ones in once the
+change is written. Without the recipe lock two concurrent updates of one
+recipe could both take the same old state out.
+Counts and sums move by the difference. A min or max can only be kept that
+way while it isn't the value going away, when it is, that one value is
+recomputed with an aggregate.
+
+Deleting or merging tags and ingredients only changes their counts:
+`remove_items()` drops the deleted ids and recounts the recipes of a merge
+target. `rebuild()` recomputes the whole row, a user without one gets it
+built on first use. `manage.py recipe_stats check` compares the rows with fresh
+aggregates.
+"""
+
+import heapq
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Min, Sum
+
+from core.models import Ingredient, Recipe, RecipeStats, Tag
+from core.orphans import LINKED_BY
+
+RecipeState = namedtuple(
+    'RecipeState', ['price', 'time_minutes', 'tag_ids', 'ingredient_ids']
+)
+
+# Fields with a min and a max, and the recipe field they range over.
+RANGES = {'price': 'price', 'time': 'time_minutes'}
+
+
+def lock(recipe):
+    """Lock `recipe` until the transaction ends and reload its fields, so
+    the state() taken next is the one this write replaces"""
+    Recipe.objects.select_for_update().filter(pk=recipe.pk) \
+        .values_list('pk').get()
+    recipe.refresh_from_db()
+
+
+def state(recipe):
+    """What `recipe` currently adds to its user's stats"""
+    return RecipeState(
+        Decimal(str(recipe.price)),
+        recipe.time_minutes,
+        list(recipe.tags.values_list('id', flat=True)),
+        list(recipe.ingredients.values_list('id', flat=True)),
+    )
+
+
+def _distribution(through, column, user_id):
+    rows = through.objects.filter(recipe__user_id=user_id) \
+        .values(column).annotate(n=Count('id')).values_list(column, 'n')
+    return {str(item_id): n for item_id, n in rows}
+
+
+def compute(user_id):
+    """The stats field values, aggregated from the user's recipes"""
+    aggregates = {'recipe_count': Count('id'),
+                  'price_sum': Sum('price'),
+                  'time_sum': Sum('time_minutes')}
+    for name, field in RANGES.items():
+        aggregates[f'{name}_min'] = Min(field)
+        aggregates[f'{name}_max'] = Max(field)
+    values = Recipe.objects.filter(user_id=user_id).aggregate(**aggregates)
+    values['price_sum'] = values['price_sum'] or Decimal('0')
+    values['time_sum'] = values['time_sum'] or 0
+    values['tag_counts'] = _distribution(
+        Recipe.tags.through, 'tag_id', user_id
+    )
+    values['ingredient_counts'] = _distribution(
+        Recipe.ingredients.through, 'ingredient_id', user_id
+    )
+    return values
+
+
+def rebuild(user_id):
+    """Recompute the user's stats row from scratch.
+
+    The aggregates are computed while holding the row lock, an apply()
+    waiting for it then adds its change on top instead of being
+    overwritten by totals that didn't include it.
+    """
+    with transaction.atomic():
+        stats = RecipeStats.objects.select_for_update() \
+            .filter(user_id=user_id).first()
+        if stats is None:
+            try:
+                with transaction.atomic():
+                    stats = RecipeStats.objects.create(user_id=user_id)
+            except IntegrityError:
+                # Another request created the row in between, lock that.
+                stats = RecipeStats.objects.select_for_update() \
+                    .get(user_id=user_id)
+        for field, value in compute(user_id).items():
+            setattr(stats, field, value)
+        stats.save()
+    return stats
+
+
+def _count(counts, ids, delta):
+    for item_id in ids:
+        key = str(item_id)
+        n = counts.get(key, 0) + delta
+        if n > 0:
+            counts[key] = n
+        else:
+            counts.pop(key, None)
+
+
+def apply(user_id, removed=(), added=()):
+    """Take the `removed` RecipeStates out of the user's stats and add the
+    `added` ones. Call it after the recipes are written, in the same
+    transaction."""
+    with transaction.atomic():
+        # The row lock orders concurrent writes of the same user.
+        stats = RecipeStats.objects.select_for_update() \
+            .filter(user_id=user_id).first()
+        if stats is None:
+            # Aggregated from the recipes as they are now, this change
+            # included.
+            rebuild(user_id)
+            return
+
+        stale = set()
+        for old in removed:
+            stats.recipe_count -= 1
+            stats.price_sum -= old.price
+            stats.time_sum -= old.time_minutes
+            _count(stats.tag_counts, old.tag_ids, -1)
+            _count(stats.ingredient_counts, old.ingredient_ids, -1)
+            for name, field in RANGES.items():
+                value = getattr(old, field)
+                low = getattr(stats, f'{name}_min')
+                high = getattr(stats, f'{name}_max')
+                if low is None or value <= low or value >= high:
+                    stale.add(name)
+
+        for new in added:
+            stats.recipe_count += 1
+            stats.price_sum += new.price
+            stats.time_sum += new.time_minutes
+            _count(stats.tag_counts, new.tag_ids, 1)
+            _count(stats.ingredient_counts, new.ingredient_ids, 1)
+            for name, field in RANGES.items():
+                value = getattr(new, field)
+                low = getattr(stats, f'{name}_min')
+                high = getattr(stats, f'{name}_max')
+                if low is None or value < low:
+                    setattr(stats, f'{name}_min', value)
+                if high is None or value > high:
+                    setattr(stats, f'{name}_max', value)
+
+        if stale:
+            aggregates = {}
+            for name in stale:
+                aggregates[f'{name}_min'] = Min(RANGES[name])
+                aggregates[f'{name}_max'] = Max(RANGES[name])
+            for field, value in Recipe.objects.filter(user_id=user_id) \
+                    .aggregate(**aggregates).items():
+                setattr(stats, field, value)
+        stats.save()
+
+
+def remove_items(user_id, model, ids, merged_into=None):
+    """Take deleted tags or ingredients (`model`) out of the user's
+    stats. When they were merged into the row with id `merged_into`, its
+    count becomes the number of recipes linked to it now. Call it after
+    the links are written, in the same transaction."""
+    with transaction.atomic():
+        stats = RecipeStats.objects.select_for_update() \
+            .filter(user_id=user_id).first()
+        if stats is None:
+            rebuild(user_id)
+            return
+
+        field = f'{model._meta.model_name}_counts'
+        counts = getattr(stats, field)
+        for item_id in ids:
+            counts.pop(str(item_id), None)
+        if merged_into is not None:
+            # Recipes linked to a source and the target count once.
+            through = getattr(Recipe, LINKED_BY[model]).through
+            n = through.objects.filter(
+                **{f'{model._meta.model_name}_id': merged_into}
+            ).count()
+            _count(counts, [merged_into], n - counts.get(str(merged_into), 0))
+        stats.save(update_fields=[field])
+
+
+def _top(model, counts, limit):
+    """The `limit` most used rows of `model` with their recipe counts"""
+    best = heapq.nlargest(
+        limit, counts.items(), key=lambda item: (item[1], -int(item[0]))
+    )
+    names = model.objects.in_bulk([int(key) for key, _ in best])
+    # A row deleted without going through the API is left out.
+    return [
+        {'id': int(key), 'name': names[int(key)].name, 'recipe_count': n}
+        for key, n in best if int(key) in names
+    ]
+
+
+def summary(user_id, top=10):
+    """The user's stats, with the `top` most used tags and ingredients"""
+    stats = RecipeStats.objects.filter(user_id=user_id).first()
+    if stats is None:
+        stats = rebuild(user_id)
+    count = stats.recipe_count
+    return {
+        'recipe_count': count,
+        'price': {
+            'avg': stats.price_sum / count if count else None,
+            'min': stats.price_min,
+            'max': stats.price_max,
+        },
+        'time_minutes': {
+            'avg': stats.time_sum / count if count else None,
+            'min': stats.time_min,
+            'max': stats.time_max,
+        },
+        'tag_count': len(stats.tag_counts),
+        'ingredient_count': len(stats.ingredient_counts),
+        'tags': _top(Tag, stats.tag_counts, top),
+        'ingredients': _top(Ingredient, stats.ingredient_counts, top),
+    }
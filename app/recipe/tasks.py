@@ -0,0 +1,28 @@
+"""Background tasks for the recipe app, run by manage.py run_worker"""
+
+from core.models import Tag, Ingredient
+from core.orphans import delete_orphans
+from core.tasks import task
+from recipe import images
+from recipe import snapshots
+
+
+@task
+def generate_image_variants(recipe_id, image_name, stale=()):
+    """Resize a freshly uploaded recipe image"""
+    images.generate_variants(recipe_id, image_name, stale)
+
+
+@task
+def prune_unlinked(user_id, tag_ids=(), ingredient_ids=()):
+    """Delete tags and ingredients a recipe update unlinked, if no other
+    recipe still uses them"""
+    for model, ids in ((Tag, tag_ids), (Ingredient, ingredient_ids)):
+        if ids:
+            delete_orphans(model, ids, user_id=user_id)
+
+
+@task
+def refresh_snapshots(recipe_ids):
+    """Rebuild the snapshots a tag or ingredient change marked stale"""
+    snapshots.refresh(recipe_ids)
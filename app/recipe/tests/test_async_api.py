@@ -0,0 +1,174 @@
+"""Test the async read only recipe endpoints"""
+
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TransactionTestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient
+
+ASYNC_RECIPE_URL = reverse('recipe:async-recipe-list')
+ASYNC_TAGS_URL = reverse('recipe:async-tag-list')
+ASYNC_INGREDIENTS_URL = reverse('recipe:async-ingredient-list')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'sample recipe title',
+        'time_minutes': 5,
+        'price': Decimal('6.50'),
+        'description': 'sample description'
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class PublicAsyncApiTests(TransactionTestCase):
+    """Test unauthenticated requests to the async endpoints"""
+
+    def test_auth_required(self):
+        """A token is required"""
+        res = self.client.get(ASYNC_RECIPE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_invalid_token(self):
+        """An unknown token is rejected"""
+        res = self.client.get(
+            ASYNC_RECIPE_URL, HTTP_AUTHORIZATION='Token notarealtoken'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+# The database work runs on other threads, which don't see the data of a
+# TestCase's uncommitted transaction.
+class PrivateAsyncApiTests(TransactionTestCase):
+    """Test the async endpoints against their DRF counterparts"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='test123'
+        )
+        token = Token.objects.create(user=self.user)
+        self.auth = {'HTTP_AUTHORIZATION': 'Token %s' % token.key}
+
+        # The DRF client gives us the expected output.
+        self.api_client = APIClient()
+        self.api_client.force_authenticate(self.user)
+
+    def test_recipe_list_matches_viewset(self):
+        """The async list returns the same data as the viewset"""
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='test123'
+        )
+        create_recipe(other)
+        recipe = create_recipe(self.user)
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Salt')
+        )
+        create_recipe(self.user, title='second')
+
+        res = self.client.get(ASYNC_RECIPE_URL, **self.auth)
+        expected = self.api_client.get(reverse('recipe:recipe-list'))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json(), expected.json())
+        self.assertEqual(len(res.json()), 2)
+
+    def test_recipe_detail(self):
+        """The async detail matches the viewset and 404s for others"""
+        recipe = create_recipe(self.user)
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='test123'
+        )
+        other_recipe = create_recipe(other)
+
+        res = self.client.get(
+            reverse('recipe:async-recipe-detail', args=[recipe.id]),
+            **self.auth
+        )
+        expected = self.api_client.get(
+            reverse('recipe:recipe-detail', args=[recipe.id])
+        )
+        self.assertEqual(res.json(), expected.json())
+
+        res = self.client.get(
+            reverse('recipe:async-recipe-detail', args=[other_recipe.id]),
+            **self.auth
+        )
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_tag_and_ingredient_lists(self):
+        """The tag and ingredient lists match the viewsets"""
+        Tag.objects.create(user=self.user, name='Dessert')
+        Tag.objects.create(user=self.user, name='Breakfast')
+        Ingredient.objects.create(user=self.user, name='Kale')
+
+        res = self.client.get(ASYNC_TAGS_URL, **self.auth)
+        expected = self.api_client.get(reverse('recipe:tag-list'))
+        self.assertEqual(res.json(), expected.json())
+
+        res = self.client.get(ASYNC_INGREDIENTS_URL, **self.auth)
+        expected = self.api_client.get(reverse('recipe:ingredient-list'))
+        self.assertEqual(res.json(), expected.json())
+
+    def test_one_thread_hop_per_request(self):
+        """Authentication and the query share one thread pool call"""
+        with patch(
+            'recipe.async_views.close_old_connections'
+        ) as close_old_connections:
+            res = self.client.get(ASYNC_RECIPE_URL, **self.auth)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        # Once on the way in and once on the way out of the single call.
+        self.assertEqual(close_old_connections.call_count, 2)
+
+    def test_read_only(self):
+        """Writes are refused"""
+        res = self.client.post(ASYNC_RECIPE_URL, {}, **self.auth)
+
+        self.assertEqual(res.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def test_throttled_like_the_viewset(self):
+        """The recipes scope limits the async endpoints too"""
+        rates = {'recipes': '1/min', 'recipes_global': '100/min'}
+        with self.settings(REST_FRAMEWORK=dict(
+            settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES=rates
+        )):
+            first = self.client.get(ASYNC_RECIPE_URL, **self.auth)
+            second = self.client.get(ASYNC_RECIPE_URL, **self.auth)
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', second)
+
+    def test_snapshots_served_when_enabled(self):
+        """The list and detail read the snapshot column"""
+        recipe = create_recipe(self.user)
+        Recipe.objects.filter(id=recipe.id).update(snapshot={
+            'id': recipe.id, 'title': 'From the snapshot', 'time_minutes': 5,
+            'price': '6.50', 'tags': [], 'ingredients': [],
+            'image_variants': {},
+        })
+
+        with self.settings(RECIPE_SNAPSHOTS_ENABLED=True):
+            res = self.client.get(ASYNC_RECIPE_URL, **self.auth)
+            detail = self.client.get(
+                reverse('recipe:async-recipe-detail', args=[recipe.id]),
+                **self.auth
+            )
+
+        self.assertEqual(res.json()[0]['title'], 'From the snapshot')
+        self.assertEqual(detail.json()['title'], 'From the snapshot')
@@ -0,0 +1,213 @@
+"""Test the bulk tag and ingredient operations"""
+
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient
+
+
+def create_recipe(user, title='sample recipe'):
+    return Recipe.objects.create(
+        user=user, title=title, time_minutes=5, price=Decimal('5.00')
+    )
+
+
+class BulkTagApiTests(TestCase):
+    """Test bulk operations on tags"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_merge_tags(self):
+        """Recipes of the sources move to the target, once each"""
+        target = Tag.objects.create(user=self.user, name='Tomato')
+        lower = Tag.objects.create(user=self.user, name='tomatos')
+        plural = Tag.objects.create(user=self.user, name='Tomatoes')
+        r1 = create_recipe(self.user)
+        r2 = create_recipe(self.user)
+        r3 = create_recipe(self.user)
+        # r1 is linked to the target and a source, r2 to both sources.
+        r1.tags.add(target, lower)
+        r2.tags.add(lower, plural)
+        r3.tags.add(plural)
+
+        res = self.client.post(
+            reverse('recipe:tag-merge'),
+            {'target_id': target.id, 'source_ids': [lower.id, plural.id]},
+            format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['merged'], 2)
+        self.assertEqual(list(Tag.objects.all()), [target])
+        for recipe in (r1, r2, r3):
+            self.assertEqual(list(recipe.tags.all()), [target])
+
+    def test_merge_other_users_tags_ignored(self):
+        """Another user's tags can be neither source nor target"""
+        other = get_user_model().objects.create_user(
+            'other@example.com', 'testpass123'
+        )
+        target = Tag.objects.create(user=self.user, name='Mine')
+        theirs = Tag.objects.create(user=other, name='Theirs')
+
+        res = self.client.post(
+            reverse('recipe:tag-merge'),
+            {'target_id': target.id, 'source_ids': [theirs.id]},
+            format='json',
+        )
+        self.assertEqual(res.data['merged'], 0)
+        self.assertTrue(Tag.objects.filter(id=theirs.id).exists())
+
+        res = self.client.post(
+            reverse('recipe:tag-merge'),
+            {'target_id': theirs.id, 'source_ids': [target.id]},
+            format='json',
+        )
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_bulk_rename(self):
+        """Many tags are renamed in one request"""
+        tags = [
+            Tag.objects.create(user=self.user, name=f'tag {i}')
+            for i in range(3)
+        ]
+        payload = {'items': [
+            {'id': tag.id, 'name': f'Renamed {tag.id}'} for tag in tags
+        ]}
+
+        res = self.client.post(
+            reverse('recipe:tag-bulk-rename'), payload, format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        for tag in tags:
+            tag.refresh_from_db()
+            self.assertEqual(tag.name, f'Renamed {tag.id}')
+
+    def test_bulk_rename_name_clash(self):
+        """Renaming two tags to the same name is rejected"""
+        tags = [
+            Tag.objects.create(user=self.user, name=f'tag {i}')
+            for i in range(2)
+        ]
+        payload = {'items': [
+            {'id': tags[0].id, 'name': 'Vegan'},
+            {'id': tags[1].id, 'name': ' vegan'},
+        ]}
+
+        res = self.client.post(
+            reverse('recipe:tag-bulk-rename'), payload, format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        tags[0].refresh_from_db()
+        self.assertEqual(tags[0].name, 'tag 0')
+
+    def test_bulk_rename_swap(self):
+        """Swapping two names is rejected instead of failing half way"""
+        first = Tag.objects.create(user=self.user, name='Vegan')
+        second = Tag.objects.create(user=self.user, name='Quick')
+        payload = {'items': [
+            {'id': first.id, 'name': 'Quick'},
+            {'id': second.id, 'name': 'vegan'},
+        ]}
+
+        res = self.client.post(
+            reverse('recipe:tag-bulk-rename'), payload, format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('separate requests', res.data['items'][0])
+        first.refresh_from_db()
+        self.assertEqual(first.name, 'Vegan')
+
+    def test_bulk_rename_keeps_own_name(self):
+        """A row may be renamed to another spelling of its own name"""
+        tag = Tag.objects.create(user=self.user, name='vegan')
+        other = Tag.objects.create(user=self.user, name='quick')
+        payload = {'items': [
+            {'id': tag.id, 'name': 'Vegan'},
+            {'id': other.id, 'name': 'Fast'},
+        ]}
+
+        res = self.client.post(
+            reverse('recipe:tag-bulk-rename'), payload, format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'Vegan')
+
+    def test_bulk_rename_duplicate_ids(self):
+        """The same id twice is rejected"""
+        tag = Tag.objects.create(user=self.user, name='tag')
+        payload = {'items': [
+            {'id': tag.id, 'name': 'a'}, {'id': tag.id, 'name': 'b'},
+        ]}
+
+        res = self.client.post(
+            reverse('recipe:tag-bulk-rename'), payload, format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BulkIngredientApiTests(TestCase):
+    """Test bulk operations on ingredients"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_delete(self):
+        """Only the user's ingredients are deleted, with their links"""
+        other = get_user_model().objects.create_user(
+            'other@example.com', 'testpass123'
+        )
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+        kale = Ingredient.objects.create(user=self.user, name='Kale')
+        keep = Ingredient.objects.create(user=self.user, name='Keep')
+        theirs = Ingredient.objects.create(user=other, name='Salt')
+        recipe = create_recipe(self.user)
+        recipe.ingredients.add(salt, keep)
+
+        res = self.client.post(
+            reverse('recipe:ingredient-bulk-delete'),
+            {'ids': [salt.id, kale.id, theirs.id]},
+            format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['deleted'], 2)
+        self.assertEqual(list(recipe.ingredients.all()), [keep])
+        self.assertTrue(Ingredient.objects.filter(id=theirs.id).exists())
+
+    def test_merge_ingredients(self):
+        """Ingredients merge the same way tags do"""
+        target = Ingredient.objects.create(user=self.user, name='Tomato')
+        source = Ingredient.objects.create(user=self.user, name='tomatoes')
+        recipe = create_recipe(self.user)
+        recipe.ingredients.add(source)
+
+        res = self.client.post(
+            reverse('recipe:ingredient-merge'),
+            {'target_id': target.id, 'source_ids': [source.id]},
+            format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(recipe.ingredients.all()), [target])
@@ -0,0 +1,214 @@
+"""Tests for copying recipes server-side"""
+
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, RecipeStats, Tag, Ingredient
+from recipe import stats
+
+BULK_CLONE_URL = reverse('recipe:recipe-bulk-clone')
+SHARE_URL = reverse('recipe:recipe-share')
+CLONE_SHARED_URL = reverse('recipe:recipe-clone-shared')
+
+
+def clone_url(recipe_id):
+    return reverse('recipe:recipe-clone', args=[recipe_id])
+
+
+def create_user(email='user@example.com'):
+    return get_user_model().objects.create_user(
+        email=email, password='testpass123'
+    )
+
+
+def create_recipe(user, title='Recipe', tags=(), ingredients=()):
+    recipe = Recipe.objects.create(
+        user=user, title=title, time_minutes=10, price=Decimal('4.50'),
+        description='Stir well',
+    )
+    for name in tags:
+        tag, _ = Tag.objects.get_or_create(user=user, name=name)
+        recipe.tags.add(tag)
+    for name in ingredients:
+        ingredient, _ = Ingredient.objects.get_or_create(user=user, name=name)
+        recipe.ingredients.add(ingredient)
+    return recipe
+
+
+def names(recipe, field):
+    return sorted(getattr(recipe, field).values_list('name', flat=True))
+
+
+class CloneTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        self.other = create_user('other@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.other_client = APIClient()
+        self.other_client.force_authenticate(self.other)
+
+    def share(self, payload):
+        """Share recipes of self.user, return the token"""
+        res = self.client.post(SHARE_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        return res.data['token']
+
+    def test_clone_to_self_reuses_tags(self):
+        recipe = create_recipe(self.user, tags=['Vegan'], ingredients=['Rice'])
+
+        res = self.client.post(clone_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        copy = Recipe.objects.get(id=res.data['id'])
+        self.assertNotEqual(copy.id, recipe.id)
+        self.assertEqual(
+            (copy.title, copy.description, copy.price),
+            ('Recipe', 'Stir well', Decimal('4.50')),
+        )
+        self.assertEqual(
+            list(copy.tags.all()), list(recipe.tags.all())
+        )
+        self.assertEqual(Tag.objects.count(), 1)
+        self.assertEqual(Ingredient.objects.count(), 1)
+
+    def test_clone_shared_maps_names(self):
+        # "vegan" already exists for the other user, "Rice" doesn't.
+        existing = Tag.objects.create(user=self.other, name='vegan')
+        recipe = create_recipe(
+            self.user, tags=['Vegan', 'Quick'], ingredients=['Rice'],
+        )
+        token = self.share({'ids': [recipe.id]})
+
+        res = self.other_client.post(CLONE_SHARED_URL, {'token': token})
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        copy = Recipe.objects.get(id=res.data['ids'][0])
+        self.assertEqual(copy.user, self.other)
+        self.assertIn(existing, copy.tags.all())
+        self.assertEqual(names(copy, 'tags'), ['Quick', 'vegan'])
+        self.assertEqual(names(copy, 'ingredients'), ['Rice'])
+        for tag in copy.tags.all():
+            self.assertEqual(tag.user, self.other)
+        self.assertEqual(recipe.user, self.user)
+
+    def test_cannot_clone_into_another_account(self):
+        """Copies only go to the account asking for them"""
+        recipe = create_recipe(self.user)
+
+        res = self.client.post(
+            clone_url(recipe.id), {'to': 'other@example.com'}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(Recipe.objects.filter(user=self.other).exists())
+
+    def test_forged_or_expired_token(self):
+        recipe = create_recipe(self.user)
+        token = self.share({'ids': [recipe.id]})
+
+        res = self.other_client.post(
+            CLONE_SHARED_URL, {'token': token + 'x'}
+        )
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        with self.settings(CLONE_SHARE_MAX_AGE=-1):
+            res = self.other_client.post(CLONE_SHARED_URL, {'token': token})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Recipe.objects.count(), 1)
+
+    def test_share_only_own_recipes(self):
+        theirs = create_recipe(self.other, 'Theirs')
+        mine = create_recipe(self.user, 'Mine')
+        token = self.share({'ids': [theirs.id, mine.id]})
+
+        res = self.other_client.post(CLONE_SHARED_URL, {'token': token})
+
+        self.assertEqual(res.data['cloned'], 1)
+        self.assertEqual(
+            Recipe.objects.get(id=res.data['ids'][0]).title, 'Mine'
+        )
+
+    def test_other_users_recipe_not_found(self):
+        recipe = create_recipe(self.other)
+
+        res = self.client.post(clone_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_bulk_clone_by_tag(self):
+        for i in range(3):
+            create_recipe(
+                self.user, f'Soup {i}', tags=['Soup', f'Tag {i}'],
+                ingredients=['Water', f'Veg {i}'],
+            )
+        create_recipe(self.user, 'Cake', tags=['Sweet'])
+        soup = Tag.objects.get(user=self.user, name='Soup')
+
+        token = self.share({'tags': [soup.id]})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.other_client.post(CLONE_SHARED_URL, {'token': token})
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['cloned'], 3)
+        copies = Recipe.objects.filter(user=self.other).order_by('id')
+        self.assertEqual(
+            [copy.id for copy in copies], res.data['ids']
+        )
+        self.assertEqual(
+            [names(copy, 'ingredients') for copy in copies],
+            [['Veg 0', 'Water'], ['Veg 1', 'Water'], ['Veg 2', 'Water']],
+        )
+        self.assertEqual(
+            Ingredient.objects.filter(user=self.other).count(), 4
+        )
+        row = RecipeStats.objects.get(user=self.other)
+        for field, value in stats.compute(self.other.id).items():
+            self.assertEqual(getattr(row, field), value, field)
+
+    def test_bulk_clone_queries_independent_of_count(self):
+        ids = [
+            create_recipe(self.user, f'R {i}', tags=[f'T {i}'],
+                          ingredients=[f'I {i}']).id
+            for i in range(20)
+        ]
+        # Otherwise the first copy builds the stats row.
+        stats.rebuild(self.other.id)
+
+        counts = []
+        for batch in (ids[:2], ids[2:]):
+            token = self.share({'ids': batch})
+            with CaptureQueriesContext(connection) as context:
+                self.other_client.post(CLONE_SHARED_URL, {'token': token})
+            # sqlite has to insert the recipes one by one, see clone.py.
+            counts.append(len([
+                query for query in context.captured_queries
+                if not query['sql'].startswith('INSERT INTO "core_recipe" ')
+            ]))
+
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(Recipe.objects.filter(user=self.other).count(), 20)
+
+    def test_bulk_clone_own_recipes(self):
+        ids = [create_recipe(self.user, f'R {i}').id for i in range(2)]
+
+        res = self.client.post(BULK_CLONE_URL, {'ids': ids}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['cloned'], 2)
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 4)
+
+    def test_bulk_clone_needs_a_filter(self):
+        res = self.client.post(BULK_CLONE_URL, {}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,108 @@
+"""Tests for the what can I cook action"""
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Ingredient
+
+COOKABLE_URL = reverse('recipe:recipe-cookable')
+
+
+class CookableTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.ingredients = {}
+
+    def ingredient(self, name, user=None):
+        key = (name, user or self.user)
+        if key not in self.ingredients:
+            self.ingredients[key] = Ingredient.objects.create(
+                user=user or self.user, name=name
+            )
+        return self.ingredients[key]
+
+    def create_recipe(self, title, names, user=None):
+        recipe = Recipe.objects.create(
+            user=user or self.user, title=title, time_minutes=5, price=1
+        )
+        recipe.ingredients.set([self.ingredient(n, user) for n in names])
+        return recipe
+
+    def get(self, names, **params):
+        params['ingredients'] = ','.join(
+            str(self.ingredient(name).id) for name in names
+        )
+        return self.client.get(COOKABLE_URL, params)
+
+    def test_fully_covered_only_by_default(self):
+        rice = self.create_recipe('Rice', ['Rice', 'Salt'])
+        self.create_recipe('Curry', ['Rice', 'Salt', 'Curry paste'])
+        self.create_recipe('Cake', ['Flour'])
+        Recipe.objects.create(
+            user=self.user, title='Water', time_minutes=1, price=0
+        )
+
+        res = self.get(['Rice', 'Salt', 'Pepper'])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data], [rice.id])
+        self.assertEqual(res.data[0]['missing_count'], 0)
+        self.assertEqual(res.data[0]['missing_ingredients'], [])
+
+    def test_ranked_by_missing(self):
+        one = self.create_recipe('One', ['Rice', 'Egg'])
+        two = self.create_recipe('Two', ['Rice', 'Egg', 'Leek'])
+        none = self.create_recipe('None', ['Rice'])
+
+        res = self.get(['Rice'], max_missing=2)
+
+        self.assertEqual(
+            [r['id'] for r in res.data], [none.id, one.id, two.id]
+        )
+        self.assertEqual(
+            sorted(i['name'] for i in res.data[2]['missing_ingredients']),
+            ['Egg', 'Leek'],
+        )
+        self.assertEqual(res.data[2]['ingredient_count'], 3)
+
+    def test_other_users_recipes_excluded(self):
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='testpass123'
+        )
+        self.create_recipe('Theirs', ['Rice'], user=other)
+
+        res = self.get(['Rice'])
+
+        self.assertEqual(res.data, [])
+
+    def test_limit(self):
+        for i in range(3):
+            self.create_recipe(f'Rice {i}', ['Rice'])
+
+        res = self.get(['Rice'], limit=2)
+
+        self.assertEqual(len(res.data), 2)
+
+    def test_queries_do_not_grow_with_recipes(self):
+        for i in range(30):
+            self.create_recipe(f'Recipe {i}', ['Rice', f'Spice {i}'])
+
+        # The grouped query, then the tags and ingredients prefetches.
+        with self.assertNumQueries(3):
+            res = self.get(['Rice'], max_missing=1)
+
+        self.assertEqual(len(res.data), 30)
+
+    def test_requires_ingredients(self):
+        res = self.client.get(COOKABLE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,143 @@
+"""Test uploading recipe images and generating their variants"""
+
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Task
+from recipe import images
+from recipe.tasks import generate_image_variants
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def image_upload_url(recipe_id):
+    """Create and return an image upload URL"""
+    return reverse('recipe:recipe-upload-image', args=[recipe_id])
+
+
+def detail_url(recipe_id):
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'sample recipe title',
+        'time_minutes': 5,
+        'price': Decimal('6.50'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+def jpeg_file(size=(1600, 1200)):
+    """Write a sample JPEG to a temporary file and return it"""
+    image_file = tempfile.NamedTemporaryFile(suffix='.jpg')
+    Image.new('RGB', size, color=(200, 30, 30)).save(image_file, 'JPEG')
+    image_file.seek(0)
+    return image_file
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_VARIANT_WIDTHS=(320, 640))
+class ImageUploadTests(TestCase):
+    """Tests for the image upload API."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(user=self.user)
+
+    def tearDown(self):
+        self.recipe.image.delete()
+
+    def test_upload_image(self):
+        """Test uploading an image to a recipe."""
+        with jpeg_file() as image_file:
+            res = self.client.post(
+                image_upload_url(self.recipe.id),
+                {'image': image_file},
+                format='multipart',
+            )
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('image', res.data)
+        self.assertEqual(res.data['image_variants'], {})
+        self.assertTrue(os.path.exists(self.recipe.image.path))
+        # The resizing is left to the background worker.
+        queued = Task.objects.get(name=generate_image_variants.task_name)
+        self.assertEqual(queued.kwargs['recipe_id'], self.recipe.id)
+        self.assertEqual(queued.kwargs['image_name'], self.recipe.image.name)
+
+    def test_upload_image_bad_request(self):
+        """Test uploading invalid image."""
+        res = self.client.post(
+            image_upload_url(self.recipe.id),
+            {'image': 'notanimage'},
+            format='multipart',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_generate_variants(self):
+        """The variants are resized, saved and served once ready"""
+        with jpeg_file() as image_file:
+            self.recipe.image.save('sample.jpg', image_file)
+
+        names = images.generate_variants(
+            self.recipe.id, self.recipe.image.name
+        )
+
+        self.assertEqual(sorted(names), ['320', '640'])
+        with default_storage.open(names['320']) as variant:
+            self.assertEqual(Image.open(variant).size, (320, 240))
+
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertTrue(
+            res.data['image_variants']['640'].endswith(names['640'])
+        )
+        for name in names.values():
+            default_storage.delete(name)
+
+    def test_no_upscaling(self):
+        """Widths above the original size are skipped"""
+        with jpeg_file(size=(500, 500)) as image_file:
+            variants = images.make_variants(image_file, (320, 640))
+
+        self.assertEqual([width for width, _, _ in variants], [320])
+
+    def test_stale_variants_discarded(self):
+        """Variants of a replaced image are deleted, not recorded"""
+        with jpeg_file() as image_file:
+            self.recipe.image.save('sample.jpg', image_file)
+        old_name = self.recipe.image.name
+        with jpeg_file() as image_file:
+            self.recipe.image.save('newer.jpg', image_file)
+
+        names = images.generate_variants(self.recipe.id, old_name)
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants, {})
+        for name in names.values():
+            self.assertFalse(default_storage.exists(name))
+        default_storage.delete(old_name)
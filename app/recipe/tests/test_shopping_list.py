@@ -0,0 +1,110 @@
+"""Tests for the shopping list endpoint"""
+
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Ingredient
+
+SHOPPING_LIST_URL = reverse('recipe:shopping-list')
+
+
+def create_recipe(user, ingredients=(), **params):
+    defaults = {'title': 'Recipe', 'time_minutes': 5, 'price': Decimal('2.50')}
+    defaults.update(params)
+    recipe = Recipe.objects.create(user=user, **defaults)
+    for name in ingredients:
+        ingredient, _ = Ingredient.objects.get_or_create(user=user, name=name)
+        recipe.ingredients.add(ingredient)
+    return recipe
+
+
+class ShoppingListTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, *recipes):
+        return self.client.get(
+            SHOPPING_LIST_URL,
+            {'recipes': ','.join(str(r.id) for r in recipes)},
+        )
+
+    def test_auth_required(self):
+        res = APIClient().get(SHOPPING_LIST_URL, {'recipes': '1'})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_union_of_ingredients_with_counts(self):
+        curry = create_recipe(self.user, ['Rice', 'Onion'], price='4.00')
+        soup = create_recipe(self.user, ['Onion', 'Carrot'], price='3.25')
+        create_recipe(self.user, ['Salt'])
+
+        res = self.get(curry, soup)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['recipe_count'], 2)
+        self.assertEqual(res.data['total_price'], '7.25')
+        self.assertEqual(
+            [(i['name'], i['recipe_count']) for i in res.data['ingredients']],
+            [('Onion', 2), ('Carrot', 1), ('Rice', 1)],
+        )
+
+    def test_other_users_recipes_ignored(self):
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='testpass123'
+        )
+        mine = create_recipe(self.user, ['Rice'])
+        theirs = create_recipe(other, ['Caviar'], price='99.00')
+
+        res = self.get(mine, theirs)
+
+        self.assertEqual(res.data['recipe_count'], 1)
+        self.assertEqual(res.data['total_price'], '2.50')
+        self.assertEqual(
+            [i['name'] for i in res.data['ingredients']], ['Rice']
+        )
+
+    def test_cross_user_links_ignored(self):
+        """Another user's recipe linked to one of my ingredients"""
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='testpass123'
+        )
+        mine = create_recipe(self.user, ['Rice'])
+        theirs = create_recipe(other)
+        # As the admin's raw id widget allows.
+        theirs.ingredients.add(Ingredient.objects.get(name='Rice'))
+
+        res = self.get(mine, theirs)
+
+        self.assertEqual(
+            [(i['name'], i['recipe_count']) for i in res.data['ingredients']],
+            [('Rice', 1)],
+        )
+
+    def test_two_queries_for_many_recipes(self):
+        recipes = [
+            create_recipe(self.user, ['Rice', f'Spice {i}'])
+            for i in range(50)
+        ]
+
+        with self.assertNumQueries(2):
+            res = self.get(*recipes)
+
+        self.assertEqual(res.data['ingredients'][0]['recipe_count'], 50)
+        self.assertEqual(len(res.data['ingredients']), 51)
+
+    def test_invalid_ids(self):
+        for value in ('', 'a,b', ','):
+            res = self.client.get(SHOPPING_LIST_URL, {'recipes': value})
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,241 @@
+"""Tests for the similar recipes action and its index"""
+
+import math
+import random
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient
+from recipe import similarity
+
+
+def similar_url(recipe_id):
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
+class SimilarityIndexTests(TestCase):
+
+    def test_jaccard_and_cosine(self):
+        index = similarity.SimilarityIndex.from_pairs(
+            [(1, 10), (2, 10)],
+            [(1, 1), (1, 2), (2, 1), (3, 2), (3, 3), (3, 4)],
+        )
+
+        # 1 = {t10, 1, 2}, 2 = {t10, 1}, 3 = {2, 3, 4}
+        self.assertEqual(index.similar(1), [(2 / 3, 2), (1 / 5, 3)])
+        cosine = index.similar(1, metric='cosine')
+        self.assertEqual([rid for _, rid in cosine], [2, 3])
+        self.assertAlmostEqual(cosine[1][0], 1 / 3)
+
+    def test_only_overlapping_recipes(self):
+        index = similarity.SimilarityIndex.from_pairs([], [(1, 1), (2, 2)])
+
+        self.assertEqual(index.similar(1), [])
+        self.assertEqual(index.similar(99), [])
+
+    def test_replace(self):
+        index = similarity.SimilarityIndex.from_pairs([], [(1, 1), (2, 1)])
+
+        index.replace({2: {5}, 3: {1}}, removed=[])
+        self.assertEqual(index.similar(1), [(1.0, 3)])
+        index.replace({}, removed=[3])
+        self.assertEqual(index.similar(1), [])
+        self.assertEqual(index.bits[1], 1 << index.positions[1])
+        # The freed bit position is reused.
+        index.replace({4: {1}})
+        self.assertEqual(index.similar(1), [(1.0, 4)])
+        self.assertEqual(len(index.recipe_ids), 3)
+
+    def assertMatchesScoringEveryRecipe(self, index):
+        for metric in similarity.METRICS:
+            for recipe_id in (1, 50, 150):
+                target = set(index.features[recipe_id])
+                expected = []
+                for other, features in index.features.items():
+                    features = set(features)
+                    shared = len(target & features)
+                    if other == recipe_id or not shared:
+                        continue
+                    if metric == 'cosine':
+                        score = shared / math.sqrt(
+                            len(target) * len(features)
+                        )
+                    else:
+                        score = shared / len(target | features)
+                    expected.append((score, other))
+                expected = sorted(expected, reverse=True)[:5]
+
+                self.assertEqual(
+                    index.similar(recipe_id, 5, metric), expected
+                )
+
+    def test_matches_scoring_every_recipe(self):
+        rng = random.Random(3)
+        pairs = [
+            (recipe_id, rng.randint(1, 12))
+            for recipe_id in range(1, 200) for _ in range(5)
+        ]
+        index = similarity.SimilarityIndex.from_pairs([], pairs)
+
+        self.assertMatchesScoringEveryRecipe(index)
+
+    def test_rare_features_use_posting_lists(self):
+        rng = random.Random(5)
+        pairs = []
+        for recipe_id in range(1, 300):
+            pairs.append((recipe_id, rng.randint(1, 3)))
+            pairs.extend((recipe_id, rng.randint(10, 400)) for _ in range(4))
+        index = similarity.SimilarityIndex.from_pairs([], pairs)
+
+        self.assertEqual(set(index.bits), {1, 2, 3})
+        self.assertTrue(index.postings)
+        self.assertMatchesScoringEveryRecipe(index)
+
+    def test_posting_list_becomes_bitset_when_common(self):
+        pairs = [(recipe_id, recipe_id) for recipe_id in range(1, 100)]
+        index = similarity.SimilarityIndex.from_pairs([], pairs)
+        self.assertIn(1, index.postings)
+
+        index.replace({recipe_id: {1} for recipe_id in range(2, 6)})
+
+        self.assertNotIn(1, index.postings)
+        self.assertEqual(
+            [rid for _, rid in index.similar(1)], [5, 4, 3, 2]
+        )
+        index.replace({}, removed=[1])
+        self.assertEqual(index.similar(5), [(1.0, 4), (1.0, 3), (1.0, 2)])
+
+
+class SimilarAPITests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        similarity._indexes.clear()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_recipe(self, title, ingredients=(), tags=()):
+        res = self.client.post(reverse('recipe:recipe-list'), {
+            'title': title,
+            'time_minutes': 5,
+            'price': Decimal('1.00'),
+            'ingredients': [{'name': name} for name in ingredients],
+            'tags': [{'name': name} for name in tags],
+        }, format='json')
+        return Recipe.objects.get(id=res.data['id'])
+
+    def similar(self, recipe, **params):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get(similar_url(recipe.id), params)
+
+    def test_ranked_by_overlap(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            curry = self.create_recipe('Curry', ['Rice', 'Onion'], ['Vegan'])
+            close = self.create_recipe('Dal', ['Rice', 'Onion'])
+            far = self.create_recipe('Salad', ['Onion', 'Lettuce'])
+            self.create_recipe('Cake', ['Flour'])
+
+        res = self.similar(curry)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data], [close.id, far.id])
+        self.assertEqual(res.data[0]['score'], round(2 / 3, 4))
+        self.assertEqual(res.data[0]['ingredients'][0]['name'], 'Rice')
+
+    def test_limit_and_metric(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            curry = self.create_recipe('Curry', ['Rice'])
+            for i in range(3):
+                self.create_recipe(f'Rice {i}', ['Rice'])
+
+        res = self.similar(curry, limit=2, metric='cosine')
+
+        self.assertEqual(len(res.data), 2)
+        self.assertEqual(self.similar(curry, metric='x').status_code, 400)
+
+    def test_writes_update_the_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            curry = self.create_recipe('Curry', ['Rice'])
+            dal = self.create_recipe('Dal', ['Lentils'])
+        self.assertEqual(self.similar(curry).data, [])
+        index = similarity._indexes[self.user.id][1]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                reverse('recipe:recipe-detail', args=[dal.id]),
+                {'ingredients': [{'name': 'Rice'}]}, format='json',
+            )
+        self.assertEqual([r['id'] for r in self.similar(curry).data], [dal.id])
+        # Patched in place rather than rebuilt.
+        self.assertIs(similarity._indexes[self.user.id][1], index)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse('recipe:recipe-detail', args=[dal.id]))
+        self.assertEqual(self.similar(curry).data, [])
+
+    def test_cache_limited_by_size(self):
+        small = similarity.SimilarityIndex.from_pairs([], [(1, 1)])
+        large = similarity.SimilarityIndex.from_pairs(
+            [], [(rid, rid) for rid in range(1000)]
+        )
+        with self.settings(SIMILARITY_CACHE_BYTES=large.nbytes()):
+            with similarity._indexes_lock:
+                similarity._keep(1, 1, small)
+                similarity._keep(2, 1, small)
+                self.assertEqual(list(similarity._indexes), [1, 2])
+                similarity._keep(3, 1, large)
+
+        self.assertEqual(list(similarity._indexes), [3])
+
+    def test_rebuilt_after_another_process_wrote(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            curry = self.create_recipe('Curry', ['Rice'])
+        self.similar(curry)
+        other = Recipe.objects.create(
+            user=self.user, title='Pilaf', time_minutes=1, price=1
+        )
+        other.ingredients.add(Ingredient.objects.get(name='Rice'))
+        # What another process's write does to the shared version.
+        cache.incr(similarity._version_key(self.user.id))
+
+        res = self.similar(curry)
+
+        self.assertEqual([r['id'] for r in res.data], [other.id])
+
+    def test_tag_merge_updates_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            curry = self.create_recipe('Curry', tags=['Spicy'])
+            chili = self.create_recipe('Chili', tags=['Hot'])
+        self.assertEqual(self.similar(curry).data, [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('recipe:tag-merge'), {
+                'target_id': Tag.objects.get(name='Spicy').id,
+                'source_ids': [Tag.objects.get(name='Hot').id],
+            }, format='json')
+
+        self.assertEqual(
+            [r['id'] for r in self.similar(curry).data], [chili.id]
+        )
+
+    def test_other_users_recipe_not_found(self):
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='testpass123'
+        )
+        recipe = Recipe.objects.create(
+            user=other, title='X', time_minutes=1, price=1
+        )
+
+        res = self.similar(recipe)
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
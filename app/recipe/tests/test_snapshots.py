@@ -0,0 +1,177 @@
+"""Tests for the denormalized recipe snapshots"""
+
+import json
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def detail_url(recipe_id):
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def run_worker():
+    call_command('run_worker', once=True, concurrency=1, stdout=StringIO())
+
+
+def list_content(res):
+    return json.loads(b''.join(res.streaming_content))
+
+
+@override_settings(RECIPE_SNAPSHOTS_ENABLED=True)
+class SnapshotAPITests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_recipe(self, **extra):
+        payload = {
+            'title': 'Curry',
+            'time_minutes': 30,
+            'price': '7.50',
+            'tags': [{'name': 'Vegan'}],
+            'ingredients': [{'name': 'Rice'}],
+        }
+        payload.update(extra)
+        res = self.client.post(RECIPES_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        return Recipe.objects.get(id=res.data['id'])
+
+    def expected_list(self):
+        with self.settings(RECIPE_SNAPSHOTS_ENABLED=False):
+            return json.loads(self.client.get(RECIPES_URL).content)
+
+    def test_create_builds_snapshot(self):
+        recipe = self.create_recipe()
+
+        self.assertEqual(recipe.snapshot['title'], 'Curry')
+        self.assertEqual(recipe.snapshot['tags'][0]['name'], 'Vegan')
+
+    def test_list_and_detail_match_serializers(self):
+        recipe = self.create_recipe()
+        self.create_recipe(title='Stew', tags=[])
+        with self.settings(RECIPE_SNAPSHOTS_ENABLED=False):
+            expected_detail = self.client.get(detail_url(recipe.id)).data
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertTrue(res.streaming)
+        self.assertEqual(list_content(res), self.expected_list())
+        self.assertEqual(
+            self.client.get(detail_url(recipe.id)).data, expected_detail
+        )
+
+    def test_list_reads_no_related_tables(self):
+        for i in range(3):
+            self.create_recipe(title=f'Recipe {i}')
+
+        # The user lookup happens in force_authenticate, so: one query.
+        with self.assertNumQueries(1):
+            list_content(self.client.get(RECIPES_URL))
+
+    def test_missing_snapshots_are_built_on_read(self):
+        recipe = self.create_recipe()
+        Recipe.objects.update(snapshot=None)
+
+        self.assertEqual(
+            list_content(self.client.get(RECIPES_URL)), self.expected_list()
+        )
+        recipe.refresh_from_db()
+        self.assertIsNotNone(recipe.snapshot)
+
+    def test_update_refreshes_snapshot(self):
+        recipe = self.create_recipe()
+
+        self.client.patch(
+            detail_url(recipe.id), {'tags': [{'name': 'Spicy'}]},
+            format='json',
+        )
+
+        recipe.refresh_from_db()
+        self.assertEqual(
+            [tag['name'] for tag in recipe.snapshot['tags']], ['Spicy']
+        )
+
+    def test_tag_rename_refreshes_recipes(self):
+        recipe = self.create_recipe()
+        tag = Tag.objects.get(name='Vegan')
+
+        self.client.patch(
+            reverse('recipe:tag-detail', args=[tag.id]), {'name': 'Plant'}
+        )
+
+        # Marked stale in the request, served by the serializer meanwhile.
+        recipe.refresh_from_db()
+        self.assertIsNone(recipe.snapshot)
+        self.assertEqual(
+            self.client.get(detail_url(recipe.id)).data['tags'][0]['name'],
+            'Plant',
+        )
+        run_worker()
+
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.snapshot['tags'][0]['name'], 'Plant')
+
+    def test_tag_delete_and_merge_refresh_recipes(self):
+        recipe = self.create_recipe(tags=[{'name': 'A'}, {'name': 'B'}])
+        a = Tag.objects.get(name='A')
+        b = Tag.objects.get(name='B')
+        c = Tag.objects.create(user=self.user, name='C')
+
+        self.client.post(
+            reverse('recipe:tag-merge'),
+            {'target_id': c.id, 'source_ids': [a.id]},
+            format='json',
+        )
+        self.client.delete(reverse('recipe:tag-detail', args=[b.id]))
+        run_worker()
+
+        recipe.refresh_from_db()
+        self.assertEqual(
+            [tag['name'] for tag in recipe.snapshot['tags']], ['C']
+        )
+
+
+class SnapshotCommandTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'
+        )
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5, price='1.00'
+        )
+        self.recipe.tags.add(Tag.objects.create(user=self.user, name='Hot'))
+
+    def test_rebuild(self):
+        call_command('snapshots', 'rebuild', stdout=StringIO())
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.snapshot['tags'][0]['name'], 'Hot')
+
+    def test_check_reports_and_fixes_stale(self):
+        call_command('snapshots', 'rebuild', stdout=StringIO())
+        Recipe.objects.filter(id=self.recipe.id).update(title='Changed')
+
+        with self.assertRaises(CommandError):
+            call_command('snapshots', 'check', stdout=StringIO())
+
+        call_command('snapshots', 'check', '--fix', stdout=StringIO())
+        call_command('snapshots', 'check', stdout=StringIO())
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.snapshot['title'], 'Changed')
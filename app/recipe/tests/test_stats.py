@@ -0,0 +1,215 @@
+"""Tests for the incrementally maintained recipe stats"""
+
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, RecipeStats, Tag
+from recipe import stats
+from recipe.serializers import RecipeSerializer
+
+STATS_URL = reverse('recipe:stats')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def detail_url(recipe_id):
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+class RecipeStatsTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create(self, price, time_minutes, tags=(), ingredients=()):
+        res = self.client.post(RECIPES_URL, {
+            'title': 'Recipe', 'price': price, 'time_minutes': time_minutes,
+            'tags': [{'name': name} for name in tags],
+            'ingredients': [{'name': name} for name in ingredients],
+        }, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        return res.data['id']
+
+    def assertConsistent(self):
+        row = RecipeStats.objects.get(user=self.user)
+        for field, value in stats.compute(self.user.id).items():
+            self.assertEqual(getattr(row, field), value, field)
+
+    def test_auth_required(self):
+        res = APIClient().get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_no_recipes(self):
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['recipe_count'], 0)
+        self.assertIsNone(res.data['price']['avg'])
+        self.assertEqual(res.data['tags'], [])
+
+    def test_summary(self):
+        self.create('4.00', 10, tags=['Vegan', 'Quick'], ingredients=['Rice'])
+        self.create('2.00', 30, tags=['Vegan'], ingredients=['Rice', 'Salt'])
+
+        res = self.client.get(STATS_URL, {'top': 1})
+
+        self.assertEqual(res.data['recipe_count'], 2)
+        self.assertEqual(
+            dict(res.data['price']),
+            {'avg': '3.00', 'min': '2.00', 'max': '4.00'},
+        )
+        self.assertEqual(
+            dict(res.data['time_minutes']),
+            {'avg': Decimal('20.0'), 'min': 10, 'max': 30},
+        )
+        self.assertEqual(res.data['tag_count'], 2)
+        self.assertEqual(
+            [(t['name'], t['recipe_count']) for t in res.data['tags']],
+            [('Vegan', 2)],
+        )
+        self.assertEqual(res.data['ingredients'][0]['name'], 'Rice')
+
+    def test_read_does_not_aggregate_recipes(self):
+        for i in range(5):
+            self.create('1.00', 5, tags=[f'Tag {i}'])
+
+        # The stats row and the tag names, there are no ingredients.
+        with self.assertNumQueries(2):
+            self.client.get(STATS_URL)
+
+    def test_writes_keep_stats_consistent(self):
+        cheap = self.create('1.00', 5, tags=['Vegan'], ingredients=['Rice'])
+        dear = self.create('9.00', 60, tags=['Vegan', 'Slow'])
+        self.create('5.00', 20, ingredients=['Rice', 'Salt'])
+        self.assertConsistent()
+
+        # Takes the min and the max along.
+        self.client.patch(detail_url(cheap), {'price': '3.00'})
+        self.client.patch(
+            detail_url(dear),
+            {'time_minutes': 15, 'tags': [{'name': 'Quick'}]},
+            format='json',
+        )
+        self.assertConsistent()
+
+        self.client.delete(detail_url(dear))
+        row = RecipeStats.objects.get(user=self.user)
+        self.assertEqual(row.price_max, Decimal('5.00'))
+        self.assertConsistent()
+
+    def test_update_of_stale_instance(self):
+        """The old state is read from the locked row, not the instance
+        loaded before a concurrent write changed it"""
+        recipe_id = self.create('1.00', 5)
+        stale = Recipe.objects.get(id=recipe_id)
+        self.client.patch(detail_url(recipe_id), {'price': '7.00'})
+
+        serializer = RecipeSerializer(
+            stale, data={'price': '3.00'}, partial=True
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        self.assertEqual(
+            RecipeStats.objects.get(user=self.user).price_sum, Decimal('3.00')
+        )
+        self.assertConsistent()
+
+    def test_failed_write_leaves_stats_alone(self):
+        self.create('1.00', 5, tags=['Vegan'])
+
+        with patch(
+            'recipe.serializers.snapshots.refresh',
+            side_effect=RuntimeError('boom'),
+        ), self.assertRaises(RuntimeError):
+            self.create('2.00', 10, tags=['Vegan'])
+
+        self.assertEqual(Recipe.objects.count(), 1)
+        self.assertConsistent()
+
+    def test_tag_merge_and_delete_adjust_counts(self):
+        self.create('1.00', 5, tags=['Vegan', 'Plant based'])
+        self.create('1.00', 5, tags=['Plant based', 'Quick'])
+        vegan = Tag.objects.get(user=self.user, name='Vegan')
+        plant = Tag.objects.get(user=self.user, name='Plant based')
+        quick = Tag.objects.get(user=self.user, name='Quick')
+
+        with patch('recipe.stats.compute') as compute:
+            self.client.post(
+                reverse('recipe:tag-merge'),
+                {'target_id': vegan.id, 'source_ids': [plant.id]},
+                format='json',
+            )
+            self.assertEqual(
+                RecipeStats.objects.get(user=self.user).tag_counts,
+                {str(vegan.id): 2, str(quick.id): 1},
+            )
+
+            self.client.delete(reverse('recipe:tag-detail', args=[vegan.id]))
+            self.client.post(
+                reverse('recipe:tag-bulk-delete'), {'ids': [quick.id]},
+                format='json',
+            )
+
+        # No full aggregate, only the counts moved.
+        self.assertFalse(compute.called)
+        self.assertEqual(
+            RecipeStats.objects.get(user=self.user).tag_counts, {}
+        )
+        self.assertConsistent()
+
+    def test_last_recipe_deleted(self):
+        recipe_id = self.create('2.00', 5, tags=['Vegan'])
+
+        self.client.delete(detail_url(recipe_id))
+
+        row = RecipeStats.objects.get(user=self.user)
+        self.assertEqual(row.recipe_count, 0)
+        self.assertIsNone(row.price_min)
+        self.assertEqual(row.tag_counts, {})
+
+
+class RecipeStatsCommandTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'
+        )
+        Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5, price='2.00'
+        )
+
+    def test_rebuild(self):
+        call_command('recipe_stats', 'rebuild', stdout=StringIO())
+
+        self.assertEqual(
+            RecipeStats.objects.get(user=self.user).recipe_count, 1
+        )
+
+    def test_check_reports_and_fixes(self):
+        # Written around the API, the row doesn't know about it.
+        stats.rebuild(self.user.id)
+        Recipe.objects.create(
+            user=self.user, title='Stew', time_minutes=50, price='8.00'
+        )
+
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('recipe_stats', 'check', stdout=out)
+        self.assertIn('recipe_count', out.getvalue())
+
+        call_command('recipe_stats', 'check', '--fix', stdout=StringIO())
+        call_command('recipe_stats', 'check', stdout=StringIO())
@@ -94,6 +94,15 @@ class PrivateTagsApiTests(TestCase):
         tag.refresh_from_db()
         self.assertEqual(tag.name, payload['name'])
 
+    def test_tag_rename_to_existing_name(self):
+        """Test renaming a tag to a name the user already has fails"""
+        Tag.objects.create(user=self.user, name='Dessert')
+        tag = Tag.objects.create(user=self.user, name='after dinner')
+
+        res = self.client.patch(detail_url(tag.id), {'name': ' dessert'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_tag_deletion(self):
         tag = Tag.objects.create(user = self.user, name = 'lunch')
 
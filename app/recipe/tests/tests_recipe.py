@@ -1,8 +1,10 @@
 """Test the recipe api"""
 
 from decimal import Decimal
+from io import StringIO
 
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
 from django.urls import reverse
 
@@ -528,4 +530,40 @@ class PrivateRecipeAPITests(TestCase):
         self.assertNotIn(ingredient, recipe.ingredients.all())
         self.assertEqual(recipe.ingredients.count(),0)
 
+    def test_update_prunes_unlinked_tags(self):
+        """Tags dropped by an update are pruned once no recipe uses them"""
+        recipe = create_recipe(user=self.user)
+        shared = Tag.objects.create(user=self.user, name='Shared')
+        dropped = Tag.objects.create(user=self.user, name='Dropped')
+        recipe.tags.add(shared, dropped)
+        create_recipe(user=self.user).tags.add(shared)
 
+        payload = {'tags': [{'name': 'Lunch'}]}
+        res = self.client.patch(detail_url(recipe.id), payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        # The clean up is queued, not done in the request.
+        self.assertTrue(Tag.objects.filter(id=dropped.id).exists())
+        call_command('run_worker', once=True, concurrency=1, stdout=StringIO())
+
+        self.assertFalse(Tag.objects.filter(id=dropped.id).exists())
+        self.assertTrue(Tag.objects.filter(id=shared.id).exists())
+
+    def test_create_recipe_reuses_tag_case_insensitive(self):
+        """Tags differing only in case or spacing are the same tag"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        payload = {
+            'title': 'Salad',
+            'time_minutes': 10,
+            'price': Decimal('4.00'),
+            'tags': [{'name': ' vegan '}],
+            'ingredients': [{'name': 'Kale'}, {'name': 'kale'}],
+        }
+
+        res = self.client.post(RECIPE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(list(recipe.tags.all()), [tag])
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(recipe.ingredients.count(), 1)
@@ -6,6 +6,7 @@ from django.urls import include
 from rest_framework.routers import DefaultRouter
 
 from recipe import views
+from recipe import async_views
 
 router = DefaultRouter()
 
@@ -22,4 +23,27 @@ app_name='recipe'
 
 urlpatterns=[
     path('', include(router.urls)),
+    path(
+        'shopping-list/',
+        views.ShoppingListView.as_view(),
+        name='shopping-list',
+    ),
+    path('stats/', views.RecipeStatsView.as_view(), name='stats'),
+    # Async read only endpoints, for deployments running under ASGI.
+    path(
+        'async/recipes/',
+        async_views.recipe_list,
+        name='async-recipe-list',
+    ),
+    path(
+        'async/recipes/<int:pk>/',
+        async_views.recipe_detail,
+        name='async-recipe-detail',
+    ),
+    path('async/tags/', async_views.tag_list, name='async-tag-list'),
+    path(
+        'async/ingredients/',
+        async_views.ingredient_list,
+        name='async-ingredient-list',
+    ),
 ]
\ No newline at end of file
@@ -1,17 +1,35 @@
+from django.core import signing
+from django.db import IntegrityError, transaction
+from django.shortcuts import get_object_or_404
+
 from rest_framework.viewsets import ModelViewSet
-from rest_framework import viewsets, mixins  #?
+from rest_framework import viewsets, mixins, status  #?
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
 
+from core import events
+from core.idempotency import IdempotentCreateMixin
 from core.models import Recipe  # Why is the model here?
 from core.models import Tag
 from core.models import Ingredient
 from recipe import serializers
+from recipe import snapshots
+from recipe import stats
+from recipe import tasks
+from recipe import bulk
+from recipe import clone
+from recipe import cookable
+from recipe import shopping
+from recipe import similarity
 
 # I forgot to pull in the authentication information. When you authenticate,
 # it is going to be be done here at the view level.
 
-class RecipeViewSet(ModelViewSet):
+class RecipeViewSet(IdempotentCreateMixin, ModelViewSet):
     """Contains the View set for Recipes CRUD operations.
     It should only return recipes that the user owns"""
 
@@ -24,6 +42,7 @@ class RecipeViewSet(ModelViewSet):
     # model that will makeup its queryset.
     authentication_classes = [TokenAuthentication]  # ensures type
     permission_classes = [IsAuthenticated]  # ensures is auth.
+    throttle_scope = 'recipes'
 
 
     def get_queryset(self):
@@ -44,9 +63,30 @@ class RecipeViewSet(ModelViewSet):
         # So self.action is how you determine the "URL" in the serializer.
         if self.action == 'list':
             return serializers.RecipeSerializer
+        elif self.action == 'upload_image':
+            return serializers.RecipeImageSerializer
+        elif self.action == 'similar':
+            return serializers.SimilarRecipeSerializer
+        elif self.action == 'cookable':
+            return serializers.CookableRecipeSerializer
 
         return self.serializer_class
 
+    def list(self, request, *args, **kwargs):
+        # One column per recipe instead of the tag/ingredient joins.
+        if snapshots.enabled() and request.accepted_renderer.format == 'json':
+            return snapshots.stream_list(self.get_queryset())
+        return super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        if snapshots.enabled() and request.accepted_renderer.format == 'json':
+            data = snapshots.detail(
+                kwargs[self.lookup_field], self.get_queryset(), request
+            )
+            if data is not None:
+                return Response(data)
+        return super().retrieve(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         """Runs when a new recipe is created."""
         # When something is created through this model viewset, then we are
@@ -55,17 +95,252 @@ class RecipeViewSet(ModelViewSet):
         # authenticated to the serializer before pulling it into the model.
         serializer.save(user = self.request.user)
 
+    def perform_destroy(self, instance):
+        recipe_id = instance.id
+        with transaction.atomic():
+            stats.lock(instance)
+            old_state = stats.state(instance)
+            super().perform_destroy(instance)
+            stats.apply(instance.user_id, removed=[old_state])
+            events.publish(instance.user_id, 'recipe', 'deleted', [recipe_id])
+            similarity.recipes_changed(instance.user_id, [recipe_id])
+
+    @action(methods=['POST'], detail=True, url_path='upload-image')
+    def upload_image(self, request, pk=None):
+        """Upload an image to a recipe.
+
+        The upload is streamed to a temporary file by the upload handler and
+        moved into place, the resized variants are made by the task worker
+        and show up in image_variants once they are ready.
+        """
+        recipe = self.get_object()
+        # The old variants are deleted once the new ones exist.
+        stale = list(recipe.image_variants.values())
+        serializer = self.get_serializer(recipe, data=request.data)
+
+        if serializer.is_valid():
+            serializer.save(image_variants={})
+            snapshots.refresh([recipe.id])
+            events.publish(recipe.user_id, 'recipe', 'updated', [recipe.id])
+            tasks.generate_image_variants.delay(
+                recipe_id=recipe.id,
+                image_name=recipe.image.name,
+                stale=stale,
+            )
+            return Response(serializer.data, status=status.HTTP_200_OK)
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(methods=['GET'], detail=True)
+    def similar(self, request, pk=None):
+        """The user's recipes sharing the most tags and ingredients with
+        this one. ?metric=jaccard (default) or cosine, ?limit=10"""
+        recipe = self.get_object()
+        query = serializers.SimilarQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        matches = similarity.similar_recipes(recipe, **query.validated_data)
+        return Response(self.get_serializer(matches, many=True).data)
+
+    @action(methods=['GET'], detail=False)
+    def cookable(self, request):
+        """Recipes the pantry ?ingredients=1,2,3 covers, fewest missing
+        ingredients first. ?max_missing=0 (default) only lists recipes
+        that can be cooked right away."""
+        query = serializers.CookableQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        ingredients = query.validated_data['ingredients']
+
+        recipes = cookable.cookable_recipes(
+            request.user, ingredients, query.validated_data['max_missing'],
+        ).prefetch_related('tags', 'ingredients')
+        serializer = self.get_serializer(
+            recipes[:query.validated_data['limit']],
+            many=True,
+            context={'request': request, 'pantry': set(ingredients)},
+        )
+        return Response(serializer.data)
+
+    def _selected(self, data):
+        """The caller's recipes picked by a BulkCloneSerializer"""
+        recipes = self.get_queryset()
+        if data.get('ids'):
+            recipes = recipes.filter(id__in=data['ids'])
+        if data.get('tags'):
+            recipes = recipes.filter(tags__in=data['tags']).distinct()
+        if recipes.count() > serializers.CLONE_MAX_RECIPES:
+            raise ValidationError({'non_field_errors': [
+                f'At most {serializers.CLONE_MAX_RECIPES} recipes per request.'
+            ]})
+        return recipes
+
+    @action(methods=['POST'], detail=True)
+    def clone(self, request, pk=None):
+        """Copy this recipe, with its tags and ingredients"""
+        recipe = self.get_object()
+
+        copy, = clone.clone_recipes(
+            self.get_queryset().filter(pk=recipe.pk), request.user
+        )
+        return Response(
+            serializers.RecipeDetailSerializer(
+                copy, context=self.get_serializer_context()
+            ).data,
+            status=status.HTTP_201_CREATED,
+        )
+
+    @action(
+        methods=['POST'], detail=False, url_path='bulk-clone',
+        serializer_class=serializers.BulkCloneSerializer,
+    )
+    def bulk_clone(self, request):
+        """Copy a set of recipes in one transaction"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        copies = clone.clone_recipes(
+            self._selected(serializer.validated_data), request.user
+        )
+        return Response(
+            {'cloned': len(copies), 'ids': [copy.id for copy in copies]},
+            status=status.HTTP_201_CREATED,
+        )
+
+    @action(
+        methods=['POST'], detail=False,
+        serializer_class=serializers.BulkCloneSerializer,
+    )
+    def share(self, request):
+        """A token another user can copy a set of your recipes with"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        token, count = clone.share_token(
+            request.user, self._selected(serializer.validated_data)
+        )
+        return Response(serializers.ShareSerializer({
+            'token': token,
+            'count': count,
+            'expires_in': clone.share_max_age(),
+        }).data, status=status.HTTP_201_CREATED)
+
+    @action(
+        methods=['POST'], detail=False, url_path='clone-shared',
+        serializer_class=serializers.CloneSharedSerializer,
+    )
+    def clone_shared(self, request):
+        """Copy the recipes shared with a token into your own account"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            recipes = clone.shared_recipes(serializer.validated_data['token'])
+        except signing.BadSignature:
+            raise ValidationError({'token': ['Invalid or expired token.']})
+        copies = clone.clone_recipes(recipes, request.user)
+        return Response(
+            {'cloned': len(copies), 'ids': [copy.id for copy in copies]},
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class BulkOperationsMixin:
+    """Bulk merge, rename and delete actions for the tag and ingredient
+    viewsets. Each one is a single set based transaction."""
+
+    @action(
+        methods=['POST'], detail=False,
+        serializer_class=serializers.MergeSerializer,
+    )
+    def merge(self, request):
+        """Merge the source_ids rows into target_id, moving their recipes"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        model = self.queryset.model
+        target = get_object_or_404(
+            self.get_queryset(), pk=serializer.validated_data['target_id']
+        )
+        merged = bulk.merge(
+            model, request.user,
+            serializer.validated_data['source_ids'], target,
+        )
+        return Response({
+            'merged': merged,
+            'target': self.item_serializer_class(target).data,
+        })
+
+    @action(
+        methods=['POST'], detail=False, url_path='bulk-rename',
+        serializer_class=serializers.BulkRenameSerializer,
+    )
+    def bulk_rename(self, request):
+        """Rename many rows in one request"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        names = {
+            item['id']: item['name']
+            for item in serializer.validated_data['items']
+        }
+        try:
+            renamed = bulk.rename(self.queryset.model, request.user, names)
+        except IntegrityError:
+            raise ValidationError(
+                {'items': ['Two items would end up with the same name.']}
+            )
+        except bulk.NamePassedOn as exc:
+            raise ValidationError({'items': [
+                f'"{exc}" is the current name of another renamed item, '
+                'rename them in separate requests.'
+            ]})
+        return Response(
+            self.item_serializer_class(renamed, many=True).data
+        )
+
+    @action(
+        methods=['POST'], detail=False, url_path='bulk-delete',
+        serializer_class=serializers.BulkIdsSerializer,
+    )
+    def bulk_delete(self, request):
+        """Delete many rows in one request"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        deleted = bulk.delete(
+            self.queryset.model, request.user,
+            serializer.validated_data['ids'],
+        )
+        return Response({'deleted': deleted})
+
+    def perform_destroy(self, instance):
+        item_id = instance.id
+        with transaction.atomic():
+            recipe_ids = bulk.linked_recipe_ids(type(instance), [item_id])
+            super().perform_destroy(instance)
+            if recipe_ids:
+                stats.remove_items(instance.user_id, type(instance), [item_id])
+        snapshots.refresh_later(recipe_ids)
+        events.publish(
+            instance.user_id, instance._meta.model_name, 'deleted', [item_id]
+        )
+        events.publish(instance.user_id, 'recipe', 'updated', recipe_ids)
+        similarity.recipes_changed(instance.user_id, recipe_ids)
+
 
 # Why are we using the mixins here and not model viewset? the rest of the code is the same.
 # woah the model mixins allow for you to control what can be updated and created. This is just a
 # permisison mixin. I assume the model mixin gives it all to you.
-class TagViewSet(mixins.DestroyModelMixin,
+class TagViewSet(BulkOperationsMixin,
+                 mixins.DestroyModelMixin,
                  mixins.UpdateModelMixin,
                  mixins.ListModelMixin,
                  viewsets.GenericViewSet):
     """This is the viewset for the tag serializer"""
 
     serializer_class = serializers.TagSerializer
+    item_serializer_class = serializers.TagSerializer
+    throttle_scope = 'tags'
     queryset = Tag.objects.all()
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
@@ -77,12 +352,15 @@ class TagViewSet(mixins.DestroyModelMixin,
         # model manager. Also look at the queryset level. This is already at the obj lev.
         return self.queryset.filter(user=self.request.user).order_by('-name')
 
-class IngredientViewset(mixins.DestroyModelMixin,
+class IngredientViewset(BulkOperationsMixin,
+                        mixins.DestroyModelMixin,
                         mixins.UpdateModelMixin,
                         mixins.ListModelMixin,
                         viewsets.GenericViewSet):
     """Manage ingredients in the database"""
     serializer_class = serializers.IngredientSerializer
+    item_serializer_class = serializers.IngredientSerializer
+    throttle_scope = 'ingredients'
     # Tells django which models we would like to be changed via this view.
     queryset = Ingredient.objects.all()
     authentication_classes = [TokenAuthentication]
@@ -91,3 +369,36 @@ class IngredientViewset(mixins.DestroyModelMixin,
     def get_queryset(self):
         """Filter queryset to only the authenticated user"""
         return self.queryset.filter(user = self.request.user).order_by('-name')
+
+
+class ShoppingListView(APIView):
+    """Combined ingredients of several recipes, GET ?recipes=1,2,3"""
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'recipes'
+
+    def get(self, request):
+        query = serializers.ShoppingListQuerySerializer(
+            data=request.query_params
+        )
+        query.is_valid(raise_exception=True)
+
+        data = shopping.shopping_list(
+            request.user, query.validated_data['recipes']
+        )
+        return Response(serializers.ShoppingListSerializer(data).data)
+
+
+class RecipeStatsView(APIView):
+    """Counts, price and time ranges and the most used tags and
+    ingredients over all of the user's recipes, GET ?top=10"""
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'recipes'
+
+    def get(self, request):
+        query = serializers.StatsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        data = stats.summary(request.user.id, query.validated_data['top'])
+        return Response(serializers.RecipeStatsSerializer(data).data)
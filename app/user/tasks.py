@@ -0,0 +1,15 @@
+"""Background tasks for the user app, run by manage.py run_worker"""
+
+from django.conf import settings
+
+from core.deletion import delete_user_in_batches
+from core.tasks import task
+
+
+@task
+def delete_account(user_id):
+    """Delete a deactivated account and all its data"""
+    delete_user_in_batches(
+        user_id,
+        batch_size=getattr(settings, 'ACCOUNT_DELETION_BATCH_SIZE', 1000),
+    )
@@ -7,6 +7,9 @@ from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
 
+from core.models import Task
+from user.tasks import delete_account
+
 # This is the name of the url that we are going to test.
 CREATE_USER_URL = reverse('user:create')
 TOKEN_URL = reverse('user:token')
@@ -209,3 +212,20 @@ class PrivateUserApiTests(TestCase):
 
         self.assertEqual(self.user.name, payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
+
+    def test_delete_account(self):
+        """Deleting the account locks it and queues the data deletion"""
+        res = self.client.delete(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+
+        queued = Task.objects.get(name=delete_account.task_name)
+        self.assertEqual(queued.kwargs, {'user_id': self.user.id})
+
+        # The worker does the actual deletion.
+        delete_account(**queued.kwargs)
+        self.assertFalse(
+            get_user_model().objects.filter(id=self.user.id).exists()
+        )
@@ -1,10 +1,18 @@
 """views for the user api"""
 
 # generics contains many of the base classes to speed up development.
-from rest_framework import generics, authentication, permissions
+from django.db import transaction
+
+from rest_framework import generics, authentication, permissions, status
+from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
 
+from core.idempotency import IdempotentCreateMixin
+
+from user import tasks
+
 from user.serializers import (
     UserSerializer,
     AuthTokenSerializer
@@ -14,24 +22,44 @@ from user.serializers import (
 # CreateAPIView takes a POST request.
 # by looking at the serializer, it can then tie it to a model.
 # Used to create!
-class CreateUserView(generics.CreateAPIView):
+class CreateUserView(IdempotentCreateMixin, generics.CreateAPIView):
     """Create a new user in the system"""
     serializer_class=UserSerializer
+    throttle_scope = 'user'
 
-# RetrieveUpdateAPI view is used to r/u items in the database.
-# It takes get and patch methods.
-class ManageUserView(generics.RetrieveUpdateAPIView):
+# RetrieveUpdateDestroyAPI view is used to r/u/d items in the database.
+# It takes get, patch and delete methods.
+class ManageUserView(generics.RetrieveUpdateDestroyAPIView):
     """Update a user the extra content here enables securty and auth"""
     serializer_class=UserSerializer
     authentication_classes = [authentication.TokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = 'user'
 
     def get_object(self):
         """return the requested user"""
         # This gets run through the serializer before being returned.
         return self.request.user
 
+    def destroy(self, request, *args, **kwargs):
+        """Delete the account.
+
+        Large accounts take a while to delete, so the account is locked
+        out right away and the data is deleted in batches by the worker.
+        """
+        user = self.get_object()
+        with transaction.atomic():
+            user.is_active = False
+            user.save(update_fields=['is_active'])
+            Token.objects.filter(user=user).delete()
+            tasks.delete_account.delay(user_id=user.id)
+
+        return Response(status=status.HTTP_202_ACCEPTED)
+
 class CreateTokenView(ObtainAuthToken):
     """Request a token for the user when they log in"""
     serializer_class=AuthTokenSerializer
-    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
\ No newline at end of file
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    # ObtainAuthToken turns throttling off, this endpoint needs it most.
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+    throttle_scope = 'token'
\ No newline at end of file